@@ -16,20 +16,10 @@ if [ ! -d "$INDIR" ]; then
     exit 0
 fi
 
-for f in $(find "$INDIR" -name '*.xml.gz' | sort); do
-    c="$f.md5"
-    if [ ! -e "$c" ]; then
-	echo "$SCRIPT:missing checksum $c, removing $f" >&2
-	rm -f "$f"
-    else
-	md5=$(md5sum < $f | awk '{ print $1 }')
-	ref=$(cat "$c" | perl -pe 's/.*=\s*(\S+).*/$1/')
-	if [ "$md5" != "$ref" ]; then
-	    echo "$SCRIPT:WARNING:checksums differ ($md5<>$ref), removing $f and $c" >&2
-	    rm -f "$f"
-	    rm -f "$c"
-	else
-	    echo "$SCRIPT:checksum OK for $f" >&2
-	fi
-    fi
-done
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+command="$TOOLDIR/checkmd5.py"
+
+echo "$SCRIPT:running \"$command\" on $INDIR" >&2
+
+python3 "$command" --remove "$INDIR"
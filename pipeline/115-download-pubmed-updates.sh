@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# Download PubMed update data.
+
+set -euo pipefail
+
+BASEURL="ftp://ftp.ncbi.nlm.nih.gov/pubmed/updatefiles"
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+OUTDIR="$SCRIPTDIR/../data/pubmed/update_data"
+
+mkdir -p "$OUTDIR"
+
+echo "$SCRIPT:downloading new update packages from $BASEURL to $OUTDIR ..." >&2
+
+# -nc skips packages and checksums that have already been downloaded
+wget -nc -P "$OUTDIR" "$BASEURL/pubmed20n*.xml.gz"
+wget -nc -P "$OUTDIR" "$BASEURL/pubmed20n*.xml.gz.md5"
+
+echo "$SCRIPT:done." >&2
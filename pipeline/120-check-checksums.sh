@@ -11,12 +11,14 @@ SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
 
 INDIR="$SCRIPTDIR/../data/pubmed/original_data"
 
-cd $INDIR
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+command="$TOOLDIR/checkmd5.py"
 
 echo "$SCRIPT:checking checksums in $INDIR ..." >&2
 
 set +e    # to allow for print output
-if md5sum --check *.md5; then
+if python3 "$command" "$INDIR"; then
     echo "$SCRIPT:all checksums OK in $INDIR" >&2
 else
     echo "$SCRIPT:ABORT:checksum error(s) in $INDIR" >&2
@@ -1,37 +1,49 @@
 #!/bin/bash
 
-# Insert PubMed titles and abstracts into DB.
+# Insert PubMed titles and abstracts into DB directly from PubMed XML.
 
 set -euo pipefail
 
+PARALLEL_JOBS=5
+
 SCRIPT="$(basename "$0")"
 
 # https://stackoverflow.com/a/246128
 SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
 
-MODULEDIR="$SCRIPTDIR/../modules/pubmed"
-
-INDIR="$SCRIPTDIR/../data/pubmed/texts"
+INDIR="$SCRIPTDIR/../data/pubmed/original_data"
 
 OUTDIR="$SCRIPTDIR/../data/pubmed/db"
 
-if [[ -z $(find "$INDIR" -name '*.tar.gz') ]]; then
-    echo "$SCRIPT:ABORT: no .tar.gz files found in $INDIR"
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+if [[ -z $(find "$INDIR" -name '*.xml.gz') ]]; then
+    echo "$SCRIPT:ABORT: no .xml.gz files found in $INDIR"
     exit 1
 fi
 
 dbpath="$OUTDIR/pubmed.sqlite"
 
-if [ -s "$dbpath" ]; then
+# Marks an unfinished DB build; the build resumes from completed packages
+incomplete="$dbpath.incomplete"
+
+if [ -s "$dbpath" ] && [ ! -e "$incomplete" ]; then
     echo "$SCRIPT:$dbpath exists, assuming complete and exiting."
     exit 0
 fi
 
-command="$MODULEDIR/scripts/makedb.py"
+command="$TOOLDIR/makepubmeddb.py"
 
-echo "$SCRIPT:running \"$command\" on data in $INDIR" >&2
+echo "$SCRIPT:running \"$command\" with $PARALLEL_JOBS jobs on data in $INDIR" >&2
 
 mkdir -p "$OUTDIR"
 
-find "$INDIR" -name '*.tar.gz' | sort \
-    | xargs python3 "$command" "$dbpath"
+touch "$incomplete"
+
+mapfile -t packages < <(find "$INDIR" -name '*.xml.gz' | sort)
+
+python3 "$command" --jobs "$PARALLEL_JOBS" "$dbpath" "${packages[@]}"
+
+rm -f "$incomplete"
+
+echo "$SCRIPT:done." >&2
@@ -0,0 +1,62 @@
+#!/bin/bash
+
+# Apply PubMed update packages to PubMed DB.
+
+set -euo pipefail
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+INDIR="$SCRIPTDIR/../data/pubmed/update_data"
+
+DBDIR="$SCRIPTDIR/../data/pubmed/db"
+
+CONTENTDIR="$SCRIPTDIR/../data/pubmed/contents"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+if [[ ! -d "$INDIR" || -z $(find "$INDIR" -name '*.xml.gz') ]]; then
+    echo "$SCRIPT:no update packages in $INDIR, exiting."
+    exit 0
+fi
+
+dbpath="$DBDIR/pubmed.sqlite"
+
+if [ ! -s "$dbpath" ]; then
+    echo "$SCRIPT:ABORT: $dbpath not found"
+    exit 1
+fi
+
+mkdir -p "$CONTENTDIR"
+
+changedpath="$CONTENTDIR/pubmed.changed.ids"
+
+# Packages must be applied in order, so abort rather than skip on errors
+if ! python3 "$TOOLDIR/checkmd5.py" "$INDIR"; then
+    echo "$SCRIPT:ABORT:checksum error(s) in $INDIR" >&2
+    exit 1
+fi
+
+command="$TOOLDIR/updatepubmeddb.py"
+
+echo "$SCRIPT:running \"$command\" on $dbpath with packages in $INDIR" >&2
+
+# single invocation (no xargs) so that changed IDs cover all packages
+mapfile -t packages < <(find "$INDIR" -name '*.xml.gz' | sort)
+
+python3 "$command" --changed "$changedpath" "$dbpath" "${packages[@]}"
+
+if [ -s "$changedpath" ]; then
+    # DB contents changed, listings need to be regenerated
+    for f in "$CONTENTDIR/pubmed.sqlite.listing.ids" \
+	     "$SCRIPTDIR/../data/pubtator/contents/pubtator.missing.ids"; do
+	if [ -e "$f" ]; then
+	    echo "$SCRIPT:removing outdated $f" >&2
+	    rm -f "$f"
+	fi
+    done
+fi
+
+echo "$SCRIPT:done." >&2
@@ -22,24 +22,16 @@ fi
 
 mkdir -p "$OUTDIR"
 
-outpath="$OUTDIR/pubmed.sqlite.listing"
+outpath="$OUTDIR/pubmed.sqlite.listing.ids"
 
 if [ -s "$outpath" ]; then
     echo "$SCRIPT:$outpath exists, skipping ..."
 else
+    # List IDs of documents with texts directly from DB keys
     command="$SCRIPTDIR/../scripts/lssqlite.py"
     echo "$SCRIPT:running \"$command\" on $inpath with output to $outpath" >&2
-    python3 "$command" "$inpath" > "$outpath"
-fi
-
-inpath="$outpath"
-outpath="$OUTDIR/pubmed.sqlite.listing.ids"
-
-if [ -s "$outpath" ]; then
-    echo "$SCRIPT:$outpath exists, skipping ..."
-else
-    echo "$SCRIPT:processing $inpath with output to $outpath" >&2
-    egrep '\.txt' < "$inpath" | perl -pe 's/\.txt//' > "$outpath"
+    python3 "$command" -s .txt -S -o "$outpath.tmp" "$inpath"
+    mv "$outpath.tmp" "$outpath"
 fi
 
 echo "SCRIPT:done." >&2
@@ -15,6 +15,8 @@ INDIR="$SCRIPTDIR/../data/pubtator/original_data"
 
 OUTDIR="$SCRIPTDIR/../data/pubtator/contents"
 
+PUBMEDDB="$SCRIPTDIR/../data/pubmed/db/pubmed.sqlite"
+
 inpath="$INDIR/bioconcepts2pubtator_offsets.gz"
 
 if [ ! -s "$inpath" ]; then
@@ -28,11 +30,28 @@ outpath="$OUTDIR/pubtator.source.listing"
 
 if [ -s "$outpath" ]; then
     echo "$SCRIPT:$outpath exists, skipping ..."
+else
+    command="$MODULEDIR/listpubtatorids.py"
+    echo "$SCRIPT:running \"$command\" on $inpath with output to $outpath" >&2
+    python3 "$command" "$inpath" > "$outpath"
+fi
+
+if [ ! -s "$PUBMEDDB" ]; then
+    echo "$SCRIPT:$PUBMEDDB not found, not listing missing IDs" >&2
     exit 0
 fi
 
-command="$MODULEDIR/listpubtatorids.py"
+inpath="$outpath"
+outpath="$OUTDIR/pubtator.missing.ids"
 
-echo "$SCRIPT:running \"$command\" on $inpath with output to $outpath" >&2
+if [ -s "$outpath" ]; then
+    echo "$SCRIPT:$outpath exists, skipping ..."
+else
+    # PubMed documents with texts that are not in PubTator
+    command="$SCRIPTDIR/../scripts/lssqlite.py"
+    echo "$SCRIPT:running \"$command\" on $PUBMEDDB with output to $outpath" >&2
+    python3 "$command" -s .txt -d "$inpath" -o "$outpath.tmp" "$PUBMEDDB"
+    mv "$outpath.tmp" "$outpath"
+fi
 
-python3 "$command" "$inpath" > "$outpath"
+echo "$SCRIPT:done." >&2
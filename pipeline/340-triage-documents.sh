@@ -0,0 +1,57 @@
+#!/bin/bash
+
+# Score PubMed texts with transformers triage model, if one is provided,
+# and select documents for tagging and alignment.
+
+set -euo pipefail
+
+PARALLEL_JOBS=5
+
+# Minimum score for selecting document
+THRESHOLD=0.5
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+# Fine-tuned sequence classification model, e.g. from ptm_triage_experiment
+MODELDIR="$SCRIPTDIR/../models/triage"
+
+# Tokenizations shared between model runs, reused for unchanged texts
+CACHEDIR="$SCRIPTDIR/../data/tokencache"
+
+if [ ! -d "$MODELDIR" ]; then
+    echo "$SCRIPT:no model in $MODELDIR, skipping."
+    exit 0
+fi
+
+inpath="$SCRIPTDIR/../data/pubmed/db/pubmed.sqlite"
+
+if [ ! -s "$inpath" ]; then
+    echo "$SCRIPT:ABORT: $inpath not found"
+    exit 1
+fi
+
+OUTDIR="$SCRIPTDIR/../data/pubmed/contents"
+
+mkdir -p "$OUTDIR"
+
+scorepath="$OUTDIR/pubmed.triage.tsv"
+selectedpath="$OUTDIR/pubmed.selected.ids"
+
+# Empty if no documents were selected, so check existence only
+if [ -e "$selectedpath" ]; then
+    echo "$SCRIPT:$selectedpath exists, assuming complete and exiting."
+    exit 0
+fi
+
+command="$TOOLDIR/triagedocs.py"
+
+echo "$SCRIPT:running \"$command\" with $PARALLEL_JOBS jobs on $inpath"
+
+python3 "$command" --jobs "$PARALLEL_JOBS" --threshold "$THRESHOLD" \
+	--cache "$CACHEDIR" "$MODELDIR" "$inpath" "$scorepath" "$selectedpath.tmp"
+mv "$selectedpath.tmp" "$selectedpath"
@@ -35,6 +35,16 @@ fi
 
 command="$TOOLDIR/formatfortagger.py"
 
-python3 "$command" "$inpath" > "$outpath"
+# Restrict to documents selected by triage, if triage was run (the
+# selection is empty if no documents were selected)
+SELECTED="$SCRIPTDIR/../data/pubmed/contents/pubmed.selected.ids"
+
+declare -a ARGS=()
+if [ -e "$SELECTED" ]; then
+    echo "$SCRIPT:only formatting documents in $SELECTED" >&2
+    ARGS+=(--ids "$SELECTED")
+fi
+
+python3 "$command" "${ARGS[@]}" "$inpath" > "$outpath"
 
 echo "SCRIPT:done." >&2
@@ -0,0 +1,61 @@
+#!/bin/bash
+
+# Tag PubMed texts with transformers NER model, if one is provided.
+
+set -euo pipefail
+
+PARALLEL_JOBS=5
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+# Fine-tuned token classification model, e.g. from ptm_ner_experiment
+MODELDIR="$SCRIPTDIR/../models/ner"
+
+# Tokenizations shared between model runs, reused for unchanged texts
+CACHEDIR="$SCRIPTDIR/../data/tokencache"
+
+if [ ! -d "$MODELDIR" ]; then
+    echo "$SCRIPT:no model in $MODELDIR, skipping."
+    exit 0
+fi
+
+inpath="$SCRIPTDIR/../data/pubmed/db/pubmed.sqlite"
+
+if [ ! -s "$inpath" ]; then
+    echo "$SCRIPT:ABORT: $inpath not found"
+    exit 1
+fi
+
+OUTDIR="$SCRIPTDIR/../data/ner/db"
+
+mkdir -p "$OUTDIR"
+
+outpath="$OUTDIR/ner.sqlite"
+
+if [ -s "$outpath" ]; then
+    echo "$SCRIPT:$outpath exists, assuming complete and exiting."
+    exit 0
+fi
+
+command="$TOOLDIR/tagwithmodel.py"
+
+# Restrict to documents selected by triage, if triage was run (the
+# selection is empty if no documents were selected)
+SELECTED="$SCRIPTDIR/../data/pubmed/contents/pubmed.selected.ids"
+
+declare -a ARGS=()
+if [ -e "$SELECTED" ]; then
+    echo "$SCRIPT:only tagging documents in $SELECTED" >&2
+    ARGS+=(--ids "$SELECTED")
+fi
+
+echo "$SCRIPT:running \"$command\" with $PARALLEL_JOBS jobs on $inpath"
+
+python3 "$command" --jobs "$PARALLEL_JOBS" --cache "$CACHEDIR" "${ARGS[@]}" \
+	"$MODELDIR" "$inpath" "$outpath.tmp"
+mv "$outpath.tmp" "$outpath"
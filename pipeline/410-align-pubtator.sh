@@ -4,6 +4,10 @@
 
 set -euo pipefail
 
+PARALLEL_JOBS=5
+
+SHARDS=100
+
 SCRIPT="$(basename "$0")"
 
 # https://stackoverflow.com/a/246128
@@ -11,6 +15,8 @@ SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
 
 MODULEDIR="$SCRIPTDIR/../modules/annalign"
 
+TOOLDIR="$SCRIPTDIR/../scripts"
+
 PUBMEDDIR="$SCRIPTDIR/../data/pubmed/db"
 
 PUBTATORDIR="$SCRIPTDIR/../data/pubtator/db"
@@ -38,6 +44,18 @@ fi
 
 command="$MODULEDIR/annalign.py"
 
-echo "$SCRIPT:running \"$command\" on $sourcedb and $aligndb"
+# Restrict to documents selected by triage, if triage was run (the
+# selection is empty if no documents were selected)
+SELECTED="$SCRIPTDIR/../data/pubmed/contents/pubmed.selected.ids"
+
+declare -a ARGS=()
+if [ -e "$SELECTED" ]; then
+    echo "$SCRIPT:only aligning documents in $SELECTED" >&2
+    ARGS+=(--ids "$SELECTED")
+fi
+
+echo "$SCRIPT:running \"$command\" with $PARALLEL_JOBS jobs on $sourcedb and $aligndb"
 
-python3 "$command" -d 0.5 -t -D "$sourcedb" "$sourcedb" "$aligndb" -o "$outdb"
+# Aligns key-range shards in parallel, resuming from completed shards
+python3 "$TOOLDIR/shardalign.py" --jobs "$PARALLEL_JOBS" --shards "$SHARDS" \
+	"${ARGS[@]}" "$command" "$sourcedb" "$aligndb" "$outdb" -- -d 0.5 -t
@@ -0,0 +1,115 @@
+#!/bin/bash
+
+# Reprocess changed PubMed documents and update tagger and PubTator DBs.
+
+set -euo pipefail
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+CONFIGDIR="$SCRIPTDIR/../config"
+
+# imports `dictionary` variable
+source "$CONFIGDIR/tagger_config.sh"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+MODULEDIR="$SCRIPTDIR/../modules"
+
+CHANGED="$SCRIPTDIR/../data/pubmed/contents/pubmed.changed.ids"
+
+SELECTED="$SCRIPTDIR/../data/pubmed/contents/pubmed.selected.ids"
+
+pubmeddb="$SCRIPTDIR/../data/pubmed/db/pubmed.sqlite"
+taggerdb="$SCRIPTDIR/../data/tagger/db/tagger.sqlite"
+sourcedb="$SCRIPTDIR/../data/pubtator/db/pubtator-original.sqlite"
+aligneddb="$SCRIPTDIR/../data/pubtator/db/pubtator-aligned.sqlite"
+
+if [ ! -s "$CHANGED" ]; then
+    echo "$SCRIPT:no changed documents, exiting."
+    exit 0
+fi
+
+echo "$SCRIPT:creating temporary work directory ..." >&2
+TMPDIR=`mktemp -d`
+
+function rmtmp {
+    rm -rf "$TMPDIR"
+}
+
+trap rmtmp EXIT
+
+merge="$TOOLDIR/mergesqlite.py"
+
+# Reprocess changed documents that are in the PubMed DB and, if triage
+# was run, selected by it (the selection is not redone for changed
+# documents). DBs are updated for all changed documents so that those
+# deleted or not selected are removed.
+todo="$TMPDIR/reprocess.ids"
+declare -a ARGS=()
+if [ -e "$SELECTED" ]; then
+    echo "$SCRIPT:only reprocessing documents in $SELECTED" >&2
+    ARGS+=(-i "$SELECTED")
+fi
+python3 "$TOOLDIR/lssqlite.py" -s .txt -S -i "$CHANGED" "${ARGS[@]}" \
+	-o "$todo" "$pubmeddb"
+
+if [ ! -s "$todo" ]; then
+    echo "$SCRIPT:no changed documents to reprocess, removing ..." >&2
+    # Merging no documents creates an empty DB
+    python3 "$merge" --ids "$todo" "$TMPDIR/empty.sqlite" "$pubmeddb"
+    for db in "$taggerdb" "$aligneddb"; do
+	if [ -s "$db" ]; then
+	    python3 "$merge" --ids "$CHANGED" --delete-missing \
+		"$db" "$TMPDIR/empty.sqlite"
+	fi
+    done
+    echo "$SCRIPT:done." >&2
+    exit 0
+fi
+
+if [ -s "$taggerdb" ]; then
+    echo "$SCRIPT:tagging changed documents ..." >&2
+    DICTDIR="$SCRIPTDIR/../data/tagger/${dictionary}_dict"
+    python3 "$TOOLDIR/formatfortagger.py" --ids "$todo" "$pubmeddb" \
+	> "$TMPDIR/changed.fortagger.tsv"
+    "$MODULEDIR/jensenlab-tagger/tagcorpus" \
+	--types="$CONFIGDIR/consensus_types.tsv" \
+	--entities="$DICTDIR/${dictionary}_entities.tsv" \
+	--names="$DICTDIR/${dictionary}_names.tsv" \
+	--stopwords="$DICTDIR/${dictionary}_global.tsv" \
+	--autodetect \
+	< "$TMPDIR/changed.fortagger.tsv" \
+	> "$TMPDIR/changed.tagged.tsv"
+    python3 "$MODULEDIR/jensenlab-tools/scripts/maptaggedids.py" \
+	"$DICTDIR/${dictionary}_combined.tsv" "$TMPDIR/changed.tagged.tsv" \
+	> "$TMPDIR/changed.mapped.tsv"
+    python3 "$MODULEDIR/jensenlab-tools/scripts/tagged2standoff.py" \
+	-D "$TMPDIR/tagger.sqlite" \
+	"$TMPDIR/changed.fortagger.tsv" "$TMPDIR/changed.mapped.tsv"
+    echo "$SCRIPT:updating $taggerdb ..." >&2
+    python3 "$merge" --ids "$CHANGED" --delete-missing \
+	"$taggerdb" "$TMPDIR/tagger.sqlite"
+else
+    echo "$SCRIPT:$taggerdb not found, skipping tagger update" >&2
+fi
+
+if [ -s "$aligneddb" ]; then
+    echo "$SCRIPT:aligning PubTator annotations for changed documents ..." >&2
+    python3 "$merge" --ids "$todo" "$TMPDIR/pubtator-original.sqlite" \
+	"$sourcedb"
+    python3 "$merge" --ids "$todo" "$TMPDIR/pubmed.sqlite" "$pubmeddb"
+    python3 "$MODULEDIR/annalign/annalign.py" -d 0.5 -t \
+	-D "$TMPDIR/pubtator-original.sqlite" \
+	"$TMPDIR/pubtator-original.sqlite" "$TMPDIR/pubmed.sqlite" \
+	-o "$TMPDIR/pubtator-aligned.sqlite"
+    echo "$SCRIPT:updating $aligneddb ..." >&2
+    python3 "$merge" --ids "$CHANGED" --delete-missing \
+	"$aligneddb" "$TMPDIR/pubtator-aligned.sqlite"
+else
+    echo "$SCRIPT:$aligneddb not found, skipping alignment update" >&2
+fi
+
+echo "$SCRIPT:done." >&2
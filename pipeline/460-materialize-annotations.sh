@@ -0,0 +1,53 @@
+#!/bin/bash
+
+# Write copies of annotation DBs with only target type annotations for
+# comparison and consensus.
+
+set -euo pipefail
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+CONFIGDIR="$SCRIPTDIR/../config"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+CHANGED="$SCRIPTDIR/../data/pubmed/contents/pubmed.changed.ids"
+
+declare -a DATASETS=(
+    "pubtator:$SCRIPTDIR/../data/pubtator/db/pubtator-aligned.sqlite"
+    "tagger:$SCRIPTDIR/../data/tagger/db/tagger.sqlite"
+    "ner:$SCRIPTDIR/../data/ner/db/ner.sqlite"
+)
+
+OUTDIR="$SCRIPTDIR/../data/filtered/db"
+
+mkdir -p "$OUTDIR"
+
+command="$TOOLDIR/materializeannotations.py"
+
+for d in "${DATASETS[@]}"; do
+    name="${d%%:*}"
+    inpath="${d#*:}"
+    outpath="$OUTDIR/$name.sqlite"
+    if [ ! -s "$inpath" ]; then
+	echo "$SCRIPT:$inpath not found, skipping" >&2
+	continue
+    fi
+    if [ ! -s "$outpath" ]; then
+	echo "$SCRIPT:running \"$command\" on $inpath with output to $outpath" >&2
+	python3 "$command" --type-map "$CONFIGDIR/type_map.tsv" \
+		--types "$CONFIGDIR/consensus_types.tsv" "$inpath" "$outpath"
+    elif [ -s "$CHANGED" ]; then
+	echo "$SCRIPT:updating $outpath for changed documents" >&2
+	python3 "$command" --type-map "$CONFIGDIR/type_map.tsv" \
+		--types "$CONFIGDIR/consensus_types.tsv" --ids "$CHANGED" \
+		"$inpath" "$outpath"
+    else
+	echo "$SCRIPT:$outpath exists, skipping ..." >&2
+    fi
+done
+
+echo "$SCRIPT:done." >&2
@@ -0,0 +1,92 @@
+#!/bin/bash
+
+# Build consensus annotations by voting over aligned PubTator and tagger
+# annotations filtered to target types (see
+# 460-materialize-annotations.sh).
+
+set -euo pipefail
+
+PARALLEL_JOBS=5
+
+SHARDS=100
+
+# Minimum number of annotation sets agreeing on an annotation
+MIN_VOTES=2
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+CONFIGDIR="$SCRIPTDIR/../config"
+
+DBDIR="$SCRIPTDIR/../data/filtered/db"
+
+declare -a DATASETS=(
+    "pubtator:$DBDIR/pubtator.sqlite"
+    "tagger:$DBDIR/tagger.sqlite"
+)
+
+for d in "${DATASETS[@]}"; do
+    if [ ! -s "${d#*:}" ]; then
+	echo "$SCRIPT:ABORT: ${d#*:} not found"
+	exit 1
+    fi
+done
+
+# Optional annotation sources
+nerdb="$DBDIR/ner.sqlite"
+if [ -s "$nerdb" ]; then
+    DATASETS+=("ner:$nerdb")
+fi
+
+OUTDIR="$SCRIPTDIR/../data/consensus/db"
+
+mkdir -p "$OUTDIR"
+
+outdb="$OUTDIR/consensus.sqlite"
+
+CHANGED="$SCRIPTDIR/../data/pubmed/contents/pubmed.changed.ids"
+
+command="$TOOLDIR/makeconsensus.py"
+
+merge="$TOOLDIR/mergesqlite.py"
+
+if [ -s "$outdb" ] && [ -s "$CHANGED" ]; then
+    echo "$SCRIPT:updating $outdb for changed documents ..." >&2
+    TMPDIR=`mktemp -d`
+
+    function rmtmp {
+	rm -rf "$TMPDIR"
+    }
+
+    trap rmtmp EXIT
+
+    # Build consensus for the changed documents from subsets of the DBs
+    declare -a SUBSETS=()
+    for d in "${DATASETS[@]}"; do
+	name="${d%%:*}"
+	python3 "$merge" -s .ann --ids "$CHANGED" "$TMPDIR/$name.sqlite" \
+		"${d#*:}"
+	SUBSETS+=("$name:$TMPDIR/$name.sqlite")
+    done
+    python3 "$command" --jobs 1 --shards 1 \
+	    --min-votes "$MIN_VOTES" --type-map "$CONFIGDIR/type_map.tsv" \
+	    "$TMPDIR/consensus.sqlite" "${SUBSETS[@]}"
+    python3 "$merge" -s .ann --ids "$CHANGED" --delete-missing \
+	    "$outdb" "$TMPDIR/consensus.sqlite"
+    echo "$SCRIPT:done." >&2
+    exit 0
+elif [ -s "$outdb" ]; then
+    echo "$SCRIPT:$outdb exists, assuming complete and exiting."
+    exit 0
+fi
+
+echo "$SCRIPT:running \"$command\" with $PARALLEL_JOBS jobs on ${DATASETS[@]}"
+
+# Builds key-range shards in parallel, resuming from completed shards
+python3 "$command" --jobs "$PARALLEL_JOBS" --shards "$SHARDS" \
+	--min-votes "$MIN_VOTES" --type-map "$CONFIGDIR/type_map.tsv" \
+	"$outdb" "${DATASETS[@]}"
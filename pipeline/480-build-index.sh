@@ -0,0 +1,47 @@
+#!/bin/bash
+
+# Build inverted index from normalization IDs and types to documents.
+
+set -euo pipefail
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+TOOLDIR="$SCRIPTDIR/../scripts"
+
+CHANGED="$SCRIPTDIR/../data/pubmed/contents/pubmed.changed.ids"
+
+declare -a DATASETS=(
+    "pubtator:$SCRIPTDIR/../data/pubtator/db/pubtator-aligned.sqlite"
+    "tagger:$SCRIPTDIR/../data/tagger/db/tagger.sqlite"
+    "consensus:$SCRIPTDIR/../data/consensus/db/consensus.sqlite"
+)
+
+for d in "${DATASETS[@]}"; do
+    if [ ! -s "${d#*:}" ]; then
+	echo "$SCRIPT:ABORT: ${d#*:} not found"
+	exit 1
+    fi
+done
+
+OUTDIR="$SCRIPTDIR/../data/index"
+
+mkdir -p "$OUTDIR"
+
+indexdb="$OUTDIR/annotations.index.sqlite"
+
+command="$TOOLDIR/makeannindex.py"
+
+if [ -s "$indexdb" ] && [ -s "$CHANGED" ]; then
+    echo "$SCRIPT:updating $indexdb for changed documents" >&2
+    python3 "$command" --ids "$CHANGED" "$indexdb" "${DATASETS[@]}"
+elif [ -s "$indexdb" ]; then
+    echo "$SCRIPT:$indexdb exists, assuming complete and exiting."
+    exit 0
+else
+    echo "$SCRIPT:running \"$command\" on ${DATASETS[@]}"
+    python3 "$command" "$indexdb.tmp" "${DATASETS[@]}"
+    mv "$indexdb.tmp" "$indexdb"
+fi
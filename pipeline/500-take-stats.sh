@@ -13,8 +13,11 @@ OUTDIR="$SCRIPTDIR/../data/stats"
 
 TOOLDIR="$SCRIPTDIR/../scripts"
 
+CHANGED="$SCRIPTDIR/../data/pubmed/contents/pubmed.changed.ids"
+
 declare -a DBDIRS=(
     "$SCRIPTDIR/../data/pubtator/db"
+    "$SCRIPTDIR/../data/consensus/db"
 )
 
 mkdir -p "$OUTDIR"
@@ -22,13 +25,25 @@ mkdir -p "$OUTDIR"
 command="$TOOLDIR/standoffstats.py"
 
 for d in "${DBDIRS[@]}"; do
+    if [ ! -d "$d" ]; then
+	echo "$SCRIPT:$d not found, skipping" >&2
+	continue
+    fi
     for f in $(find "$d" -name '*.sqlite'); do
 	o="$OUTDIR/$(basename "$f" .sqlite).txt"
-	if [ -s "$o" ]; then
+	j="$OUTDIR/$(basename "$f" .sqlite).json"
+	s="$OUTDIR/$(basename "$f" .sqlite).docstats.sqlite"
+	if [ -s "$o" ] && [ -s "$s" ] && [ -s "$CHANGED" ]; then
+	    echo "$SCRIPT:updating $(basename "$o") for changed documents" >&2
+	    python3 "$command" "$f" -t 100 -d "$s" --ids "$CHANGED" \
+		    --json "$j.new" > "$o.new"
+	    mv "$j.new" "$j"
+	    mv "$o.new" "$o"
+	elif [ -s "$o" ]; then
 	    echo "$SCRIPT:$(basename "$o") exists, skip $(basename "$f")" >&2
 	else
 	    echo "$SCRIPT:running \"$command\" on $f"
-	    python3 "$command" "$f" -t 100 > $o
+	    python3 "$command" "$f" -t 100 -d "$s" --json "$j" > $o
 	fi
     done
 done
@@ -0,0 +1,17 @@
+#!/bin/bash
+
+# Clear list of changed PubMed documents after all stages have run.
+
+set -euo pipefail
+
+SCRIPT="$(basename "$0")"
+
+# https://stackoverflow.com/a/246128
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+
+CHANGED="$SCRIPTDIR/../data/pubmed/contents/pubmed.changed.ids"
+
+if [ -e "$CHANGED" ]; then
+    echo "$SCRIPT:all stages done, removing $CHANGED" >&2
+    rm -f "$CHANGED"
+fi
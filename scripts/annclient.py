@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Run annotation query tools in annserver.py.
+
+# Usage: annclient.py TOOL [ARGS ...], where TOOL is one of TOOLS, e.g.
+# `annclient.py catsqlite -k pubmed.sqlite 12345.txt`. The output and
+# exit status are the same as for running TOOL.py with ARGS. If no
+# server is listening on the socket (see socket_path()), or if it is
+# not run by the same user, the tool is run in this process instead.
+# Only the standard library is imported here so that startup stays
+# fast.
+
+import sys
+import os
+import json
+import socket
+import struct
+
+
+TOOLS = ('catsqlite', 'getannotations', 'listannotations')
+
+SOCKET_NAME = 'annserver.sock'
+
+# Per-user directory for the socket if $XDG_RUNTIME_DIR is not set,
+# created by the server with mode 0700
+FALLBACK_DIR = '/tmp/annserver-{}'.format(os.getuid())
+
+# Server response frames: channel and payload length, followed by
+# payload (output bytes, or exit status as text for EXIT)
+FRAME_HEADER = struct.Struct('>cI')
+
+STDOUT, STDERR, EXIT = b'o', b'e', b'x'
+
+
+def socket_path():
+    """Return $ANNSERVER_SOCKET, or SOCKET_NAME in $XDG_RUNTIME_DIR or
+    FALLBACK_DIR."""
+    if 'ANNSERVER_SOCKET' in os.environ:
+        return os.environ['ANNSERVER_SOCKET']
+    directory = os.environ.get('XDG_RUNTIME_DIR') or FALLBACK_DIR
+    return os.path.join(directory, SOCKET_NAME)
+
+
+def peer_uid(sock, path):
+    """Return user ID of process at other end of connected socket."""
+    if hasattr(socket, 'SO_PEERCRED'):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        return uid
+    else:
+        return os.stat(path).st_uid    # no SO_PEERCRED, use socket owner
+
+
+def connect(path):
+    """Return socket connected to server, None if no server or if the
+    server is run by another user."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    # Requests reveal arguments and working directory and responses are
+    # trusted, so only talk to own server
+    if peer_uid(sock, path) != os.getuid():
+        print('warning: {} not owned by current user, ignoring'.format(path),
+              file=sys.stderr)
+        sock.close()
+        return None
+    return sock
+
+
+def read_frame(f):
+    header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        raise ConnectionError('server closed connection')
+    channel, size = FRAME_HEADER.unpack(header)
+    return channel, f.read(size)
+
+
+def run_remote(sock, tool, args):
+    request = { 'tool': tool, 'argv': args, 'cwd': os.getcwd() }
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    outputs = { STDOUT: sys.stdout.buffer, STDERR: sys.stderr.buffer }
+    with sock.makefile('rb') as f:
+        while True:
+            channel, payload = read_frame(f)
+            if channel == EXIT:
+                return int(payload)
+            outputs[channel].write(payload)
+            if channel == STDERR:
+                sys.stderr.buffer.flush()
+
+
+def run_local(tool, args):
+    import importlib
+    sys.argv = ['{}.py'.format(tool)] + args
+    return importlib.import_module(tool).main(sys.argv)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in TOOLS:
+        print('usage: {} TOOL [ARGS ...], TOOL one of {}'.format(
+            os.path.basename(argv[0]), ', '.join(TOOLS)), file=sys.stderr)
+        return 1
+    tool, args = argv[1], argv[2:]
+    # Profiling is only meaningful in a process of its own
+    sock = connect(socket_path()) if '--profile' not in args else None
+    if sock is None:
+        return run_local(tool, args)
+    try:
+        with sock:
+            return run_remote(sock, tool, args)
+    except BrokenPipeError:
+        # Suppress exception when used in pipe with e.g. head
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
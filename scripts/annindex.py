@@ -0,0 +1,159 @@
+# Inverted index from normalization IDs and types to documents.
+
+# The index is an SQLite DB with one table per dataset mapping terms to
+# postings, the sorted integer IDs of documents where the term occurs.
+# Terms are 'id:<normalization ID>' and 'type:<type>'. Postings are
+# stored as BLOBs of the differences between consecutive IDs (the first
+# ID for the first) as varints, 7 bits per byte with the high bit set
+# on all but the last byte, so that dense terms take about a byte per
+# document. A second table per dataset ('<dataset>.docs', an SQLiteDict
+# table) maps each document to its terms so that postings can be
+# updated incrementally for changed documents.
+
+import sqlite3
+
+from bisect import bisect_left
+from logging import error
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+ID_TERM = 'id:{}'
+TYPE_TERM = 'type:{}'
+
+DOCS_TABLE = '{}.docs'
+
+# Temporary table of sorted postings runs during full build (see
+# makeannindex.py)
+RUNS_TABLE = '{}.runs'
+
+# Suffixes of tables other than postings tables
+AUXILIARY_SUFFIXES = (DOCS_TABLE.format(''), RUNS_TABLE.format(''))
+
+
+def create_postings_table(conn, name):
+    conn.execute('CREATE TABLE IF NOT EXISTS "{}" (term TEXT PRIMARY KEY,'
+                 ' postings BLOB)'.format(name))
+
+
+def encode_postings(doc_ids):
+    """Encode iterable of sorted document IDs as varint deltas."""
+    data, previous = bytearray(), 0
+    for doc_id in doc_ids:
+        delta, previous = doc_id - previous, doc_id
+        while delta >= 0x80:
+            data.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def iter_postings(data):
+    """Iterate over sorted document IDs in varint delta bytes."""
+    doc_id, delta, shift = 0, 0, 0
+    for byte in data:
+        if byte & 0x80:
+            delta |= (byte & 0x7f) << shift
+            shift += 7
+        else:
+            doc_id += delta | byte << shift
+            yield doc_id
+            delta, shift = 0, 0
+
+
+def decode_postings(data):
+    """Return sorted document IDs from varint delta bytes."""
+    return list(iter_postings(data))
+
+
+def document_terms(ann):
+    """Return set of index terms for standoff annotation."""
+    terms = set()
+    for line in ann.splitlines():
+        if not line:
+            continue
+        elif line[0] == 'T':
+            type_ = line.split('\t')[1].split(' ', 1)[0]
+            terms.add(TYPE_TERM.format(type_))
+        elif line[0] == 'N':
+            norm_id = line.split('\t')[1].split(' ')[2]
+            terms.add(ID_TERM.format(norm_id))
+    return terms
+
+
+def merge_postings(postings, add=(), remove=()):
+    """Return sorted postings with doc IDs added and removed."""
+    if not remove and (not postings or not add or add[0] > postings[-1]):
+        return postings + list(add)    # common case: append
+    ids = set(postings)
+    ids.difference_update(remove)
+    ids.update(add)
+    return sorted(ids)
+
+
+def read_postings(conn, name, term):
+    """Return encoded postings for term in table, None if none."""
+    row = conn.execute('SELECT postings FROM "{}" WHERE term = ?'.format(
+        name), (term,)).fetchone()
+    return row[0] if row is not None else None
+
+
+class AnnotationIndex(object):
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+
+    def datasets(self):
+        return [
+            t for t in SqliteDict.get_tablenames(self.path)
+            if not t.endswith(AUXILIARY_SUFFIXES)
+        ]
+
+    def postings(self, term, dataset=None):
+        """Return sorted IDs of documents with term.
+
+        If dataset is None, return union over all datasets.
+        """
+        if dataset is None:
+            return union(self.postings(term, d) for d in self.datasets())
+        data = read_postings(self.conn, dataset, term)
+        return decode_postings(data) if data is not None else []
+
+    def terms(self, dataset, prefix=''):
+        cursor = self.conn.execute('SELECT term FROM "{}"'.format(dataset))
+        return [t for t, in cursor if t.startswith(prefix)]
+
+
+def intersection(postings_lists):
+    """Return sorted intersection of sorted postings lists."""
+    postings_lists = sorted(postings_lists, key=len)
+    if not postings_lists:
+        return []
+    result = postings_lists[0]
+    for other in postings_lists[1:]:
+        if len(result) * 16 < len(other):
+            # much shorter, binary search
+            found = []
+            for doc_id in result:
+                i = bisect_left(other, doc_id)
+                if i < len(other) and other[i] == doc_id:
+                    found.append(doc_id)
+            result = found
+        else:
+            other = set(other)
+            result = [d for d in result if d in other]
+        if not result:
+            break
+    return result
+
+
+def union(postings_lists):
+    """Return sorted union of sorted postings lists."""
+    ids = set()
+    for postings in postings_lists:
+        ids.update(postings)
+    return sorted(ids)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# Serve annotation DB queries over a Unix socket.
+
+# Clients (see annclient.py) send a tool name, arguments and working
+# directory, and the server runs the tool's main() in-process with its
+# output sent back to the client. DBs opened read-only are kept open
+# while unchanged (see dbcodec.keep_open()), optionally with a larger
+# SQLite page cache, so that queries do not pay for interpreter
+# startup, imports, opening DBs or a cold cache. Requests are served
+# one at a time, as tools run in the server's working directory and
+# with its stdout and stderr.
+
+import sys
+import os
+import io
+import json
+import stat
+import errno
+import socket
+import signal
+import logging
+import importlib
+import traceback
+
+from annclient import TOOLS, FRAME_HEADER, STDOUT, STDERR, EXIT
+from annclient import socket_path
+from dbcodec import open_db, keep_open
+from intkeydb import select_keys
+
+
+# Buffer size for tool stdout
+BUFFER_SIZE = 65536
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Serve annotation DB queries.')
+    ap.add_argument('-c', '--cache-mb', metavar='MB', type=int, default=None,
+                    help='SQLite page cache size per DB')
+    ap.add_argument('-s', '--socket', metavar='PATH', default=None,
+                    help='socket path (default $ANNSERVER_SOCKET or {})'.\
+                    format(socket_path()))
+    ap.add_argument('-w', '--warm', default=False, action='store_true',
+                    help='read keys of DBs at startup to warm caches')
+    ap.add_argument('db', metavar='DB', nargs='*',
+                    help='DBs to open at startup')
+    return ap
+
+
+class ChannelWriter(io.RawIOBase):
+    """Write bytes to socket as frames on channel."""
+
+    def __init__(self, conn, channel):
+        self.conn = conn
+        self.channel = channel
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        try:
+            self.conn.sendall(FRAME_HEADER.pack(self.channel, len(data)) +
+                              bytes(data))
+        except OSError:
+            raise BrokenPipeError(errno.EPIPE, 'client disconnected')
+        return len(data)
+
+
+def channel_stream(conn, channel, line_buffering=False):
+    writer = io.BufferedWriter(ChannelWriter(conn, channel), BUFFER_SIZE)
+    return io.TextIOWrapper(writer, encoding='utf-8',
+                            line_buffering=line_buffering)
+
+
+class StderrHandler(logging.StreamHandler):
+    """Log to the current sys.stderr, which changes by request."""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def run_tool(tool, args, cwd):
+    """Run tool main() with args in cwd, return exit status."""
+    saved = sys.argv, os.getcwd()
+    try:
+        sys.argv = ['{}.py'.format(tool)] + args
+        os.chdir(cwd)
+        # Reloaded so that module state does not carry over
+        module = importlib.reload(importlib.import_module(tool))
+        status = module.main(sys.argv)
+    except SystemExit as e:
+        status = e.code
+        if isinstance(status, str):
+            print(status, file=sys.stderr)
+            status = 1
+    except BrokenPipeError:
+        status = 1    # client gone
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.argv = saved[0]
+        os.chdir(saved[1])
+    return status if status is not None else 0
+
+
+def handle(conn):
+    with conn.makefile('rb') as f:
+        request = json.loads(f.readline().decode('utf-8'))
+    stdout = channel_stream(conn, STDOUT)
+    stderr = channel_stream(conn, STDERR, line_buffering=True)
+    saved = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        if request['tool'] not in TOOLS:
+            print('error: unknown tool {}'.format(request['tool']),
+                  file=sys.stderr)
+            status = 1
+        else:
+            status = run_tool(request['tool'], request['argv'],
+                              request['cwd'])
+    finally:
+        sys.stdout, sys.stderr = saved
+    try:
+        stdout.flush()
+        stderr.flush()
+        conn.sendall(FRAME_HEADER.pack(EXIT, len(str(status))) +
+                     str(status).encode('ascii'))
+    except (BrokenPipeError, ValueError):
+        pass    # client gone
+
+
+def check_directory(path):
+    """Create socket directory if missing and check that only the
+    current user can access it."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise ValueError('{} is not a directory owned by current user'.\
+                         format(path))
+    if st.st_mode & 0o077:
+        raise ValueError('{} is accessible by other users'.format(path))
+
+
+def open_socket(path):
+    check_directory(os.path.dirname(os.path.abspath(path)))
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)    # left by server that did not exit cleanly
+        else:
+            raise ValueError('server already running on {}'.format(path))
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)    # socket created with mode 0600
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    sock.listen(16)
+    return sock
+
+
+def serve(options):
+    keep_open(options.cache_mb)
+    for path in options.db:
+        db = open_db(path, flag='r')
+        if options.warm:
+            count = sum(1 for k in select_keys(db))
+            print('Opened {} ({} keys)'.format(path, count), file=sys.stderr)
+        else:
+            print('Opened {}'.format(path), file=sys.stderr)
+    sock = open_socket(options.socket)
+    print('Listening on {}'.format(options.socket), file=sys.stderr)
+    try:
+        while True:
+            conn, address = sock.accept()
+            with conn:
+                try:
+                    handle(conn)
+                except Exception:
+                    traceback.print_exc()
+    finally:
+        sock.close()
+        os.remove(options.socket)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.socket is None:
+        args.socket = socket_path()
+    for path in args.db:
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    logging.basicConfig(handlers=[StderrHandler()])
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args)
+    except ValueError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
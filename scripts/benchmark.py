@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+# Benchmark annotation processing on synthetic data.
+
+import sys
+import os
+import json
+import platform
+import subprocess
+import tempfile
+
+from argparse import Namespace
+from collections import OrderedDict, defaultdict, Counter
+from contextlib import redirect_stdout
+from datetime import datetime
+from time import perf_counter
+
+import standoff
+import standoffstats
+import compareannotations
+import removeannotations
+import makesyntheticdb
+from dbcodec import open_db
+
+
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+# Synthetic taxonomy
+TAXONOMY_SIZE = 100000
+TAXONOMY_RANKS = ['species', 'genus', 'family', 'no rank']
+TAXONOMY_DIVISIONS = ['Bacteria', 'Mammals', 'Plants', 'Viruses']
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Benchmark on synthetic data.')
+    ap.add_argument('-b', '--benchmark', metavar='NAME', action='append',
+                    default=None, help='only run named benchmark(s)')
+    ap.add_argument('-c', '--compare', metavar='JSON', default=None,
+                    help='report change relative to earlier results')
+    ap.add_argument('-d', '--dir', metavar='DIR', default=None,
+                    help='directory for synthetic data (default temporary)')
+    ap.add_argument('-n', '--docs', metavar='N', type=int, default=10000,
+                    help='number of synthetic documents')
+    ap.add_argument('-o', '--output', metavar='JSON', default=None,
+                    help='write results to file (default stdout)')
+    ap.add_argument('-r', '--repeat', metavar='N', type=int, default=3,
+                    help='repeat each benchmark N times, report best')
+    ap.add_argument('-S', '--skip-scripts', default=False,
+                    action='store_true', help='skip end-to-end script runs')
+    return ap
+
+
+def make_corpus(directory, options):
+    """Make two synthetic annotation sets sharing texts, return paths."""
+    paths = []
+    for set_seed in (0, 1):
+        path = os.path.join(directory, 'set{}.sqlite'.format(set_seed))
+        if not os.path.exists(path):
+            args = makesyntheticdb.argparser().parse_args([
+                '--docs', str(options.docs), '--set-seed', str(set_seed), path
+            ])
+            makesyntheticdb.make_db(path, args)
+        paths.append(path)
+    return paths
+
+
+def make_taxonomy(directory):
+    """Write synthetic NCBI taxonomy dump files, return directory."""
+    taxdir = os.path.join(directory, 'taxonomy')
+    os.makedirs(taxdir, exist_ok=True)
+    def dmp_line(fields):
+        return '\t|\t'.join(str(f) for f in fields) + '\t|\n'
+    with open(os.path.join(taxdir, standoffstats.TAXONOMY_DIVISION), 'w') as f:
+        for i, name in enumerate(TAXONOMY_DIVISIONS):
+            f.write(dmp_line([i, name[:3].upper(), name, '']))
+    with open(os.path.join(taxdir, standoffstats.TAXONOMY_NODES), 'w') as f:
+        for i in range(1, TAXONOMY_SIZE+1):
+            rank = TAXONOMY_RANKS[i % len(TAXONOMY_RANKS)]
+            div = i % len(TAXONOMY_DIVISIONS)
+            f.write(dmp_line([i, max(1, i//10), rank, '', div]))
+    with open(os.path.join(taxdir, standoffstats.TAXONOMY_MERGED), 'w') as f:
+        for i in range(1, TAXONOMY_SIZE//100):
+            f.write(dmp_line([TAXONOMY_SIZE+i, i]))
+    return taxdir
+
+
+def read_values(path, suffix='.ann'):
+    db = open_db(path, flag='r')
+    return OrderedDict((k, v) for k, v in db.items() if k.endswith(suffix))
+
+
+def bench_parse_standoff(data):
+    values = data['values'][0]
+    def run():
+        for key, value in values.items():
+            standoff.parse_standoff(value, key)
+    return run, len(values)
+
+
+def bench_find_overlapping(data):
+    parsed = [standoff.parse_standoff(v, k)
+              for k, v in data['values'][0].items()]
+    def run():
+        for textbounds in parsed:
+            standoffstats.find_overlapping(textbounds)
+    return run, len(parsed)
+
+
+def bench_take_stats(data):
+    values = data['values'][0]
+    options = Namespace(taxdata=data['taxonomy'])
+    def run():
+        stats = defaultdict(Counter)
+        for key, value in values.items():
+            standoffstats.take_stats('', value, key, stats, options)
+    return run, len(values)
+
+
+def bench_compare_annsets(data):
+    names = ['set0', 'set1']
+    docs = []
+    for key in data['values'][0]:
+        annsets = [
+            compareannotations.parse_standoff(values[key], key, name)
+            for name, values in zip(names, data['values'])
+        ]
+        docs.append((os.path.splitext(key)[0], annsets))
+    options = Namespace(overlap=False, no_ids=False, no_spans=False,
+                        matrix=False, norm=False, id_map={})
+    def run():
+        stats = compareannotations.ComparisonStats()
+        with open(os.devnull, 'w') as out, redirect_stdout(out):
+            for label, annsets in docs:
+                compareannotations.compare_annsets(label, names, annsets,
+                                                   stats, options)
+    return run, len(docs)
+
+
+def bench_remove(data):
+    pairs = []
+    for key in data['values'][0]:
+        pairs.append([
+            standoff.parse_standoff(values[key], key, name)
+            for name, values in zip(['set0', 'set1'], data['values'])
+        ])
+    options = Namespace(overlap=False, norm=False, id_map={})
+    def run():
+        for annset1, annset2 in pairs:
+            removeannotations.remove(annset1, annset2, options)
+    return run, len(pairs)
+
+
+def bench_taxonomy(data):
+    def run():
+        standoffstats.TaxonomyData.from_directory(data['taxdir'])
+    return run, TAXONOMY_SIZE
+
+
+def script_benchmark(script, args):
+    def setup(data):
+        def run():
+            command = [sys.executable, os.path.join(SCRIPTDIR, script)]
+            command += [a.format(**data) for a in args]
+            with open(os.devnull, 'w') as out:
+                subprocess.run(command, stdout=out, stderr=out, check=True)
+        return run, data['docs']
+    return setup
+
+
+BENCHMARKS = OrderedDict([
+    ('parse_standoff', bench_parse_standoff),
+    ('find_overlapping', bench_find_overlapping),
+    ('take_stats', bench_take_stats),
+    ('compare_annsets', bench_compare_annsets),
+    ('remove', bench_remove),
+    ('TaxonomyData.from_directory', bench_taxonomy),
+])
+
+SCRIPT_BENCHMARKS = OrderedDict([
+    ('script:compareannotations', script_benchmark(
+        'compareannotations.py', ['set0:{set0}', 'set1:{set1}'])),
+    ('script:standoffstats', script_benchmark(
+        'standoffstats.py', ['{set0}'])),
+    ('script:removeannotations', script_benchmark(
+        'removeannotations.py', ['set0:{set0}', '{output}', 'set1:{set1}'])),
+    ('script:formatfortagger', script_benchmark(
+        'formatfortagger.py', ['{set0}'])),
+    ('script:listannotations', script_benchmark(
+        'listannotations.py', ['{set0}'])),
+])
+
+
+def run_benchmark(setup, data, options):
+    func, items = setup(data)
+    times = []
+    for i in range(options.repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    best = min(times)
+    return OrderedDict([
+        ('seconds', best),
+        ('times', times),
+        ('items', items),
+        ('items_per_second', items / best if best > 0 else None),
+    ])
+
+
+def run_benchmarks(directory, options):
+    paths = make_corpus(directory, options)
+    taxdir = make_taxonomy(directory)
+    data = {
+        'docs': options.docs,
+        'set0': paths[0],
+        'set1': paths[1],
+        'output': os.path.join(directory, 'removed.sqlite'),
+        'values': [read_values(p) for p in paths],
+        'taxdir': taxdir,
+        'taxonomy': standoffstats.TaxonomyData.from_directory(taxdir),
+    }
+
+    benchmarks = OrderedDict(BENCHMARKS)
+    if not options.skip_scripts:
+        benchmarks.update(SCRIPT_BENCHMARKS)
+    if options.benchmark is not None:
+        benchmarks = OrderedDict((n, b) for n, b in benchmarks.items()
+                                 if n in options.benchmark)
+
+    results = OrderedDict()
+    for name, setup in benchmarks.items():
+        results[name] = run_benchmark(setup, data, options)
+        print('{}\t{:.3f}s'.format(name, results[name]['seconds']),
+              file=sys.stderr)
+    return results
+
+
+def report_comparison(results, path):
+    with open(path) as f:
+        previous = json.load(f)['results']
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        before, after = previous[name]['seconds'], result['seconds']
+        print('{}\t{:.3f}s -> {:.3f}s\t({:+.1%})'.format(
+            name, before, after, after/before-1), file=sys.stderr)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.dir is not None:
+        os.makedirs(args.dir, exist_ok=True)
+        results = run_benchmarks(args.dir, args)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmarks(directory, args)
+    output = OrderedDict([
+        ('timestamp', datetime.now().isoformat()),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('docs', args.docs),
+        ('repeat', args.repeat),
+        ('results', results),
+    ])
+    if args.output is None:
+        print(json.dumps(output, indent=2))
+    else:
+        with open(args.output, 'w') as out:
+            json.dump(output, out, indent=2)
+    if args.compare is not None:
+        report_comparison(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,12 +1,42 @@
 #!/usr/bin/env python
 
+# Output values in SQLiteDict DB, optionally as one file per key in a
+# directory or archive.
+
+# With --jobs or --archive, keys are split into contiguous ranges in key
+# order, cut only between directories (with --dir-prefix) or documents,
+# so that all files of a document (e.g. .txt and .ann) and, where
+# possible, of a directory are written by the same process. Worker
+# processes read and format the values of each range and either write
+# the files or return them for adding to a .tar, .tar.gz or .zip
+# archive in key order.
+
 import sys
 import os
+import io
+import time
 import errno
+import tarfile
+import zipfile
 
+from multiprocessing import Pool
 from logging import error
 
-from sqlitedict import SqliteDict
+from profiling import add_profile_arguments, start_profiling
+from dbcodec import open_db
+from intkeydb import sorted_keys, sorted_range
+from parallel import bounded_imap
+
+
+# Approximate number of keys per range for parallel export
+RANGE_SIZE = 10000
+
+ARCHIVE_FORMATS = {
+    '.tar': 'w|',
+    '.tar.gz': 'w|gz',
+    '.tgz': 'w|gz',
+    '.zip': None,
+}
 
 
 def argparser():
@@ -18,8 +48,14 @@ def argparser():
                     help='output directory')
     ap.add_argument('-P', '--dir-prefix', type=int, default=None,
                     help='add subdirectory with document ID prefix')
+    ap.add_argument('-a', '--archive', metavar='FILE', default=None,
+                    help='write files to .tar, .tar.gz or .zip archive '
+                    '("-" for tar to stdout)')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                    help='number of parallel processes for file output')
     ap.add_argument('db', metavar='DB', help='database file')
     ap.add_argument('keys', metavar='KEY', nargs='*', help='keys to look up')
+    add_profile_arguments(ap)
     return ap
 
 
@@ -30,13 +66,10 @@ def write(out, key, value, options):
 
 
 def document_path(doc_id, options):
-    if options.directory is None:
-        directory = ''
-    elif options.dir_prefix is None:
-        directory = options.directory
-    else:
+    directory = options.directory if options.directory is not None else ''
+    if options.dir_prefix is not None:
         base = os.path.splitext(doc_id)[0]
-        directory = os.path.join(options.directory, base[:options.dir_prefix])
+        directory = os.path.join(directory, base[:options.dir_prefix])
     return os.path.join(directory, doc_id)
 
 
@@ -65,10 +98,136 @@ def output(key, value, options):
 output.known_directories = set()
 
 
+def format_value(key, value, options):
+    out = io.StringIO()
+    write(out, key, value, options)
+    return out.getvalue()
+
+
+def document_group(key, options):
+    """Return group of key whose files go in the same directory."""
+    base = os.path.splitext(key)[0]
+    if options.dir_prefix is None:
+        return base
+    return base[:options.dir_prefix]
+
+
+def plan_ranges(dbname, options):
+    """Split keys in DB into ranges of about RANGE_SIZE keys, cut only
+    between groups. Return list of (start, end) keys, end None for last.
+    """
+    # No close() as this is read-only and close() can block
+    db = open_db(dbname, flag='r')
+    starts, count, previous = [], 0, None
+    for key in sorted_keys(db):
+        group = document_group(key, options)
+        if not starts or (group != previous and count >= RANGE_SIZE):
+            starts.append(key)
+            count = 0
+        previous = group
+        count += 1
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def export_range(job):
+    """Write files for keys in range, or return them if archiving.
+
+    Return (count, list of (path, data)).
+    """
+    dbname, start, end, options = job
+    # No close() as this is read-only and close() can block
+    db = open_db(dbname, flag='r')
+    count, files, directory = 0, [], None
+    for key, value in sorted_range(db, start, end):
+        value = db.decode(value).rstrip('\n')
+        path = document_path(key, options)
+        data = format_value(key, value, options)
+        if options.archive is not None:
+            files.append((path, data.encode('utf-8')))
+        else:
+            if os.path.dirname(path) != directory:
+                directory = os.path.dirname(path)
+                if directory:
+                    mkdir_p(directory)
+            with open(path, 'w', encoding='utf-8') as out:
+                out.write(data)
+        count += 1
+    return count, files
+
+
+def archive_format(path):
+    """Return archive suffix in ARCHIVE_FORMATS for path."""
+    if path == '-':
+        return '.tar'
+    for suffix in ARCHIVE_FORMATS:
+        if path.endswith(suffix):
+            return suffix
+    raise ValueError('unknown archive format: {}'.format(path))
+
+
+class ArchiveWriter(object):
+    """Sequential writer for tar (also to stdout) and zip archives."""
+
+    def __init__(self, path, suffix):
+        self.mtime = time.time()
+        self.zip, self.tar = None, None
+        if suffix == '.zip':
+            self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        elif path == '-':
+            self.tar = tarfile.open(fileobj=sys.stdout.buffer,
+                                    mode=ARCHIVE_FORMATS[suffix])
+        else:
+            self.tar = tarfile.open(path, mode=ARCHIVE_FORMATS[suffix])
+
+    def add(self, path, data):
+        if self.zip is not None:
+            info = zipfile.ZipInfo(path, time.localtime(self.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self.zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            info.mtime = self.mtime
+            self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+        else:
+            self.tar.close()
+
+
+def export_db(dbname, options):
+    """Write all values in DB as files in parallel, return count."""
+    jobs = [
+        (dbname, start, end, options)
+        for start, end in plan_ranges(dbname, options)
+    ]
+    archive, tmppath = None, None
+    if options.archive == '-':
+        archive = ArchiveWriter('-', archive_format('-'))
+    elif options.archive is not None:
+        tmppath = options.archive + '.tmp'
+        archive = ArchiveWriter(tmppath, archive_format(options.archive))
+    total = 0
+    with Pool(options.jobs) as pool:
+        for count, files in bounded_imap(pool, export_range, jobs,
+                                         2 * options.jobs):
+            if archive is not None:
+                for path, data in files:
+                    archive.add(path, data)
+            total += count
+    if archive is not None:
+        archive.close()
+    if tmppath is not None:
+        os.rename(tmppath, options.archive)
+    return total
+
+
 def list_db(dbname, options):
     # No context manager (and no close()) as this is read-only and
     # close() can block for a long time for no apparent reason.
-    db = SqliteDict(dbname, flag='r', autocommit=False)
+    db = open_db(dbname, flag='r')
     if not options.keys:
         for k, v in db.iteritems():
             output(k, v.rstrip('\n'), options)
@@ -84,9 +243,28 @@ def list_db(dbname, options):
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
     if not os.path.exists(args.db):
         print('no such file: {}'.format(args.db), file=sys.stderr)
         return 1
+    if args.archive is not None or args.jobs > 1:
+        if args.keys:
+            print('error: KEY arguments not supported with --archive or '
+                  '--jobs', file=sys.stderr)
+            return 1
+        if args.archive is None and args.directory is None:
+            print('error: --jobs requires --directory or --archive',
+                  file=sys.stderr)
+            return 1
+        try:
+            if args.archive is not None:
+                archive_format(args.archive)
+        except ValueError as e:
+            print('error: {}'.format(e), file=sys.stderr)
+            return 1
+        count = export_db(args.db, args)
+        print('Done, wrote {} files'.format(count), file=sys.stderr)
+        return 0
     try:
         list_db(args.db, args)
     except BrokenPipeError:
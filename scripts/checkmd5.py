@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# Verify MD5 checksums of files against .md5 files in parallel, caching
+# successful verifications by path, size and mtime.
+
+import sys
+import os
+import re
+import hashlib
+
+from multiprocessing import Pool
+from logging import error
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# Default name of verification cache DB, created in the checked directory
+CACHE_NAME = '.md5cache.sqlite'
+
+# Read size for hashing
+BLOCK_SIZE = 16*1024*1024
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Verify MD5 checksums in directory.')
+    ap.add_argument('-c', '--cache', metavar='DB', default=None,
+                    help='verification cache (default DIR/{})'.format(
+                        CACHE_NAME))
+    ap.add_argument('-C', '--no-cache', default=False, action='store_true',
+                    help='do not use verification cache')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=None,
+                    help='number of hashing processes (default CPU count)')
+    ap.add_argument('-r', '--remove', default=False, action='store_true',
+                    help='remove files with missing or mismatched checksums')
+    ap.add_argument('-s', '--suffix', default='.xml.gz',
+                    help='suffix of files to check')
+    ap.add_argument('dir', metavar='DIR', help='directory with files to check')
+    return ap
+
+
+def read_checksum(path):
+    """Return reference checksum from .md5 file.
+
+    Supports both `MD5(FILE)= CHECKSUM` and `CHECKSUM  FILE` formats.
+    """
+    with open(path) as f:
+        content = f.read().strip()
+    m = re.search(r'=\s*([0-9a-fA-F]{32})\b', content)
+    if m is None:
+        m = re.match(r'([0-9a-fA-F]{32})\b', content)
+    if m is None:
+        raise ValueError('failed to parse checksum from {}'.format(path))
+    return m.group(1).lower()
+
+
+def md5sum(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            md5.update(block)
+    return path, md5.hexdigest()
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def cache_key(path):
+    return os.path.realpath(path)
+
+
+def find_files(directory, suffix):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for fn in filenames:
+            if fn.endswith(suffix):
+                paths.append(os.path.join(dirpath, fn))
+    return sorted(paths)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def check_directory(directory, cache, options):
+    """Check files in directory, return number of errors."""
+    script = os.path.basename(__file__)
+    errors = 0
+
+    to_check = []
+    for path in find_files(directory, options.suffix):
+        md5path = path + '.md5'
+        if not os.path.exists(md5path):
+            errors += 1
+            if options.remove:
+                print('{}:missing checksum {}, removing {}'.format(
+                    script, md5path, path), file=sys.stderr)
+                remove_file(path)
+            else:
+                print('{}:missing checksum {}'.format(script, md5path),
+                      file=sys.stderr)
+            continue
+        try:
+            ref = read_checksum(md5path)
+        except ValueError as e:
+            # Empty or truncated checksum download, treat as mismatch
+            errors += 1
+            if options.remove:
+                print('{}:WARNING:{}, removing {} and {}'.format(
+                    script, e, path, md5path), file=sys.stderr)
+                remove_file(path)
+                remove_file(md5path)
+            else:
+                print('{}:{}'.format(script, e), file=sys.stderr)
+            if cache is not None and cache_key(path) in cache:
+                del cache[cache_key(path)]
+                cache.commit()
+            continue
+        cached = cache.get(cache_key(path)) if cache is not None else None
+        if cached is not None and cached == (file_signature(path), ref):
+            print('{}:checksum OK for {} (cached)'.format(script, path),
+                  file=sys.stderr)
+            continue
+        to_check.append((path, md5path, ref))
+
+    if not options.remove:
+        # Checksums without data files are also errors when not cleaning up
+        for md5path in find_files(directory, options.suffix + '.md5'):
+            if not os.path.exists(md5path[:-len('.md5')]):
+                errors += 1
+                print('{}:missing file for {}'.format(script, md5path),
+                      file=sys.stderr)
+
+    ref_by_path = { p: (m, r) for p, m, r in to_check }
+    with Pool(options.jobs) as pool:
+        results = pool.imap_unordered(md5sum, [p for p, m, r in to_check])
+        for path, md5 in results:
+            md5path, ref = ref_by_path[path]
+            if md5 != ref:
+                errors += 1
+                if options.remove:
+                    print('{}:WARNING:checksums differ ({}<>{}), removing {}'
+                          ' and {}'.format(script, md5, ref, path, md5path),
+                          file=sys.stderr)
+                    remove_file(path)
+                    remove_file(md5path)
+                else:
+                    print('{}:checksums differ ({}<>{}) for {}'.format(
+                        script, md5, ref, path), file=sys.stderr)
+                if cache is not None and cache_key(path) in cache:
+                    del cache[cache_key(path)]
+            else:
+                print('{}:checksum OK for {}'.format(script, path),
+                      file=sys.stderr)
+                if cache is not None:
+                    cache[cache_key(path)] = (file_signature(path), ref)
+                    cache.commit()
+    return errors
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if not os.path.isdir(args.dir):
+        print('no such directory: {}'.format(args.dir), file=sys.stderr)
+        return 1
+    if args.no_cache:
+        cache = None
+    else:
+        if args.cache is None:
+            args.cache = os.path.join(args.dir, CACHE_NAME)
+        cache = SqliteDict(args.cache, autocommit=False)
+    try:
+        errors = check_directory(args.dir, cache, args)
+    finally:
+        if cache is not None:
+            cache.close()
+    if errors and not args.remove:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
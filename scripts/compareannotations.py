@@ -6,40 +6,24 @@
 
 import sys
 import os
+import io
+import json
 
 from collections import defaultdict, OrderedDict
 from itertools import chain
-from random import random
 from logging import info, warning, error
 
-try:
-    import sqlitedict
-except ImportError:
-    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
-    raise
-
-
-# Filter down to these
-TARGET_TYPES = [
-    'Chemical',
-    'Disease',
-    'Gene',
-    'Organism',
-]
-
-
-TYPE_MAP = {
-    # EVEX
-    'cel': 'Cell',
-    'che': 'Chemical',
-    'dis': 'Disease',
-    'ggp': 'Gene',
-    'org': 'Organism',
-    # EXTRACT
-    'Chemical_compound': 'Chemical',
-    # PubTator
-    'Species': 'Organism',
-}
+from docset import read_docset, docset_items, count_docs, DEFAULT_SEED
+from profiling import add_profile_arguments, start_profiling
+from profiling import phase, timed_iter, timed_decode
+from progress import add_progress_arguments, make_progress
+from statsjson import write_stats
+from idmap import read_id_maps, canonical_ids
+from dbcodec import open_db
+from typemap import add_type_arguments, make_type_mapping, read_type_mapping
+from prefetch import add_prefetch_arguments, prefetch, fetch_values
+from resultcache import add_cache_arguments, open_cache, make_key
+from resultcache import file_hash, code_version
 
 
 def argparser():
@@ -49,6 +33,12 @@ def argparser():
                     help='exclude annotation IDs in output')
     ap.add_argument('-l', '--limit', metavar='N', type=int, default=None,
                     help='only compare first N documents')
+    ap.add_argument('-m', '--matrix', default=False, action='store_true',
+                    help='output pairwise agreement by type instead of'
+                    ' annotation instances')
+    ap.add_argument('-n', '--norm', default=False, action='store_true',
+                    help='also match on normalized IDs, reporting ID-level'
+                    ' stats')
     ap.add_argument('-o', '--overlap', default=False, action='store_true',
                     help='accept annotation overlap as match')
     ap.add_argument('-r', '--random', metavar='RATIO', default=None,
@@ -57,8 +47,23 @@ def argparser():
                     help='exclude annotation span in output')
     ap.add_argument('-s', '--suffix', default='.ann',
                     help='suffix of files to compare')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only compare documents with IDs in FILE')
+    ap.add_argument('--id-map', metavar='FILE', default=None,
+                    action='append', help='map equivalent normalized IDs'
+                    ' (TSV or NCBI taxonomy merged.dmp)')
+    ap.add_argument('--json', metavar='FILE', default=None,
+                    help='write stats to FILE (JSON, or NDJSON if FILE ends'
+                    ' with .ndjson)')
+    ap.add_argument('--seed', metavar='SEED', type=int, default=DEFAULT_SEED,
+                    help='seed for --random document sampling')
     ap.add_argument('data', metavar='NAME:DB', nargs='+',
                     help='dataset name and path')
+    add_type_arguments(ap)
+    add_cache_arguments(ap)
+    add_prefetch_arguments(ap)
+    add_profile_arguments(ap)
+    add_progress_arguments(ap)
     return ap
 
 
@@ -71,9 +76,48 @@ class ComparisonStats(object):
         self.document_stats = defaultdict(int)
         self.annotation_totals = defaultdict(int)
         self.annotation_by_type = defaultdict(lambda: defaultdict(int))
+        self.norm_totals = defaultdict(int)
+        self.norm_by_type = defaultdict(lambda: defaultdict(int))
         self.missing_docs_by_dataset = defaultdict(int)
         self.compared_docs = 0
 
+    def to_dict(self):
+        return {
+            'document_stats': dict(self.document_stats),
+            'annotation_totals': dict(self.annotation_totals),
+            'annotation_by_type': {
+                k: dict(v) for k, v in self.annotation_by_type.items()
+            },
+            'norm_totals': dict(self.norm_totals),
+            'norm_by_type': {
+                k: dict(v) for k, v in self.norm_by_type.items()
+            },
+            'missing_docs_by_dataset': dict(self.missing_docs_by_dataset),
+            'compared_docs': self.compared_docs,
+        }
+
+    def add(self, data):
+        """Add counts from to_dict() data."""
+        def add_counts(counts, other):
+            for k, v in other.items():
+                counts[k] += v
+        add_counts(self.document_stats, data.get('document_stats', {}))
+        add_counts(self.annotation_totals, data.get('annotation_totals', {}))
+        for k, v in data.get('annotation_by_type', {}).items():
+            add_counts(self.annotation_by_type[k], v)
+        add_counts(self.norm_totals, data.get('norm_totals', {}))
+        for k, v in data.get('norm_by_type', {}).items():
+            add_counts(self.norm_by_type[k], v)
+        add_counts(self.missing_docs_by_dataset,
+                   data.get('missing_docs_by_dataset', {}))
+        self.compared_docs += data.get('compared_docs', 0)
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.add(data)
+        return stats
+
     def __str__(self):
         s = []
         s.append('--- by type ---')
@@ -94,9 +138,61 @@ class ComparisonStats(object):
         for k, v in self.missing_docs_by_dataset.items():
             s.append('{}\t{} missing'.format(v, k))
         s.append('TOTAL\t{}'.format(self.compared_docs))
+        if self.norm_totals:
+            s.append('--- by type (IDs) ---')
+            for n in sorted(self.norm_by_type.keys()):
+                t = sum(self.norm_by_type[n].values())
+                for k, v in self.norm_by_type[n].items():
+                    s.append('{}\t{}\t{}\t{:.2%}'.format(n, k, v, v/t))
+            s.append('--- totals (IDs) ---')
+            t = sum(self.norm_totals.values())
+            for k, v in self.norm_totals.items():
+                s.append('{}\t{}\t{:.2%}'.format(k, v, v/t))
+            s.append('TOTAL\t{}'.format(t))
         return '\n'.join(s)
 
 
+def agreement_matrix(counts_by_pattern):
+    """Return pairwise agreement from counts by dataset subset pattern.
+
+    Patterns are '/'-separated dataset names, as in annotation_totals
+    and annotation_by_type. Returns dict mapping (reference, predicted)
+    name pairs to (tp, fp, fn, precision, recall, F1).
+    """
+    patterns = [(set(p.split('/')), c) for p, c in counts_by_pattern.items()]
+    names = sorted(set.union(set(), *(p for p, c in patterns)))
+    totals = { n: sum(c for p, c in patterns if n in p) for n in names }
+    matrix = OrderedDict()
+    for ref in names:
+        for pred in names:
+            tp = sum(c for p, c in patterns if ref in p and pred in p)
+            fp, fn = totals[pred] - tp, totals[ref] - tp
+            prec = tp / totals[pred] if totals[pred] else 0
+            rec = tp / totals[ref] if totals[ref] else 0
+            f = 2*prec*rec/(prec+rec) if prec+rec else 0
+            matrix[(ref, pred)] = (tp, fp, fn, prec, rec, f)
+    return matrix
+
+
+def format_agreement(stats):
+    lines = ['\t'.join(['type', 'reference', 'predicted', 'tp', 'fp', 'fn',
+                        'precision', 'recall', 'F1'])]
+    counts_by_type = OrderedDict(sorted(stats.annotation_by_type.items()))
+    counts_by_type['TOTAL'] = stats.annotation_totals
+    if stats.norm_totals:
+        for type_, counts in sorted(stats.norm_by_type.items()):
+            counts_by_type['{} (IDs)'.format(type_)] = counts
+        counts_by_type['TOTAL (IDs)'] = stats.norm_totals
+    for type_, counts in counts_by_type.items():
+        for (ref, pred), values in agreement_matrix(counts).items():
+            if ref == pred:
+                continue
+            tp, fp, fn, prec, rec, f = values
+            lines.append('{}\t{}\t{}\t{}\t{}\t{}\t{:.4f}\t{:.4f}\t{:.4f}'.\
+                         format(type_, ref, pred, tp, fp, fn, prec, rec, f))
+    return '\n'.join(lines)
+
+
 class Textbound(object):
     def __init__(self, id_, type_, span, text):
         self.id = id_
@@ -189,6 +285,8 @@ def parse_standoff(ann, source='<INPUT>', annset=None):
             except Exception as e:
                 error('line {} in {}: {}'.format(ln, source, l))
                 raise
+        elif l[0] == '#':
+            continue    # notes, e.g. consensus provenance
         else:
             warning('skipping line {} in {}: {}'.format(ln, source, l))
             continue
@@ -240,7 +338,23 @@ def group_overlapping(ann, overlapping):
     return same_span, contained, containing, other
 
 
-def compare_annsets(label, names, annsets, stats, options):
+def minority(asets, all_asets):
+    """Return datasets disagreeing with the majority on an annotation
+    found by asets: those finding it or those missing it, whichever are
+    fewer, and all datasets on a tie."""
+    missing = all_asets - asets
+    if not missing:
+        return set()
+    elif len(asets) < len(missing):
+        return set(asets)
+    elif len(missing) < len(asets):
+        return missing
+    else:
+        return set(all_asets)
+
+
+def compare_annsets(label, names, annsets, stats, options, out=None):
+    out = out if out is not None else sys.stdout
     if options.overlap:
         raise NotImplementedError()
     # Exact match; group by (start, end, type)
@@ -260,56 +374,87 @@ def compare_annsets(label, names, annsets, stats, options):
         asets = set(a.annset for a in group)
         asets_str = '/'.join(sorted(asets))
         doc_asets.add(tuple(sorted(a.annset for a in group)))
-        if len(all_asets) > 2 and len(asets) == 1:
-            mm_asets.add(list(asets)[0])    # odd one out
-        elif len(all_asets) > 2 and len(asets) == len(all_asets)-1:
-            mm_asets.add(list(all_asets-asets)[0])    # odd one out
+        mm_asets |= minority(asets, all_asets)
         stats.annotation_by_type[type_][asets_str] += 1
         stats.annotation_totals[asets_str] += 1
+    # Documents are classified by the datasets disagreeing on some
+    # annotation, or as mismatch-multiple if all do (always the case
+    # for two datasets)
     if len(doc_asets) == 0:
         stats.document_stats['match-all-empty'] += 1
     elif len(doc_asets) == 1 and list(doc_asets)[0] == tuple(sorted(all_asets)):
         stats.document_stats['match-all-nonempty'] += 1
-    elif len(mm_asets) == 1:
-        stats.document_stats['mismatch-{}'.format(mm_asets.pop())] += 1
+    elif mm_asets != all_asets:
+        stats.document_stats['mismatch-{}'.format(
+            '/'.join(sorted(mm_asets)))] += 1
     else:
         stats.document_stats['mismatch-multiple'] += 1
 
+    if options.norm:
+        # ID-level match; index by (start, end, type, canonical ID)
+        id_grouped = defaultdict(set)
+        for annset in annsets:
+            for a in annset:
+                for norm_id in canonical_ids(a, options.id_map):
+                    id_grouped[(a.start, a.end, a.type, norm_id)].add(
+                        a.annset)
+        for (start, end, type_, norm_id), asets in id_grouped.items():
+            asets_str = '/'.join(sorted(asets))
+            stats.norm_by_type[type_][asets_str] += 1
+            stats.norm_totals[asets_str] += 1
+
+    if options.matrix:
+        return    # agreement is output from stats
+
     # Instance output
-    for (start, end, type_), group in grouped.items():
-        # sanity
-        texts = set(a.text for a in group)
-        assert len(texts) == 1, 'text mismatch: {}'.format(texts)
-        text = texts.pop()
-        overlapping = find_overlapping(group[0], annsets, group)
-        if options.no_ids:
-            ids = '/'.join(sorted(a.annset for a in group))
-        else:
-            ids = '/'.join(sorted(a.id for a in group))
-        if options.no_spans:
-            type_span = type_
-        else:
-            type_span = '{} {} {}'.format(type_, start, end)
-        overlap_strs = []
-        for overlap_group in group_overlapping(group[0], overlapping):
-            overlap_strs.append(['{}/{}'.format(a.text, a.type) for a in overlap_group])
-        fields = [label, ids, type_span, text] + [sorted(set(s)) for s in overlap_strs]
-        print('\t'.join(str(f) for f in fields))
+    with phase('output'):
+        for (start, end, type_), group in grouped.items():
+            # sanity
+            texts = set(a.text for a in group)
+            assert len(texts) == 1, 'text mismatch: {}'.format(texts)
+            text = texts.pop()
+            overlapping = find_overlapping(group[0], annsets, group)
+            if options.no_ids:
+                ids = '/'.join(sorted(a.annset for a in group))
+            else:
+                ids = '/'.join(sorted(a.id for a in group))
+            if options.no_spans:
+                type_span = type_
+            else:
+                type_span = '{} {} {}'.format(type_, start, end)
+            overlap_strs = []
+            for overlap_group in group_overlapping(group[0], overlapping):
+                overlap_strs.append(['{}/{}'.format(a.text, a.type) for a in overlap_group])
+            fields = [label, ids, type_span, text] + [sorted(set(s)) for s in overlap_strs]
+            print('\t'.join(str(f) for f in fields), file=out)
 
 
 def compare_datasets(datasets, options):
     stats = ComparisonStats()
     name1, db1 = list(datasets.items())[0]
-    for key, val1 in db1.items():
+    items = docset_items(db1, options.suffix, options.ids, options.random,
+                         options.seed)
+    def count_expected():
+        count = count_docs(db1, options.suffix, options.ids, options.random)
+        return count if options.limit is None else min(count, options.limit)
+    progress = make_progress(options, 'compareannotations', count_expected)
+    # Datasets materialized with the same mapping need no mapping here
+    mapped = {
+        name: is_materialized(name, db, options.type_mapping)
+        for name, db in datasets.items()
+    }
+    others = list(datasets.items())[1:]
+    cache = options.result_cache
+    if cache is not None:
+        version = make_key(options.cache_version,
+                           json.dumps(mapped, sort_keys=True))
+    fetched = prefetch(fetch_values(items, [db for name, db in others]),
+                       options.prefetch)
+    for key, fetched_values in timed_iter(fetched, 'fetch'):
         if options.limit is not None and stats.compared_docs >= options.limit:
             break
-        if os.path.splitext(key)[1] != options.suffix:
-            continue
-        if options.random is not None and options.random < random():
-            continue
-        names, values, missing = [name1], [val1], False
-        for name, db in list(datasets.items())[1:]:
-            val = db.get(key)
+        names, values, missing = [name1], fetched_values[:1], False
+        for (name, db), val in zip(others, fetched_values[1:]):
             if val is None:
                 stats.missing_docs_by_dataset[name] += 1
                 warning('{} not found for {}'.format(key, name))
@@ -320,22 +465,83 @@ def compare_datasets(datasets, options):
         if missing:
             continue    # incomplete data
 
-        # Parse, map types, and filter to targeted types
+        if cache is None:
+            count = compare_document(key, names, values, mapped, stats,
+                                     options)
+        else:
+            count = cached_compare_document(key, names, values, mapped,
+                                            stats, cache, version, options)
+        stats.compared_docs += 1
+        progress.update(annotations=count)
+    progress.finish()
+    return stats
+
+
+def compare_document(key, names, values, mapped, stats, options,
+                     out=None):
+    """Compare annotation values of document, return annotation count."""
+    # Parse, map types, and filter to targeted types
+    with phase('parse'):
         annsets = [
             parse_standoff(val, '{}/{}'.format(name, key), name)
             for name, val in zip(names, values)
         ]
-        for annset in annsets:
-            for a in annset:
-                a.type = TYPE_MAP.get(a.type, a.type)
-        for i in range(len(annsets)):
-            annsets[i] = [a for a in annsets[i] if a.type in TARGET_TYPES]
-
-        # Run comparison
-        label = os.path.splitext(key)[0]
-        compare_annsets(label, names, annsets, stats, options)
-        stats.compared_docs += 1
-    return stats
+        for i, name in enumerate(names):
+            if not mapped[name]:
+                annsets[i] = options.type_mapping.apply(annsets[i])
+
+    # Run comparison (includes instance output phase)
+    label = os.path.splitext(key)[0]
+    with phase('compare'):
+        compare_annsets(label, names, annsets, stats, options, out)
+    return sum(len(a) for a in annsets)
+
+
+def cached_compare_document(key, names, values, mapped, stats, cache,
+                            version, options):
+    """Add stats and output instances for document, from cache if
+    available. Warnings are only issued when results are computed."""
+    cache_key = make_key(version, key, *chain.from_iterable(
+        zip(names, values)))
+    with phase('cache'):
+        result = cache.get(cache_key)
+    if result is None:
+        doc_stats, out = ComparisonStats(), io.StringIO()
+        count = compare_document(key, names, values, mapped, doc_stats,
+                                 options, out)
+        result = (doc_stats.to_dict(), out.getvalue(), count)
+        with phase('cache'):
+            cache.put(cache_key, result)
+    data, output, count = result
+    stats.add(data)
+    with phase('output'):
+        sys.stdout.write(output)
+    return count
+
+
+def cache_version(options, id_map_paths):
+    """Return hash of the code and options that per-document results
+    depend on."""
+    settings = {
+        k: getattr(options, k)
+        for k in ('overlap', 'norm', 'matrix', 'no_ids', 'no_spans')
+    }
+    settings['types'] = options.type_mapping.to_meta()
+    return make_key(code_version(__name__, 'idmap', 'typemap'),
+                    file_hash(*id_map_paths),
+                    json.dumps(settings, sort_keys=True))
+
+
+def is_materialized(name, db, mapping):
+    """Return True if DB only has annotations mapped with mapping."""
+    db_mapping = read_type_mapping(db.filename, db.tablename)
+    if db_mapping is None:
+        return False
+    elif db_mapping != mapping:
+        warning('{} materialized with other type mapping, remapping'.format(
+            name))
+        return False
+    return True
 
 
 def get_datasets(options):
@@ -353,13 +559,14 @@ def get_datasets(options):
             return None
         # No context manager (and no close()) as this is read-only and
         # close() can block for a long time for no apparent reason.
-        db = sqlitedict.SqliteDict(path, flag='r', autocommit=False)
-        datasets[name] = db
+        db = open_db(path, flag='r')
+        datasets[name] = timed_decode(db)
     return datasets
 
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
     if len(args.data) < 2:
         print('error: at least two NAME:DB arguments required',
               file=sys.stderr)
@@ -368,11 +575,29 @@ def main(argv):
         print('error: must have 0 < RATIO < 1 for --random',
               file=sys.stderr)
         return 1
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    id_map_paths = args.id_map if args.id_map else []
+    args.id_map = read_id_maps(id_map_paths)
+    args.type_mapping = make_type_mapping(args)
     datasets = get_datasets(args)
     if datasets is None:
         return 1
-    stats = compare_datasets(datasets, args)
-    print(stats, file=sys.stderr)
+    if args.cache is not None:
+        args.cache_version = cache_version(args, id_map_paths)
+    args.result_cache = open_cache(args)
+    try:
+        stats = compare_datasets(datasets, args)
+    finally:
+        if args.result_cache is not None:
+            args.result_cache.close()
+            print(args.result_cache, file=sys.stderr)
+    with phase('output'):
+        if args.matrix:
+            print(format_agreement(stats))
+        print(stats, file=sys.stderr)
+        if args.json is not None:
+            write_stats(args.json, 'compareannotations', stats.to_dict())
     return 0
 
 
@@ -0,0 +1,234 @@
+# Optional compressed value encoding for SQLiteDict DBs.
+
+# By default SqliteDict stores values as uncompressed pickles. A table
+# can instead be encoded with a codec (zlib, or zstd with an optional
+# dictionary trained on a sample of values), in which case the codec is
+# recorded in the '__meta__' table of the same DB file under the table
+# name, together with the storage layout of the table (see intkeydb.py).
+# open_db() reads the metadata and returns a SqliteDict (or IntKeyDict)
+# that encodes and decodes values transparently, so readers and writers
+# do not need to know how a DB is stored. Use recompress.py to convert
+# existing DBs. Long-running processes can call keep_open() so that DBs
+# opened read-only stay open for later open_db() calls (see annserver.py).
+
+import os
+import zlib
+import pickle
+import sqlite3
+
+from logging import error
+
+from intkeydb import STRING_LAYOUT, INTKEY_LAYOUT, IntKeyDict
+
+try:
+    import sqlitedict
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# SqliteDict default table
+TABLENAME = 'unnamed'
+
+# Table with codec metadata by table name
+META_TABLE = '__meta__'
+
+CODECS = ('zlib', 'zstd')
+
+DEFAULT_LEVEL = {
+    'zlib': 6,
+    'zstd': 9,
+}
+
+# Read-only DBs kept open by (path, table), None if not enabled (see
+# keep_open())
+_kept_open = None
+
+
+def import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        error('failed to import zstandard, try `pip3 install zstandard`')
+        raise
+    return zstandard
+
+
+class Codec(object):
+    """Compressed pickle encoding of values."""
+
+    def __init__(self, name, level=None, dictionary=None):
+        if name not in CODECS:
+            raise ValueError('unknown codec {}'.format(name))
+        if dictionary is not None and name != 'zstd':
+            raise ValueError('dictionary only supported for zstd')
+        self.name = name
+        self.level = level if level is not None else DEFAULT_LEVEL[name]
+        self.dictionary = dictionary
+        if name == 'zstd':
+            zstd = import_zstd()
+            if dictionary is not None:
+                dict_data = zstd.ZstdCompressionDict(dictionary)
+            else:
+                dict_data = None
+            self._compressor = zstd.ZstdCompressor(level=self.level,
+                                                   dict_data=dict_data)
+            self._decompressor = zstd.ZstdDecompressor(dict_data=dict_data)
+
+    def compress(self, data):
+        if self.name == 'zlib':
+            return zlib.compress(data, self.level)
+        else:
+            return self._compressor.compress(data)
+
+    def decompress(self, data):
+        if self.name == 'zlib':
+            return zlib.decompress(data)
+        else:
+            return self._decompressor.decompress(data)
+
+    def encode(self, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return sqlite3.Binary(self.compress(data))
+
+    def decode(self, data):
+        return pickle.loads(self.decompress(bytes(data)))
+
+    def to_meta(self):
+        return {
+            'codec': self.name,
+            'level': self.level,
+            'dictionary': self.dictionary,
+        }
+
+    @classmethod
+    def from_meta(cls, meta):
+        return cls(meta['codec'], meta['level'], meta['dictionary'])
+
+    def __str__(self):
+        if self.dictionary is None:
+            return '{} (level {})'.format(self.name, self.level)
+        return '{} (level {}, {} byte dictionary)'.format(
+            self.name, self.level, len(self.dictionary))
+
+
+def train_dictionary(samples, size):
+    """Return zstd dictionary bytes trained on sample values."""
+    zstd = import_zstd()
+    data = [pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL) for v in samples]
+    return zstd.train_dictionary(size, data).as_bytes()
+
+
+def read_meta(path, tablename=TABLENAME):
+    """Return codec metadata for table in DB, None if not compressed."""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+    try:
+        row = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+            (META_TABLE,)).fetchone()
+        if row is None:
+            return None
+        row = conn.execute(
+            'SELECT value FROM "{}" WHERE key=?'.format(META_TABLE),
+            (tablename,)).fetchone()
+    finally:
+        conn.close()
+    return sqlitedict.decode(row[0]) if row is not None else None
+
+
+def read_codec(path, tablename=TABLENAME):
+    meta = read_meta(path, tablename)
+    if meta is None or meta['codec'] is None:
+        return None
+    return Codec.from_meta(meta)
+
+
+def make_meta(codec=None, layout=STRING_LAYOUT, suffixes=None):
+    """Return metadata for table, None for default encoding and layout."""
+    if codec is None and layout == STRING_LAYOUT:
+        return None
+    meta = codec.to_meta() if codec is not None else { 'codec': None }
+    meta['layout'] = layout
+    if layout == INTKEY_LAYOUT:
+        meta['suffixes'] = list(suffixes)
+    return meta
+
+
+def write_meta(path, meta, tablename=TABLENAME):
+    """Record codec metadata for table in DB, remove record if None."""
+    with SqliteDict(path, tablename=META_TABLE, autocommit=False) as db:
+        if meta is not None:
+            db[tablename] = meta
+        elif tablename in db:
+            del db[tablename]
+        db.commit()
+
+
+def write_codec(path, codec, tablename=TABLENAME):
+    write_meta(path, make_meta(codec), tablename)
+
+
+def keep_open(cache_mb=None):
+    """Keep DBs opened read-only by this process open and return them
+    from later open_db() calls while the DB file is unchanged.
+
+    If cache_mb is given, the SQLite page cache of each DB is set to
+    that size so that pages read stay in memory across queries.
+    """
+    global _kept_open
+    _kept_open = {
+        'pid': os.getpid(),
+        'cache_kib': cache_mb * 1024 if cache_mb else None,
+        'dbs': {},
+    }
+
+
+def _open_kept(path, tablename):
+    stat = os.stat(path)
+    key = (os.path.realpath(path), tablename)
+    version = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    cached = _kept_open['dbs'].get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    # No close() for replaced DB as this is read-only and close() can block
+    db = _open_db(path, 'r', tablename, False)
+    if _kept_open['cache_kib'] is not None:
+        db.conn.execute('PRAGMA cache_size = -{}'.format(
+            _kept_open['cache_kib']))
+    _kept_open['dbs'][key] = (version, db)
+    return db
+
+
+def open_db(path, flag='c', tablename=TABLENAME, autocommit=False):
+    """Open SqliteDict or IntKeyDict for the layout and codec recorded
+    for the table.
+
+    With flag 'n' the DB is created anew without compression. With flag
+    'r' after keep_open(), an already open DB may be returned.
+    """
+    # Not in forked processes, where the DB connections are unusable
+    if (flag == 'r' and _kept_open is not None and
+        _kept_open['pid'] == os.getpid() and os.path.exists(path)):
+        return _open_kept(path, tablename)
+    return _open_db(path, flag, tablename, autocommit)
+
+
+def _open_db(path, flag, tablename, autocommit):
+    meta = read_meta(path, tablename) if flag != 'n' else None
+    if meta is None:
+        return SqliteDict(path, tablename=tablename, flag=flag,
+                          autocommit=autocommit)
+    codec = Codec.from_meta(meta) if meta['codec'] is not None else None
+    coding = {}
+    if codec is not None:
+        coding = { 'encode': codec.encode, 'decode': codec.decode }
+    if meta.get('layout', STRING_LAYOUT) == INTKEY_LAYOUT:
+        return IntKeyDict(path, tablename=tablename, flag=flag,
+                          autocommit=autocommit, suffixes=meta['suffixes'],
+                          **coding)
+    else:
+        return SqliteDict(path, tablename=tablename, flag=flag,
+                          autocommit=autocommit, **coding)
@@ -0,0 +1,109 @@
+# Support for restricting processing to a set or sample of document IDs.
+
+import os
+import sys
+import hashlib
+
+from intkeydb import count_keys
+
+# Default seed for document sampling
+DEFAULT_SEED = 0
+
+# Suffix and header of binary ID set files (see idset.py), recognized
+# here so that numpy is only needed when they are used
+BINARY_SUFFIX = '.idset'
+BINARY_MAGIC = b'IDSET\x00\x01\x00'
+
+
+def read_docset(path):
+    """Read document IDs, one per line, from file. Return sorted list.
+
+    Binary ID set files (see idset.py) are also accepted.
+    """
+    ids = set()
+    if is_binary_idset(path):
+        from idset import read_idset
+        ids.update(str(i) for i in read_idset(path).tolist())
+    else:
+        with open(path) as f:
+            for ln, l in enumerate(f, start=1):
+                l = l.strip()
+                if l:
+                    ids.add(l)
+    print('read {} IDs from {}'.format(len(ids), path), file=sys.stderr)
+    return sorted(ids)
+
+
+def write_docset(path, ids, merge=False):
+    """Write document IDs, one per line, to file.
+
+    If merge is True, IDs already in the file are kept. Paths with the
+    binary ID set suffix are written as binary ID sets (see idset.py).
+    """
+    ids = set(ids)
+    if merge and os.path.exists(path):
+        ids.update(read_docset(path))
+    if path.endswith(BINARY_SUFFIX):
+        from idset import write_idset, to_idset
+        write_idset(path, to_idset(ids))
+        return
+    with open(path, 'w') as out:
+        for id_ in sorted(ids):
+            print(id_, file=out)
+
+
+def is_binary_idset(path):
+    with open(path, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def in_sample(doc_id, ratio, seed=DEFAULT_SEED):
+    """Return True if document is in sample of given ratio.
+
+    The decision depends only on the document ID and seed, so the same
+    documents are sampled across runs, tools and datasets.
+    """
+    digest = hashlib.blake2b('{}:{}'.format(seed, doc_id).encode('utf-8'),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'big') < ratio * 2**64
+
+
+def count_docs(db, suffix, docset=None, ratio=None):
+    """Return (estimated) number of documents docset_items() yields."""
+    if docset is not None:
+        count = len(docset)
+    else:
+        # Count keys only, without reading values
+        count = count_keys(db, suffix)
+    if ratio is not None:
+        count = int(round(count * ratio))
+    return count
+
+
+def docset_items(db, suffix, docset=None, ratio=None, seed=DEFAULT_SEED):
+    """Iterate over (key, value) in DB with given suffix.
+
+    If docset is given, only values for documents in the set are looked
+    up by key, without scanning the DB. If ratio is given, only the
+    documents in_sample() are included, and sampling is done on keys
+    before values are read.
+    """
+    if docset is None and ratio is None:
+        for key, value in db.items():
+            if os.path.splitext(key)[1] == suffix:
+                yield key, value
+        return
+
+    if docset is not None:
+        keys = (id_ + suffix for id_ in docset)
+    else:
+        keys = (k for k in db.iterkeys() if os.path.splitext(k)[1] == suffix)
+    if ratio is not None:
+        keys = (k for k in keys
+                if in_sample(os.path.splitext(k)[0], ratio, seed))
+    # Keys are listed before lookups so that no query is pending while
+    # values are fetched.
+    for key in list(keys):
+        value = db.get(key)
+        if value is not None:
+            yield key, value
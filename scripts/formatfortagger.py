@@ -3,9 +3,12 @@
 import sys
 import os
 
-from random import random
 
-from sqlitedict import SqliteDict
+from docset import read_docset, docset_items, DEFAULT_SEED
+from profiling import add_profile_arguments, start_profiling
+from profiling import phase, timed_iter, timed_decode
+from dbcodec import open_db
+from prefetch import add_prefetch_arguments, prefetch
 
 
 def argparser():
@@ -19,7 +22,13 @@ def argparser():
     ap.add_argument('-r', '--random', metavar='RATIO', default=None,
                     type=float, help='process random RATIO of documents')
     ap.add_argument('-s', '--suffix', default='.txt', help='text file suffix')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only process documents with IDs in FILE')
+    ap.add_argument('--seed', metavar='SEED', type=int, default=DEFAULT_SEED,
+                    help='seed for --random document sampling')
     ap.add_argument('db', nargs='+')
+    add_prefetch_arguments(ap)
+    add_profile_arguments(ap)
     return ap
 
 
@@ -27,13 +36,11 @@ def process_db(dbpath, options):
     output_count = 0
     # No context manager (and no close()) as this is read-only and
     # close() can block for a long time for no apparent reason.
-    db = SqliteDict(dbpath, flag='r', autocommit=False)
-    for key, value in db.items():
+    db = timed_decode(open_db(dbpath, flag='r'))
+    items = docset_items(db, options.suffix, options.ids, options.random,
+                         options.seed)
+    for key, value in timed_iter(prefetch(items, options.prefetch), 'fetch'):
         root, ext = os.path.splitext(key)
-        if ext != options.suffix:
-            continue
-        if options.random is not None and options.random < random():
-            continue
 
         if options.id_prefix is None:
             doc_id = root
@@ -42,7 +49,8 @@ def process_db(dbpath, options):
 
         text = value.rstrip('\n').replace('\n', ' ').replace('\t', ' ')
 
-        print('{}\t<AUTHORS>\t<JOURNAL>\t<YEAR>\t{}'.format(doc_id, text))
+        with phase('output'):
+            print('{}\t<AUTHORS>\t<JOURNAL>\t<YEAR>\t{}'.format(doc_id, text))
 
         output_count += 1
         if options.limit is not None and output_count >= options.limit:
@@ -53,10 +61,13 @@ def process_db(dbpath, options):
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
     if args.random is not None and not 0 < args.random < 1:
         print('error: must have 0 < RATIO < 1 for --random',
               file=sys.stderr)
         return 1
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
     for dbpath in args.db:
         if not os.path.exists(dbpath):
             print('no such file: {}'.format(dbpath), file=sys.stderr)
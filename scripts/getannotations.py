@@ -9,12 +9,8 @@ import re
 from logging import warning, error
 
 from standoff import Textbound
-
-try:
-    from sqlitedict import SqliteDict
-except ImportError:
-    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
-    raise
+from profiling import add_profile_arguments, start_profiling
+from dbcodec import open_db
 
 
 def argparser():
@@ -29,6 +25,7 @@ def argparser():
     ap.add_argument('ids', metavar='IDS',
                     help='list of DOC-ID<TAB>ANN-ID to output')
     ap.add_argument('data', metavar='DB', help='database')
+    add_profile_arguments(ap)
     return ap
 
 
@@ -69,7 +66,7 @@ def normalize_space(s):
 
 def get_annotations(dbpath, ids, options):
     # No context manager: close() can block and this is read-only
-    db = SqliteDict(dbpath, flag='r', autocommit=False)
+    db = open_db(dbpath, flag='r')
     for docid, annid in ids:
         so_key = docid + options.ann_suffix
         so = db.get(so_key)
@@ -104,6 +101,7 @@ def read_ids(fn, options):
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
     if args.words < 1:
         error('invalid --words NUM {}'.format(args.words))
         return 1
@@ -0,0 +1,55 @@
+# Support for matching annotations on normalized IDs.
+
+# ID maps give equivalences between normalization IDs, such as merged
+# NCBI taxonomy IDs, as a dict mapping IDs to canonical IDs.
+
+import sys
+
+
+# Normalization DB/ontology prefixes
+TAXONOMY_PREFIX = 'NCBITaxon:'
+
+
+def read_id_map(path, id_map=None):
+    """Read ID map from file, return dict mapping IDs to canonical IDs.
+
+    The file is either TSV with old and new ID on each line or NCBI
+    taxonomy merged.dmp, for which IDs both with and without the
+    NCBITaxon: prefix are mapped.
+    """
+    if id_map is None:
+        id_map = {}
+    count = 0
+    with open(path) as f:
+        for ln, l in enumerate(f, start=1):
+            l = l.rstrip('\n')
+            if not l:
+                continue
+            if '\t|\t' in l:
+                old_id, new_id = l.split('\t')[::2][:2]    # skip separators
+                id_map[TAXONOMY_PREFIX+old_id] = TAXONOMY_PREFIX+new_id
+            else:
+                old_id, new_id = l.split('\t')[:2]
+            id_map[old_id] = new_id
+            count += 1
+    print('read {} ID mappings from {}'.format(count, path), file=sys.stderr)
+    return id_map
+
+
+def read_id_maps(paths):
+    id_map = {}
+    for path in paths:
+        read_id_map(path, id_map)
+    return id_map
+
+
+def canonical_ids(textbound, id_map):
+    """Return set of canonical normalization IDs for textbound.
+
+    Textbounds without normalizations have the ID None, so that these
+    match only each other.
+    """
+    if not textbound.normalizations:
+        return { None }
+    return set(id_map.get(n.norm_id, n.norm_id)
+               for n in textbound.normalizations)
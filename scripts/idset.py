@@ -0,0 +1,84 @@
+# Compact sets of integer document IDs.
+
+# ID sets are sorted numpy arrays of unique uint32 document IDs, so that
+# set operations are vectorized. They are stored either as text, one ID
+# per line as read by read_docset(), or, for files with the suffix
+# BINARY_SUFFIX, as MAGIC followed by the IDs as little-endian uint32.
+# Binary files are memory-mapped on reading.
+
+import os
+
+from logging import warning, error
+
+from intkeydb import IntKeyDict, select_keys
+from docset import BINARY_SUFFIX, BINARY_MAGIC as MAGIC, is_binary_idset
+
+try:
+    import numpy as np
+except ImportError:
+    error('failed to import numpy, try `pip3 install numpy`')
+    raise
+
+
+DTYPE = np.dtype('<u4')
+
+
+def to_idset(ids):
+    """Return ID set for iterable of int or str document IDs."""
+    ids = np.fromiter((int(i) for i in ids), dtype=np.int64)
+    if ids.size and (ids.min() < 0 or ids.max() > np.iinfo(DTYPE).max):
+        raise ValueError('document ID out of uint32 range')
+    return np.unique(ids.astype(DTYPE))
+
+
+def read_idset(path):
+    if is_binary_idset(path):
+        if os.path.getsize(path) == len(MAGIC):
+            return np.zeros(0, dtype=DTYPE)
+        return np.memmap(path, dtype=DTYPE, mode='r', offset=len(MAGIC))
+    with open(path) as f:
+        return to_idset(l for l in (l.strip() for l in f) if l)
+
+
+def write_idset(path, ids):
+    """Write ID set to file, binary if path has BINARY_SUFFIX."""
+    ids = np.asarray(ids, dtype=DTYPE)
+    if path.endswith(BINARY_SUFFIX):
+        with open(path, 'wb') as out:
+            out.write(MAGIC)
+            ids.tofile(out)
+    else:
+        with open(path, 'w') as out:
+            for id_ in ids.tolist():
+                print(id_, file=out)
+
+
+def db_idset(db, suffix=None):
+    """Return ID set of documents with key suffix (any suffix if None)
+    in DB from keys only."""
+    if isinstance(db, IntKeyDict):
+        return np.unique(np.fromiter(db.doc_ids(suffix), dtype=DTYPE))
+    def ids():
+        for key in select_keys(db, suffix):
+            if suffix is not None:
+                root = key[:-len(suffix)]
+            else:
+                root = os.path.splitext(key)[0]
+            if root.isascii() and root.isdigit():
+                yield int(root)
+            else:
+                warning('skipping non-integer document ID: {}'.format(key))
+    return np.unique(np.fromiter(ids(), dtype=DTYPE))
+
+
+def intersection(a, b):
+    return np.intersect1d(a, b, assume_unique=True)
+
+
+def difference(a, b):
+    """Return IDs in a but not in b."""
+    return np.setdiff1d(a, b, assume_unique=True)
+
+
+def union(a, b):
+    return np.union1d(a, b)
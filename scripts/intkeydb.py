@@ -0,0 +1,326 @@
+# Integer-keyed storage layout for document DBs.
+
+# In the default (string) layout, SqliteDict tables are keyed by text
+# keys such as '12345678.txt'. In the integer-keyed layout, the key is
+# the pair (document ID, suffix code), where the suffix code is the
+# index of the key suffix in a list recorded in the DB metadata (see
+# dbcodec.py). The pair is packed into the integer rowid of the table
+# (doc_id << SUFFIX_BITS | code), so that no key text or separate key
+# index is stored and lookups go directly to the row. An index on the
+# text of the document ID gives iteration in string key order and
+# queries on keys that do not read values. IntKeyDict gives access
+# under the string form of the keys with the same interface as
+# SqliteDict, and the functions below query either layout. Only keys
+# with canonical non-negative integer IDs and listed suffixes can be
+# stored.
+
+import os
+import sqlite3
+
+from logging import error
+
+try:
+    import sqlitedict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+STRING_LAYOUT = 'string'
+INTKEY_LAYOUT = 'intkey'
+
+LAYOUTS = (STRING_LAYOUT, INTKEY_LAYOUT)
+
+# Key suffixes in sorted order, so that ordering by (text of doc ID,
+# suffix code) gives the same order as string keys
+DEFAULT_SUFFIXES = ('.ann', '.json', '.txt', '.xml')
+
+SUFFIX_BITS = 4
+
+# SQL expressions for the parts of the packed key
+DOC_ID = 'id >> {}'.format(SUFFIX_BITS)
+SUFFIX = 'id & {}'.format((1 << SUFFIX_BITS) - 1)
+
+# Expressions of index giving string key order
+DOC_TEXT = 'CAST({} AS TEXT)'.format(DOC_ID)
+STRING_ORDER = '{}, {}'.format(DOC_TEXT, SUFFIX)
+
+ORDER_INDEX = '{}.keyorder'
+
+
+def create_table(conn, tablename, layout=STRING_LAYOUT):
+    if layout == STRING_LAYOUT:
+        conn.execute('CREATE TABLE IF NOT EXISTS "{}" '
+                     '(key TEXT PRIMARY KEY, value BLOB)'.format(tablename))
+    else:
+        conn.execute('CREATE TABLE IF NOT EXISTS "{}" '
+                     '(id INTEGER PRIMARY KEY, value BLOB)'.format(tablename))
+        conn.execute('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+            ORDER_INDEX.format(tablename), tablename, STRING_ORDER))
+
+
+def table_columns(layout=STRING_LAYOUT):
+    if layout == STRING_LAYOUT:
+        return 'key, value'
+    else:
+        return 'id, value'
+
+
+class IntKeyDict(object):
+    """Dict-like access to integer-keyed table under string keys."""
+
+    def __init__(self, filename, tablename='unnamed', flag='c',
+                 autocommit=False, encode=sqlitedict.encode,
+                 decode=sqlitedict.decode, suffixes=DEFAULT_SUFFIXES):
+        if len(suffixes) > 1 << SUFFIX_BITS:
+            raise ValueError('too many suffixes: {}'.format(suffixes))
+        self.filename = filename
+        self.tablename = tablename
+        self.flag = flag
+        self.autocommit = autocommit
+        self.encode = encode
+        self.decode = decode
+        self.suffixes = tuple(suffixes)
+        self.suffix_code = { s: i for i, s in enumerate(self.suffixes) }
+        # Usable from other threads like SqliteDict, e.g. for prefetch()
+        if flag == 'r':
+            self.conn = sqlite3.connect('file:{}?mode=ro'.format(filename),
+                                        uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(filename, check_same_thread=False)
+            if flag == 'n':
+                self.conn.execute('DROP TABLE IF EXISTS "{}"'.format(
+                    tablename))
+            create_table(self.conn, tablename, INTKEY_LAYOUT)
+            self.conn.commit()
+
+    def pack_key(self, key):
+        """Return packed integer key, None if key not representable."""
+        root, suffix = os.path.splitext(key)
+        code = self.suffix_code.get(suffix)
+        if (code is None or not (root.isascii() and root.isdigit()) or
+            str(int(root)) != root):
+            return None
+        return int(root) << SUFFIX_BITS | code
+
+    def unpack_key(self, id_):
+        return str(id_ >> SUFFIX_BITS) + self.suffixes[
+            id_ & ((1 << SUFFIX_BITS) - 1)]
+
+    def _pack_or_fail(self, key):
+        id_ = self.pack_key(key)
+        if id_ is None:
+            raise ValueError('key {} not representable in {} layout'.format(
+                key, INTKEY_LAYOUT))
+        return id_
+
+    def _select(self, columns, where='', args=(), order='id',
+                keys_only=False):
+        query = 'SELECT {} FROM "{}"'.format(columns, self.tablename)
+        if keys_only:
+            query += ' INDEXED BY "{}"'.format(
+                ORDER_INDEX.format(self.tablename))
+        if where:
+            query += ' WHERE ' + where
+        if order:
+            query += ' ORDER BY ' + order
+        # Fetch via separate cursor so that lookups can be made while
+        # iterating.
+        return self.conn.cursor().execute(query, args)
+
+    def __len__(self):
+        return self._select('COUNT(*)', order=None,
+                            keys_only=True).fetchone()[0]
+
+    def __bool__(self):
+        return self._select('1', order=None).fetchone() is not None
+
+    def __contains__(self, key):
+        id_ = self.pack_key(key)
+        if id_ is None:
+            return False
+        return self._select('1', 'id = ?', (id_,),
+                            None).fetchone() is not None
+
+    def __getitem__(self, key):
+        id_ = self.pack_key(key)
+        row = None
+        if id_ is not None:
+            row = self._select('value', 'id = ?', (id_,), None).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.decode(row[0])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self.update([(key, value)])
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.conn.execute('DELETE FROM "{}" WHERE id = ?'.format(
+            self.tablename), (self.pack_key(key),))
+        if self.autocommit:
+            self.commit()
+
+    def update(self, items=(), **kwds):
+        if hasattr(items, 'items'):
+            items = items.items()
+        items = list(items) + list(kwds.items())
+        rows = [
+            (self._pack_or_fail(key), self.encode(value))
+            for key, value in items
+        ]
+        self.conn.executemany('REPLACE INTO "{}" (id, value) '
+                              'VALUES (?, ?)'.format(self.tablename), rows)
+        if self.autocommit:
+            self.commit()
+
+    def iterkeys(self):
+        """Iterate over keys in string key order."""
+        for (id_,) in self._select('id', order=STRING_ORDER, keys_only=True):
+            yield self.unpack_key(id_)
+
+    def itervalues(self):
+        for (value,) in self._select('value'):
+            yield self.decode(value)
+
+    def iteritems(self):
+        for id_, value in self._select('id, value'):
+            yield self.unpack_key(id_), self.decode(value)
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def keys(self):
+        return self.iterkeys()
+
+    def values(self):
+        return self.itervalues()
+
+    def items(self):
+        return self.iteritems()
+
+    def doc_ids(self, suffix=None):
+        """Iterate over integer IDs of documents with key suffix, or of
+        all keys (with repeats) if suffix is None."""
+        if suffix is None:
+            where, args = '', ()
+        elif suffix in self.suffix_code:
+            where, args = '{} = ?'.format(SUFFIX), (self.suffix_code[suffix],)
+        else:
+            return
+        for (doc_id,) in self._select(DOC_ID, where, args, None,
+                                      keys_only=True):
+            yield doc_id
+
+    def count_suffix(self, suffix):
+        code = self.suffix_code.get(suffix)
+        if code is None:
+            return 0
+        return self._select('COUNT(*)', '{} = ?'.format(SUFFIX), (code,),
+                            None, keys_only=True).fetchone()[0]
+
+    def clear(self):
+        self.conn.execute('DELETE FROM "{}"'.format(self.tablename))
+        if self.autocommit:
+            self.commit()
+
+    def commit(self, blocking=True):
+        if self.flag != 'r':
+            self.conn.commit()
+
+    def close(self, do_log=True, force=False):
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def count_keys(db, suffix):
+    """Return number of keys with suffix in DB of either layout."""
+    if isinstance(db, IntKeyDict):
+        return db.count_suffix(suffix)
+    return db.conn.select_one(
+        'SELECT COUNT(*) FROM "{}" WHERE key LIKE ?'.format(db.tablename),
+        ('%' + suffix,))[0]
+
+
+def select_keys(db, suffix=None):
+    """Iterate over keys (with suffix) of DB of either layout without
+    reading values. The order is unspecified."""
+    if isinstance(db, IntKeyDict):
+        if suffix is None:
+            yield from db.iterkeys()
+        else:
+            for doc_id in db.doc_ids(suffix):
+                yield str(doc_id) + suffix
+        return
+    query = 'SELECT key FROM "{}"'.format(db.tablename)
+    if suffix is None:
+        yield from (key for (key,) in db.conn.select(query))
+    else:
+        query += ' WHERE key LIKE ?'
+        for (key,) in db.conn.select(query, ('%' + suffix,)):
+            if key.endswith(suffix):    # LIKE ignores case
+                yield key
+
+
+def sorted_keys(db):
+    """Iterate over keys of DB of either layout in string order."""
+    if isinstance(db, IntKeyDict):
+        yield from db.iterkeys()
+    else:
+        query = 'SELECT key FROM "{}" ORDER BY key'.format(db.tablename)
+        for (key,) in db.conn.select(query):
+            yield key
+
+
+def sorted_range(db, start, end=None):
+    """Iterate over (key, undecoded value) for start <= key < end in DB
+    of either layout in string order. Decode values with db.decode."""
+    if not isinstance(db, IntKeyDict):
+        query = 'SELECT key, value FROM "{}" WHERE key >= ?'.format(
+            db.tablename)
+        args = [start]
+        if end is not None:
+            query += ' AND key < ?'
+            args.append(end)
+        query += ' ORDER BY key'
+        yield from db.conn.select(query, tuple(args))
+        return
+
+    def bound(key):
+        # (text of doc ID, suffix code) comparing like key
+        root, suffix = os.path.splitext(key)
+        if suffix in db.suffix_code:
+            return root, db.suffix_code[suffix]
+        # Unknown suffix, between codes of neighbouring suffixes
+        return root, sum(1 for s in db.suffixes if s < suffix) - 0.5
+    # Only the document ID part of the bounds can be used to search the
+    # index, suffixes are checked here.
+    low, high = bound(start), bound(end) if end is not None else None
+    where, args = '{} >= ?'.format(DOC_TEXT), (low[0],)
+    if high is not None:
+        where += ' AND {} <= ?'.format(DOC_TEXT)
+        args += (high[0],)
+    mask = (1 << SUFFIX_BITS) - 1
+    for id_, value in db._select('id, value', where, args, STRING_ORDER,
+                                 keys_only=True):
+        current = (str(id_ >> SUFFIX_BITS), id_ & mask)
+        if current < low:
+            continue
+        elif high is not None and current >= high:
+            break
+        yield db.unpack_key(id_), value
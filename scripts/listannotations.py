@@ -3,36 +3,46 @@
 import sys
 import os
 
-from random import random
 from logging import error
 
-from sqlitedict import SqliteDict
+
+from docset import read_docset, docset_items, DEFAULT_SEED
+from profiling import add_profile_arguments, start_profiling
+from profiling import phase, timed_iter, timed_decode
+from dbcodec import open_db
+from prefetch import add_prefetch_arguments, prefetch
 
 
 def argparser():
     from argparse import ArgumentParser
     ap = ArgumentParser(description='List annotations in SQLiteDict DB.')
     ap.add_argument('-r', '--random', metavar='RATIO', default=None,
-                    type=float, help='List random annotations')
+                    type=float,
+                    help='List annotations in random RATIO of documents')
     ap.add_argument('-s', '--suffix', default='.ann',
                     help='Suffix for keys with annotation values')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='Only list documents with IDs in FILE')
+    ap.add_argument('--seed', metavar='SEED', type=int, default=DEFAULT_SEED,
+                    help='Seed for --random document sampling')
     ap.add_argument('db', metavar='DB', help='database file')
+    add_prefetch_arguments(ap)
+    add_profile_arguments(ap)
     return ap
 
 
 def list_annotations(dbname, options):
     # No context manager: close() can block and this is read-only
     doc_count, ann_count = 0, 0
-    db = SqliteDict(dbname, flag='r', autocommit=False)
-    for k, v in db.iteritems():
+    db = timed_decode(open_db(dbname, flag='r'))
+    items = docset_items(db, options.suffix, options.ids, options.random,
+                         options.seed)
+    for k, v in timed_iter(prefetch(items, options.prefetch), 'fetch'):
         root, ext = os.path.splitext(os.path.basename(k))
-        if ext != options.suffix:
-            continue
-        for line in v.splitlines():
-            if options.random is not None and random() > options.random:
-                continue
-            print('{}\t{}'.format(root, line))
-            ann_count += 1
+        with phase('output'):
+            for line in v.splitlines():
+                print('{}\t{}'.format(root, line))
+                ann_count += 1
         doc_count += 1
     print('Done, listed {} annotations in {} docs from {}'.format(
         ann_count, doc_count, dbname), file=sys.stderr)
@@ -40,12 +50,15 @@ def list_annotations(dbname, options):
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
     if args.random is not None and not (0.0 < args.random < 1.0):
         print('expecting 0 < RATIO < 1 for --random', file=sys.stderr)
         return 1
     if not os.path.exists(args.db):
         print('no such file: {}'.format(args.db), file=sys.stderr)
         return 1
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
     list_annotations(args.db, args)
     return 0
 
@@ -1,37 +1,136 @@
 #!/usr/bin/env python
 
+# List keys or document IDs in SQLiteDict DBs.
+
+# Keys are read from the DB without reading values. With --intersect
+# or --difference, the document IDs in the DBs are combined with those
+# in other DBs or in ID listings (text or binary ID sets, see idset.py),
+# which requires numpy.
+
 import sys
 import os
 
-from sqlitedict import SqliteDict
+
+from profiling import add_profile_arguments, start_profiling
+from dbcodec import open_db
+from intkeydb import select_keys
+from docset import BINARY_SUFFIX
+
+# Header of SQLite database files
+SQLITE_MAGIC = b'SQLite format 3\x00'
 
 
 def argparser():
     from argparse import ArgumentParser
     ap = ArgumentParser(description='List keys in SQLiteDict DB.')
+    ap.add_argument('-d', '--difference', metavar='SOURCE', default=[],
+                    action='append',
+                    help='exclude IDs in DB or ID listing (repeatable)')
+    ap.add_argument('-i', '--intersect', metavar='SOURCE', default=[],
+                    action='append',
+                    help='only include IDs in DB or ID listing (repeatable)')
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='output file (binary ID set if ending in .idset)')
+    ap.add_argument('-s', '--suffix', default=None,
+                    help='only list keys with suffix (e.g. .txt)')
+    ap.add_argument('-S', '--strip', default=False, action='store_true',
+                    help='strip suffixes, listing document IDs')
     ap.add_argument('db', nargs='+')
+    add_profile_arguments(ap)
     return ap
 
 
-def list_db(dbname):
+def is_sqlite(path):
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def strip_suffix(key, suffix):
+    if suffix is not None:
+        return key[:-len(suffix)]
+    else:
+        return os.path.splitext(key)[0]
+
+
+def list_db(dbname, out, suffix=None, strip=False):
     # No context manager (and no close()) as this is read-only and
     # close() can block for a long time for no apparent reason.
-    db = SqliteDict(dbname, flag='r', autocommit=False)
-    for k in db:
-        print(k)
+    db = open_db(dbname, flag='r')
+    previous = None
+    for k in select_keys(db, suffix):
+        if strip:
+            k = strip_suffix(k, suffix)
+            if k == previous:
+                continue    # other suffix for same document
+            previous = k
+        print(k, file=out)
+
+
+def read_ids(path, suffix=None):
+    from idset import read_idset, db_idset
+    if is_sqlite(path):
+        # No close() as this is read-only and close() can block
+        return db_idset(open_db(path, flag='r'), suffix)
+    else:
+        return read_idset(path)
+
+
+def combine_ids(dbnames, options):
+    from idset import union, intersection, difference
+    ids = None
+    for dbname in dbnames:
+        db_ids = read_ids(dbname, options.suffix)
+        ids = db_ids if ids is None else union(ids, db_ids)
+    for path in options.intersect:
+        ids = intersection(ids, read_ids(path, options.suffix))
+    for path in options.difference:
+        ids = difference(ids, read_ids(path, options.suffix))
+    return ids
+
+
+def write_ids(ids, options):
+    from idset import write_idset
+    if options.output is not None:
+        write_idset(options.output, ids)
+    else:
+        for id_ in ids.tolist():
+            print(id_)
 
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
+    for path in args.intersect + args.difference:
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    dbnames = []
     for dbname in args.db:
         if not os.path.exists(dbname):
             print('no such file: {}'.format(dbname), file=sys.stderr)
             continue
+        dbnames.append(dbname)
+
+    if (args.intersect or args.difference or
+        (args.output is not None and args.output.endswith(BINARY_SUFFIX))):
+        # Set operations and binary output are on document IDs
+        if not dbnames:
+            return 1
+        try:
+            write_ids(combine_ids(dbnames, args), args)
+        except BrokenPipeError:
+            pass
+        return 0
+
+    out = open(args.output, 'w') if args.output is not None else sys.stdout
+    for dbname in dbnames:
         try:
-            list_db(dbname)
+            list_db(dbname, out, args.suffix, args.strip)
         except BrokenPipeError:
             # Suppress exception when used in pipe with e.g. head
             break
+    if args.output is not None:
+        out.close()
     return 0
 
 
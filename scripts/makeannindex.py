@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+# Build or update inverted index from normalization IDs and types to
+# documents for annotation DBs. See annindex.py.
+
+# A full build writes the postings collected for each batch of
+# documents as sorted runs into a temporary table and merges the runs
+# of each term once at the end, so that the cost does not depend on the
+# number of batches. With --ids, the stored postings of the terms of
+# changed documents are read, updated and rewritten instead.
+
+import sys
+import os
+import heapq
+import sqlite3
+
+from collections import defaultdict
+from itertools import groupby
+from logging import warning, error
+
+from docset import read_docset, docset_items
+from annindex import DOCS_TABLE, RUNS_TABLE, AUXILIARY_SUFFIXES
+from annindex import document_terms, create_postings_table
+from annindex import encode_postings, decode_postings, merge_postings
+from annindex import read_postings, iter_postings
+from dbcodec import open_db
+from mergesqlite import BATCH_SIZE
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Build annotation index.')
+    ap.add_argument('-b', '--batch-size', metavar='N', type=int,
+                    default=10000000,
+                    help='postings entries to collect before writing')
+    ap.add_argument('-s', '--suffix', default='.ann',
+                    help='suffix of annotation keys')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only update index for documents with IDs in FILE')
+    ap.add_argument('index', metavar='INDEX', help='index DB')
+    ap.add_argument('data', metavar='NAME:DB', nargs='+',
+                    help='dataset name and path')
+    return ap
+
+
+class IndexWriter(object):
+    def __init__(self, path, name, batch_size, clear=False):
+        self.name = name
+        self.runs_table = RUNS_TABLE.format(name)
+        self.incremental = not clear
+        self.run = 0
+        self.conn = sqlite3.connect(path, timeout=60)
+        if clear:
+            self.conn.execute('DROP TABLE IF EXISTS "{}"'.format(name))
+            self.conn.execute('DROP TABLE IF EXISTS "{}"'.format(
+                self.runs_table))
+            self.conn.execute('CREATE TABLE "{}" (term TEXT, run INTEGER,'
+                              ' postings BLOB, PRIMARY KEY (term, run))'.\
+                              format(self.runs_table))
+        create_postings_table(self.conn, name)
+        self.conn.commit()
+        columns = [r[1] for r in self.conn.execute(
+            'PRAGMA table_info("{}")'.format(name))]
+        if columns != ['term', 'postings']:
+            raise ValueError('table {} in {} has other format, rebuild'
+                             ' index'.format(name, path))
+        self.docs_db = SqliteDict(path, tablename=DOCS_TABLE.format(name),
+                                  autocommit=False)
+        self.batch_size = batch_size
+        if clear:
+            self.docs_db.clear()
+        self.reset()
+
+    def reset(self):
+        self.added = defaultdict(list)
+        self.removed = defaultdict(list)
+        self.doc_terms = []
+        self.entries = 0
+
+    def old_terms(self, doc_id):
+        return set(self.docs_db.get(str(doc_id), []))
+
+    def update(self, doc_id, old_terms, new_terms):
+        for term in new_terms - old_terms:
+            self.added[term].append(doc_id)
+        for term in old_terms - new_terms:
+            self.removed[term].append(doc_id)
+        self.doc_terms.append((doc_id, new_terms))
+        self.entries += len(new_terms) + len(old_terms)
+        if self.entries >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Commit each table before writing the other, as they share a
+        # file and only one connection can hold a write transaction.
+        for doc_id, terms in self.doc_terms:
+            if terms:
+                self.docs_db[str(doc_id)] = sorted(terms)
+            elif str(doc_id) in self.docs_db:
+                del self.docs_db[str(doc_id)]
+        self.docs_db.commit()
+        if self.incremental:
+            self.update_postings()
+        else:
+            self.write_run()
+        self.conn.commit()
+        self.reset()
+
+    def write_run(self):
+        self.conn.executemany(
+            'INSERT INTO "{}" (term, run, postings) VALUES (?, ?, ?)'.\
+            format(self.runs_table),
+            ((term, self.run, encode_postings(sorted(doc_ids)))
+             for term, doc_ids in self.added.items()))
+        self.run += 1
+
+    def merge_runs(self):
+        """Write postings of each term merged from its runs."""
+        cursor = self.conn.execute(
+            'SELECT term, postings FROM "{}" ORDER BY term, run'.format(
+                self.runs_table))
+        batch = []
+        for term, rows in groupby(cursor, key=lambda r: r[0]):
+            runs = [data for term, data in rows]
+            if len(runs) == 1:
+                data = runs[0]
+            else:
+                data = encode_postings(heapq.merge(*map(iter_postings, runs)))
+            batch.append((term, data))
+            if len(batch) >= BATCH_SIZE:
+                self.insert_postings(batch)
+                batch = []
+        self.insert_postings(batch)
+        self.conn.execute('DROP TABLE "{}"'.format(self.runs_table))
+        self.conn.commit()
+
+    def insert_postings(self, batch):
+        self.conn.executemany(
+            'INSERT INTO "{}" (term, postings) VALUES (?, ?)'.format(
+                self.name), batch)
+
+    def update_postings(self):
+        for term in set(self.added) | set(self.removed):
+            data = read_postings(self.conn, self.name, term)
+            postings = decode_postings(data) if data is not None else []
+            postings = merge_postings(postings, sorted(self.added[term]),
+                                      self.removed[term])
+            if postings:
+                self.conn.execute(
+                    'REPLACE INTO "{}" (term, postings) VALUES (?, ?)'.\
+                    format(self.name), (term, encode_postings(postings)))
+            elif data is not None:
+                self.conn.execute('DELETE FROM "{}" WHERE term = ?'.format(
+                    self.name), (term,))
+
+    def close(self):
+        self.flush()
+        if not self.incremental:
+            self.merge_runs()
+        self.conn.close()
+        self.docs_db.close()
+
+
+def parse_doc_id(key):
+    try:
+        return int(os.path.splitext(key)[0])
+    except ValueError:
+        warning('skipping non-integer document ID: {}'.format(key))
+        return None
+
+
+def index_dataset(index_path, name, dbpath, options):
+    # No close() as this is read-only and close() can block
+    db = open_db(dbpath, flag='r')
+    incremental = options.ids is not None
+    writer = IndexWriter(index_path, name, options.batch_size,
+                         clear=not incremental)
+    if incremental:
+        keys = [id_ + options.suffix for id_ in options.ids]
+        items = ((key, db.get(key)) for key in keys)
+    else:
+        items = docset_items(db, options.suffix)
+    count = 0
+    for key, value in items:
+        doc_id = parse_doc_id(key)
+        if doc_id is None:
+            continue
+        old_terms = writer.old_terms(doc_id) if incremental else set()
+        new_terms = document_terms(value) if value is not None else set()
+        writer.update(doc_id, old_terms, new_terms)
+        count += 1
+    writer.close()
+    return count
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    datasets = []
+    for d in args.data:
+        if ':' in d:
+            name, path = d.split(':', 1)
+        else:
+            name, path = os.path.splitext(os.path.basename(d))[0], d
+        if name.endswith(AUXILIARY_SUFFIXES):
+            print('error: invalid dataset name {}'.format(name),
+                  file=sys.stderr)
+            return 1
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+        datasets.append((name, path))
+    for name, path in datasets:
+        try:
+            count = index_dataset(args.index, name, path, args)
+        except ValueError as e:
+            print('error: {}'.format(e), file=sys.stderr)
+            return 1
+        print('Indexed {} documents from {} as {}'.format(count, path, name),
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+# Build consensus annotation DB by voting over annotation sets.
+
+# Each annotation set gives at most one vote for each candidate
+# annotation, and candidates with at least K votes are kept. Candidates
+# are identical (start, end, type) spans or, with --overlap, clusters
+# of overlapping spans of the same type. The sets voting for each kept
+# annotation are recorded as brat AnnotatorNotes ("#") lines.
+
+# Documents are split into contiguous key ranges that are processed in
+# parallel, each streaming the annotation DBs in key order so that only
+# one document is in memory at a time. Completed ranges are marked and
+# skipped when the script is rerun.
+
+import sys
+import os
+import heapq
+import shutil
+
+from collections import Counter, OrderedDict
+from itertools import groupby
+from multiprocessing import Pool
+from logging import error
+
+from standoff import parse_standoff
+from typemap import add_type_arguments, make_type_mapping
+from mergesqlite import BATCH_SIZE, merge_dbs
+from dbcodec import open_db
+from intkeydb import sorted_keys, sorted_range
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# Marker for completed range plan in work directory
+PLAN_DONE = 'plan.done'
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Build consensus annotation DB.')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=4,
+                    help='number of parallel processes')
+    ap.add_argument('-k', '--min-votes', metavar='K', type=int, default=None,
+                    help='minimum votes to keep annotation (default majority)')
+    ap.add_argument('-K', '--type-votes', metavar='TYPE:K[,...]',
+                    default=None, help='minimum votes by type')
+    ap.add_argument('-n', '--shards', metavar='N', type=int, default=100,
+                    help='number of key ranges')
+    ap.add_argument('-N', '--norm-agreement', default=False,
+                    action='store_true',
+                    help='only count votes agreeing on normalization')
+    ap.add_argument('-o', '--overlap', default=False, action='store_true',
+                    help='accept annotation overlap as match')
+    ap.add_argument('-s', '--suffix', default='.ann',
+                    help='suffix of annotation keys')
+    ap.add_argument('-w', '--workdir', metavar='DIR', default=None,
+                    help='directory for shard DBs (default OUTPUT.shards)')
+    ap.add_argument('output', metavar='DB', help='output DB')
+    ap.add_argument('data', metavar='NAME:DB', nargs='+',
+                    help='dataset name and path')
+    add_type_arguments(ap, targets=False)
+    return ap
+
+
+def parse_type_votes(spec, mapping):
+    min_votes = {}
+    for t in spec.split(','):
+        type_, votes = t.rsplit(':', 1)
+        min_votes[mapping.map_type(type_)] = int(votes)
+    return min_votes
+
+
+def shard_path(workdir, index, suffix):
+    return os.path.join(workdir, 'shard-{:04d}{}'.format(index, suffix))
+
+
+def plan_ranges(workdir, dbpath, shard_count):
+    """Split keys in DB into ranges, return list of range start keys.
+
+    The plan is stored in the work directory and reused on rerun so that
+    range boundaries stay the same.
+    """
+    done_path = os.path.join(workdir, PLAN_DONE)
+    if os.path.exists(done_path):
+        with open(done_path) as f:
+            return f.read().split('\n')
+    # No close() as this is read-only and close() can block
+    db = open_db(dbpath, flag='r')
+    count = len(db)
+    size = max(1, -(-count // shard_count))    # ceil
+    starts = ['']    # first range starts from smallest key
+    for i, key in enumerate(sorted_keys(db)):
+        if i and i % size == 0:
+            starts.append(key)
+    with open(done_path, 'w') as f:
+        f.write('\n'.join(starts))
+    print('Split {} keys into {} ranges'.format(count, len(starts)),
+          file=sys.stderr)
+    return starts
+
+
+def iter_range(db, index, start, end, suffix):
+    """Iterate over (key, index, value) in DB for keys in [start, end)."""
+    for key, value in sorted_range(db, start, end):
+        if key.endswith(suffix):
+            yield key, index, db.decode(value)
+
+
+def norm_ids(textbound):
+    return set(n.norm_id for n in textbound.normalizations)
+
+
+def candidates_exact(annsets):
+    """Group annotations by (start, end, type), return list of groups."""
+    grouped = OrderedDict()
+    for annset in annsets:
+        for a in annset:
+            grouped.setdefault((a.start, a.end, a.type), []).append(a)
+    return list(grouped.values())
+
+
+def candidates_overlap(annsets):
+    """Group transitively overlapping annotations of the same type."""
+    by_type = {}
+    for annset in annsets:
+        for a in annset:
+            by_type.setdefault(a.type, []).append(a)
+    groups = []
+    for type_, anns in by_type.items():
+        anns.sort(key=lambda a: (a.start, -a.end))
+        group, group_end = [], None
+        for a in anns:
+            if group and a.start >= group_end:
+                groups.append(group)
+                group = []
+            if not group:
+                group_end = a.end
+            group.append(a)
+            group_end = max(group_end, a.end)
+        if group:
+            groups.append(group)
+    return groups
+
+
+def vote(group, options):
+    """Return (votes, representative, norm_id, voters) for candidate."""
+    if options.norm_agreement:
+        voters_by_norm = {}
+        for a in group:
+            for norm_id in norm_ids(a):
+                voters_by_norm.setdefault(norm_id, set()).add(a.annset)
+        if not voters_by_norm:
+            return 0, group[0], None, set()
+        norm_id = sorted(voters_by_norm,
+                         key=lambda n: (-len(voters_by_norm[n]), n))[0]
+        voters = voters_by_norm[norm_id]
+        group = [a for a in group if norm_id in norm_ids(a)]
+    else:
+        voters = set(a.annset for a in group)
+        norm_votes = Counter()
+        for annset in voters:
+            ids = set()
+            for a in group:
+                if a.annset == annset:
+                    ids.update(norm_ids(a))
+            norm_votes.update(ids)
+        norm_id = None
+        if norm_votes:
+            norm_id = sorted(norm_votes, key=lambda n: (-norm_votes[n], n))[0]
+    # Representative span is the one with most votes, then the longest
+    span_votes = Counter()
+    for span, anns in groupby(sorted(group, key=lambda a: (a.start, a.end)),
+                              key=lambda a: (a.start, a.end)):
+        span_votes[span] = len(set(a.annset for a in anns))
+    start, end = sorted(span_votes, key=lambda s: (-span_votes[s], s[0]-s[1],
+                                                   s))[0]
+    representative = [a for a in group if (a.start, a.end) == (start, end)][0]
+    return len(voters), representative, norm_id, voters
+
+
+def consensus(names, annsets, options):
+    """Return consensus standoff and number of annotations for document."""
+    for annset in annsets:
+        for a in annset:
+            a.type = options.type_mapping.map_type(a.type)
+    if options.overlap:
+        groups = candidates_overlap(annsets)
+    else:
+        groups = candidates_exact(annsets)
+
+    kept = []
+    for group in groups:
+        votes, a, norm_id, voters = vote(group, options)
+        if votes >= options.type_votes.get(a.type, options.min_votes):
+            kept.append((a, norm_id, voters))
+    kept.sort(key=lambda k: (k[0].start, -k[0].end, k[0].type))
+
+    lines, n = [], 0
+    for t, (a, norm_id, voters) in enumerate(kept, start=1):
+        lines.append('T{}\t{} {} {}\t{}'.format(t, a.type, a.start, a.end,
+                                               a.text))
+        if norm_id is not None:
+            n += 1
+            lines.append('N{}\tReference T{} {}\t{}'.format(n, t, norm_id,
+                                                          a.text))
+        lines.append('#{}\tAnnotatorNotes T{}\t{}'.format(
+            t, t, ','.join(v for v in names if v in voters)))
+    return '\n'.join(lines), len(kept)
+
+
+def build_range(job):
+    index, start, end, workdir, options = job
+    output = shard_path(workdir, index, '.sqlite')
+    if os.path.exists(output):
+        os.remove(output)    # partial output from failed run
+    names = list(options.datasets.keys())
+    dbs = [
+        open_db(path, flag='r')
+        for path in options.datasets.values()
+    ]
+    streams = [
+        iter_range(db, i, start, end, options.suffix)
+        for i, db in enumerate(dbs)
+    ]
+    docs, annotations = 0, 0
+    with SqliteDict(output, flag='n', autocommit=False) as out_db:
+        batch = []
+        merged = heapq.merge(*streams, key=lambda s: (s[0], s[1]))
+        for key, items in groupby(merged, key=lambda s: s[0]):
+            annsets = [[] for name in names]
+            for key, i, value in items:
+                annsets[i] = parse_standoff(value, '{}/{}'.format(
+                    names[i], key), names[i])
+            ann, count = consensus(names, annsets, options)
+            batch.append((key, ann))
+            docs += 1
+            annotations += count
+            if len(batch) >= BATCH_SIZE:
+                out_db.update(batch)
+                batch = []
+        out_db.update(batch)
+        out_db.commit()
+    open(output + '.done', 'w').close()
+    return index, docs, annotations
+
+
+def build_consensus(options):
+    workdir = options.workdir
+    os.makedirs(workdir, exist_ok=True)
+    first_db = list(options.datasets.values())[0]
+    starts = plan_ranges(workdir, first_db, options.shards)
+    ends = starts[1:] + [None]
+
+    todo = [
+        i for i in range(len(starts))
+        if not os.path.exists(shard_path(workdir, i, '.sqlite.done'))
+    ]
+    print('{}/{} ranges to do'.format(len(todo), len(starts)),
+          file=sys.stderr)
+
+    total_docs, total_annotations = 0, 0
+    with Pool(options.jobs) as pool:
+        jobs = [(i, starts[i], ends[i], workdir, options) for i in todo]
+        for index, docs, annotations in pool.imap_unordered(build_range, jobs):
+            total_docs += docs
+            total_annotations += annotations
+            print('Built range {}: {} documents, {} annotations'.format(
+                index, docs, annotations), file=sys.stderr)
+
+    # Merge into temporary file so that an existing output is complete
+    tmppath = options.output + '.tmp'
+    SqliteDict(tmppath, flag='n').close()
+    shards = [shard_path(workdir, i, '.sqlite') for i in range(len(starts))]
+    merge_dbs(tmppath, shards)
+    os.rename(tmppath, options.output)
+    shutil.rmtree(workdir)
+    return total_docs, total_annotations
+
+
+def get_datasets(options):
+    datasets = OrderedDict()
+    for d in options.data:
+        if ':' in d:
+            name, path = d.split(':', 1)
+        else:
+            name = os.path.splitext(os.path.basename(d))[0]
+            path = d
+        if name in datasets:
+            raise ValueError('duplicate name {}'.format(name))
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return None
+        datasets[name] = path
+    return datasets
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    args.datasets = get_datasets(args)
+    if args.datasets is None:
+        return 1
+    if args.min_votes is None:
+        args.min_votes = len(args.datasets) // 2 + 1
+    args.type_mapping = make_type_mapping(args)
+    if args.type_votes is not None:
+        args.type_votes = parse_type_votes(args.type_votes,
+                                           args.type_mapping)
+    else:
+        args.type_votes = {}
+    if args.workdir is None:
+        args.workdir = args.output + '.shards'
+    docs, annotations = build_consensus(args)
+    print('Done, {} documents, {} consensus annotations'.format(
+        docs, annotations), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
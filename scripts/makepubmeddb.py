@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Make DB of PubMed texts directly from PubMed XML packages.
+
+# Packages are parsed by parallel worker processes that send batches of
+# (key, text) pairs to the main process, which inserts them into the DB.
+# As packages are processed in no particular order, this is intended for
+# baseline packages where each PMID occurs once; use updatepubmeddb.py
+# for update packages.
+
+import sys
+import os
+
+from multiprocessing import Process, Queue
+from queue import Empty
+from datetime import datetime
+from logging import error
+
+from pubmedxml import iter_package, UPSERT, DELETE
+from updatepubmeddb import PACKAGE_TABLE, package_name
+from dbcodec import open_db
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# Messages from workers
+BATCH, DONE, FAILED = 'batch', 'done', 'failed'
+
+# Seconds to wait for results before checking that workers are alive
+POLL_INTERVAL = 10
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Make SQLiteDict DB from PubMed XML.')
+    ap.add_argument('-b', '--batch-size', metavar='N', type=int, default=10000,
+                    help='number of documents per insert batch')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=4,
+                    help='number of parsing processes')
+    ap.add_argument('-s', '--suffix', default='.txt', help='text key suffix')
+    ap.add_argument('db', metavar='DB', help='database to create or extend')
+    ap.add_argument('packages', metavar='XML', nargs='+',
+                    help='PubMed packages (.xml.gz)')
+    return ap
+
+
+def parse_package(path, results, options):
+    name, batch, upserted, deleted = package_name(path), [], 0, 0
+    for action, pmid, text in iter_package(path):
+        if action == UPSERT:
+            upserted += 1
+        else:
+            assert action == DELETE
+            deleted += 1
+        batch.append((pmid + options.suffix, text))    # text None for DELETE
+        if len(batch) >= options.batch_size:
+            results.put((BATCH, name, batch))
+            batch = []
+    if batch:
+        results.put((BATCH, name, batch))
+    results.put((DONE, name, (upserted, deleted)))
+
+
+def worker(tasks, results, options):
+    while True:
+        path = tasks.get()
+        if path is None:
+            break
+        try:
+            parse_package(path, results, options)
+        except Exception as e:
+            results.put((FAILED, package_name(path), str(e)))
+
+
+def write_batch(db, batch):
+    upserts = [(k, v) for k, v in batch if v is not None]
+    db.update(upserts)
+    for key, value in batch:
+        if value is None and key in db:
+            del db[key]
+
+
+def dead_workers(workers):
+    """Return workers that exited abnormally, or all if all exited."""
+    dead = [p for p in workers if p.exitcode not in (None, 0)]
+    if not dead and all(p.exitcode is not None for p in workers):
+        dead = workers    # exited without reporting all packages
+    return dead
+
+
+def make_db(dbpath, packages, options):
+    applied = SqliteDict(dbpath, tablename=PACKAGE_TABLE, autocommit=False)
+    todo = [p for p in packages if package_name(p) not in applied]
+    print('{}/{} packages to do'.format(len(todo), len(packages)),
+          file=sys.stderr)
+
+    # Bounded result queue keeps parsed but unwritten batches in check.
+    tasks, results = Queue(), Queue(maxsize=4*options.jobs)
+    for path in todo:
+        tasks.put(path)
+    workers = []
+    for i in range(min(options.jobs, len(todo))):
+        tasks.put(None)
+        p = Process(target=worker, args=(tasks, results, options))
+        p.start()
+        workers.append(p)
+
+    finished, failed = 0, 0
+    with open_db(dbpath) as db:
+        while finished < len(todo):
+            try:
+                message, name, data = results.get(timeout=POLL_INTERVAL)
+            except Empty:
+                # Workers that are killed (e.g. out of memory) or fail
+                # outside parse_package() send no DONE or FAILED
+                dead = dead_workers(workers)
+                if not dead:
+                    continue
+                for p in dead:
+                    error('worker {} exited with code {}'.format(
+                        p.pid, p.exitcode))
+                error('aborting with {} packages outstanding'.format(
+                    len(todo)-finished))
+                failed += len(todo)-finished
+                break
+            if message == BATCH:
+                write_batch(db, data)
+            elif message == DONE:
+                # Commit before recording the package so that a
+                # restarted run redoes packages that were not committed.
+                db.commit()
+                upserted, deleted = data
+                applied[name] = {
+                    'applied': datetime.now().isoformat(),
+                    'upserted': upserted,
+                    'deleted': deleted,
+                }
+                applied.commit()
+                finished += 1
+                print('Applied {}: {} upserted, {} deleted ({}/{})'.format(
+                    name, upserted, deleted, finished, len(todo)),
+                      file=sys.stderr)
+            else:
+                assert message == FAILED
+                error('failed to process {}: {}'.format(name, data))
+                finished += 1
+                failed += 1
+        db.commit()
+    applied.close()
+
+    for p in workers:
+        if failed and p.is_alive():
+            p.terminate()
+        p.join()
+    return failed
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    for path in args.packages:
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    failed = make_db(args.db, args.packages, args)
+    if failed:
+        print('Failed to process {} packages'.format(failed), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
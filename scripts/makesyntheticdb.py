@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+# Make synthetic SQLiteDict DBs of texts and standoff annotations.
+
+# Texts and candidate mentions are generated from the corpus seed, and
+# each annotation set keeps a random subset of the candidates, so DBs
+# made with the same corpus seed and different set seeds share texts
+# and partially agree, like the outputs of different taggers.
+
+import sys
+
+from random import Random
+from logging import error
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+DEFAULT_TYPES = 'Gene:4,Chemical:3,Disease:2,Species:1'
+
+# Normalization ID format by type
+NORM_ID_FORMAT = {
+    'Gene': 'NCBIGene:{}',
+    'Chemical': 'MESH:D{:06d}',
+    'Disease': 'MESH:D{:06d}',
+    'Species': 'NCBITaxon:{}',
+}
+
+# Number of distinct normalization IDs by type
+NORM_ID_COUNT = 1000
+
+VOCABULARY = [
+    'the', 'of', 'and', 'in', 'to', 'protein', 'expression', 'cells',
+    'patients', 'activity', 'binding', 'kinase', 'receptor', 'induced',
+    'levels', 'treatment', 'mice', 'human', 'gene', 'mutation', 'domain',
+    'inhibitor', 'response', 'signaling', 'tumor', 'acid', 'phosphorylation',
+    'increased', 'reduced', 'analysis', 'was', 'were', 'with', 'by', 'a',
+]
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Make synthetic annotation DB.')
+    ap.add_argument('-c', '--crossing', metavar='RATE', type=float,
+                    default=0.01, help='ratio of mentions with crossing span')
+    ap.add_argument('-d', '--density', metavar='N', type=float, default=10,
+                    help='candidate mentions per 1000 characters of text')
+    ap.add_argument('-k', '--keep', metavar='RATIO', type=float, default=0.8,
+                    help='ratio of candidate mentions annotated in this set')
+    ap.add_argument('-l', '--length', metavar='N', type=int, default=1500,
+                    help='mean text length in characters')
+    ap.add_argument('-n', '--docs', metavar='N', type=int, default=1000,
+                    help='number of documents')
+    ap.add_argument('-N', '--norm-ratio', metavar='RATIO', type=float,
+                    default=0.9, help='ratio of mentions with normalization')
+    ap.add_argument('-o', '--overlap', metavar='RATE', type=float,
+                    default=0.05, help='ratio of mentions with nested mention')
+    ap.add_argument('-s', '--seed', metavar='SEED', type=int, default=0,
+                    help='corpus seed (texts and candidate mentions)')
+    ap.add_argument('-S', '--set-seed', metavar='SEED', type=int, default=0,
+                    help='annotation set seed (subset of candidates)')
+    ap.add_argument('-t', '--types', metavar='TYPE:WEIGHT[,...]',
+                    default=DEFAULT_TYPES, help='entity type mix')
+    ap.add_argument('db', metavar='DB', help='output database')
+    return ap
+
+
+def parse_types(spec):
+    types, weights = [], []
+    for t in spec.split(','):
+        type_, weight = t.split(':') if ':' in t else (t, 1)
+        types.append(type_)
+        weights.append(float(weight))
+    return types, weights
+
+
+def generate_text(rng, length):
+    """Return text and (start, end) offsets of its words."""
+    words, offsets, offset = [], [], 0
+    target = max(1, int(rng.gauss(length, length/4)))
+    while offset < target:
+        word = rng.choice(VOCABULARY)
+        words.append(word)
+        offsets.append((offset, offset+len(word)))
+        offset += len(word) + 1
+    return ' '.join(words), offsets
+
+
+def generate_candidates(rng, offsets, types, weights, options):
+    """Return candidate mentions as (start, end, type, norm_id) tuples."""
+    count = int(round(offsets[-1][1] * options.density / 1000))
+    candidates = []
+    for i in range(count):
+        first = rng.randrange(len(offsets))
+        last = min(len(offsets)-1, first + rng.randrange(3))
+        type_ = rng.choices(types, weights)[0]
+        start, end = offsets[first][0], offsets[last][1]
+        candidates.append((start, end, type_, norm_id(rng, type_, options)))
+        if rng.random() < options.overlap and last > first:
+            # nested mention on the first word
+            type_ = rng.choices(types, weights)[0]
+            candidates.append((start, offsets[first][1], type_,
+                               norm_id(rng, type_, options)))
+        if rng.random() < options.crossing and last+1 < len(offsets):
+            # crossing mention starting at the last word
+            type_ = rng.choices(types, weights)[0]
+            candidates.append((offsets[last][0], offsets[last+1][1], type_,
+                               norm_id(rng, type_, options)))
+    return candidates
+
+
+def norm_id(rng, type_, options):
+    if rng.random() >= options.norm_ratio:
+        return None
+    id_format = NORM_ID_FORMAT.get(type_, type_ + ':{}')
+    return id_format.format(rng.randrange(1, NORM_ID_COUNT+1))
+
+
+def to_standoff(text, mentions):
+    norm_by_span_type = {}
+    for start, end, type_, nid in mentions:
+        norm_by_span_type.setdefault((start, end, type_), nid)
+    lines, n = [], 0
+    for t, (start, end, type_) in enumerate(sorted(norm_by_span_type),
+                                            start=1):
+        nid = norm_by_span_type[(start, end, type_)]
+        mtext = text[start:end]
+        lines.append('T{}\t{} {} {}\t{}'.format(t, type_, start, end, mtext))
+        if nid is not None:
+            n += 1
+            lines.append('N{}\tReference T{} {}\t{}'.format(n, t, nid, mtext))
+    return '\n'.join(lines)
+
+
+def generate_document(index, types, weights, options):
+    """Return PMID, text and standoff annotation for document."""
+    corpus_rng = Random('{}:{}'.format(options.seed, index))
+    set_rng = Random('{}:{}:{}'.format(options.seed, options.set_seed, index))
+    text, offsets = generate_text(corpus_rng, options.length)
+    candidates = generate_candidates(corpus_rng, offsets, types, weights,
+                                     options)
+    mentions = [c for c in candidates if set_rng.random() < options.keep]
+    pmid = str(10000000 + index)
+    return pmid, text, to_standoff(text, mentions)
+
+
+def make_db(path, options):
+    types, weights = parse_types(options.types)
+    with SqliteDict(path, flag='n', autocommit=False) as db:
+        batch = []
+        for i in range(options.docs):
+            pmid, text, ann = generate_document(i, types, weights, options)
+            batch.append((pmid + '.txt', text))
+            batch.append((pmid + '.ann', ann))
+            if len(batch) >= 10000:
+                db.update(batch)
+                batch = []
+        db.update(batch)
+        db.commit()
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    make_db(args.db, args)
+    print('Wrote {} documents to {}'.format(args.docs, args.db),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
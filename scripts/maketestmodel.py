@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Make tiny randomly initialized transformers model for testing.
+
+# The model has a character-level WordPiece vocabulary and random
+# weights, so its predictions are meaningless, but it can be loaded
+# from a local directory without network access and is fast on CPU.
+
+import sys
+import os
+import string
+
+from logging import error
+
+try:
+    from transformers import BertConfig, BertTokenizerFast
+    from transformers import BertForTokenClassification
+    from transformers import BertForSequenceClassification
+except ImportError:
+    error('failed to import transformers, try `pip3 install torch transformers`')
+    raise
+
+
+SPECIAL_TOKENS = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+
+# Model class and default labels by task
+NER, TRIAGE = 'ner', 'triage'
+MODEL_CLASS = {
+    NER: BertForTokenClassification,
+    TRIAGE: BertForSequenceClassification,
+}
+DEFAULT_LABELS = {
+    NER: 'Protein,Chemical',
+    TRIAGE: 'negative,positive',
+}
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Make tiny random model for testing.')
+    ap.add_argument('-l', '--labels', metavar='LABEL[,...]', default=None,
+                    help='entity types (ner) or class labels (triage)')
+    ap.add_argument('-s', '--seed', metavar='SEED', type=int, default=0,
+                    help='random seed for weights')
+    ap.add_argument('-t', '--task', choices=sorted(MODEL_CLASS), default=NER,
+                    help='model task')
+    ap.add_argument('directory', metavar='DIR', help='output directory')
+    return ap
+
+
+def make_vocab(path):
+    chars = string.ascii_lowercase + string.digits + string.punctuation
+    vocab = SPECIAL_TOKENS + list(chars) + ['##' + c for c in chars]
+    with open(path, 'w') as out:
+        for token in vocab:
+            print(token, file=out)
+    return len(vocab)
+
+
+def bio_labels(types):
+    labels = ['O']
+    for type_ in types:
+        labels.extend(['B-' + type_, 'I-' + type_])
+    return { i: l for i, l in enumerate(labels) }
+
+
+def make_config(vocab_size, id2label):
+    return BertConfig(
+        vocab_size=vocab_size,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+        max_position_embeddings=512,
+        id2label=id2label,
+        label2id={ v: k for k, v in id2label.items() },
+    )
+
+
+def make_model(directory, options):
+    import torch
+    torch.manual_seed(options.seed)
+    os.makedirs(directory, exist_ok=True)
+    vocab_path = os.path.join(directory, 'vocab.txt')
+    vocab_size = make_vocab(vocab_path)
+    tokenizer = BertTokenizerFast(vocab_file=vocab_path, do_lower_case=True)
+    tokenizer.save_pretrained(directory)
+    labels = options.labels.split(',')
+    if options.task == NER:
+        id2label = bio_labels(labels)
+    else:
+        id2label = { i: l for i, l in enumerate(labels) }
+    model_class = MODEL_CLASS[options.task]
+    model = model_class(make_config(vocab_size, id2label))
+    model.save_pretrained(directory)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.labels is None:
+        args.labels = DEFAULT_LABELS[args.task]
+    make_model(args.directory, args)
+    print('Wrote test model to {}'.format(args.directory), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
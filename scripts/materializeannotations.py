@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Write copy of annotation DB with only target type annotations.
+
+# Types are mapped and annotations filtered to target types once (see
+# typemap.py), and the mapping is recorded in the DB metadata together
+# with the codec and layout of the input, so that comparison and
+# consensus runs read pre-filtered data. Documents without target type
+# annotations are stored as empty values. With --ids, only the listed
+# documents are updated in an existing output.
+
+import sys
+import os
+
+from docset import read_docset, docset_items, count_docs
+from progress import add_progress_arguments, make_progress
+from dbcodec import open_db, read_meta, write_meta
+from intkeydb import STRING_LAYOUT
+from mergesqlite import BATCH_SIZE
+from typemap import META_KEY, add_type_arguments, make_type_mapping
+from typemap import read_type_mapping, filter_standoff
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Materialize filtered annotation DB.')
+    ap.add_argument('-s', '--suffix', default='.ann',
+                    help='suffix of annotation keys')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only update documents with IDs in FILE')
+    ap.add_argument('input', metavar='DB', help='annotation DB')
+    ap.add_argument('output', metavar='DB', help='filtered annotation DB')
+    add_type_arguments(ap)
+    add_progress_arguments(ap)
+    return ap
+
+
+def output_meta(inpath, mapping):
+    """Return metadata for output with input codec and layout."""
+    meta = read_meta(inpath)
+    if meta is None:
+        meta = { 'codec': None, 'layout': STRING_LAYOUT }
+    meta = dict(meta)
+    meta[META_KEY] = mapping.to_meta()
+    return meta
+
+
+def materialize(inpath, outpath, mapping, options):
+    # No close() as this is read-only and close() can block
+    in_db = open_db(inpath, flag='r')
+    progress = make_progress(options, 'materializeannotations',
+                             lambda: count_docs(in_db, options.suffix,
+                                                options.ids))
+    count, empty, batch, seen = 0, 0, [], set()
+    with open_db(outpath) as out_db:
+        for key, value in docset_items(in_db, options.suffix, options.ids):
+            value = filter_standoff(value, mapping)
+            batch.append((key, value))
+            seen.add(key)
+            count += 1
+            empty += not value
+            if len(batch) >= BATCH_SIZE:
+                out_db.update(batch)
+                progress.update(docs=len(batch))
+                batch = []
+        out_db.update(batch)
+        progress.update(docs=len(batch))
+        if options.ids is not None:
+            # Documents removed from input
+            for id_ in options.ids:
+                key = id_ + options.suffix
+                if key not in seen and key in out_db:
+                    del out_db[key]
+        out_db.commit()
+    progress.finish()
+    return count, empty
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if not os.path.exists(args.input):
+        print('no such file: {}'.format(args.input), file=sys.stderr)
+        return 1
+    mapping = make_type_mapping(args)
+    if args.ids is not None:
+        if not os.path.exists(args.output):
+            print('error: --ids requires existing output', file=sys.stderr)
+            return 1
+        if read_type_mapping(args.output) != mapping:
+            print('error: {} materialized with other type mapping'.format(
+                args.output), file=sys.stderr)
+            return 1
+        args.ids = read_docset(args.ids)
+        count, empty = materialize(args.input, args.output, mapping, args)
+    else:
+        # Write into temporary file so that an existing output is complete
+        tmppath = args.output + '.tmp'
+        if os.path.exists(tmppath):
+            os.remove(tmppath)    # partial output from failed run
+        write_meta(tmppath, output_meta(args.input, mapping))
+        count, empty = materialize(args.input, tmppath, mapping, args)
+        os.rename(tmppath, args.output)
+    print('Done, wrote {} documents ({} without target annotations)'.format(
+        count, empty), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
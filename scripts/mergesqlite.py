@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# Merge SQLiteDict DBs into an existing or new DB.
+
+# Values are copied without decoding when the input and output use the
+# same value codec and layout (see dbcodec.py), and a new or empty
+# output takes the codec and layout of the first input.
+
+import sys
+import os
+import sqlite3
+
+from docset import read_docset
+from dbcodec import TABLENAME, open_db, read_meta, write_meta
+from intkeydb import STRING_LAYOUT, create_table, table_columns
+
+# Number of items per bulk insert
+BATCH_SIZE = 10000
+
+# Default key suffixes for documents
+DOCUMENT_SUFFIXES = ['.txt', '.ann']
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Merge SQLiteDict DBs.')
+    ap.add_argument('-D', '--delete-missing', default=False,
+                    action='store_true',
+                    help='delete keys for --ids documents not in any input')
+    ap.add_argument('-s', '--suffix', default=None, action='append',
+                    help='key suffixes for --ids (default .txt and .ann)')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only merge documents with IDs in FILE')
+    ap.add_argument('output', metavar='DB', help='output database')
+    ap.add_argument('input', metavar='DB', nargs='+', help='input databases')
+    return ap
+
+
+def copy_all(outpath, inpath, layout=STRING_LAYOUT):
+    """Copy all items from inpath DB to outpath DB with the same layout.
+
+    Values are copied with a single INSERT ... SELECT without decoding.
+    """
+    conn = sqlite3.connect(outpath)
+    create_table(conn, TABLENAME, layout)
+    conn.execute('ATTACH DATABASE ? AS source', (inpath,))
+    cursor = conn.execute('REPLACE INTO "{0}" ({1}) '
+                          'SELECT {1} FROM source."{0}"'.format(
+                              TABLENAME, table_columns(layout)))
+    count = cursor.rowcount
+    conn.commit()
+    conn.execute('DETACH DATABASE source')
+    conn.close()
+    return count
+
+
+def is_empty(path):
+    """Return True if DB has no items in default table."""
+    if not os.path.exists(path):
+        return True
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute(
+            'SELECT 1 FROM "{}" LIMIT 1'.format(TABLENAME)).fetchone()
+    except sqlite3.OperationalError:
+        row = None    # no table
+    conn.close()
+    return row is None
+
+
+def drop_table(path):
+    conn = sqlite3.connect(path)
+    conn.execute('DROP TABLE IF EXISTS "{}"'.format(TABLENAME))
+    conn.commit()
+    conn.close()
+
+
+def copy_decoded(outpath, inpath):
+    """Copy all items from inpath DB to outpath DB, re-encoding values."""
+    # No close() for in_db as this is read-only and close() can block
+    in_db = open_db(inpath, flag='r')
+    count, batch = 0, []
+    with open_db(outpath) as out_db:
+        for key, value in in_db.items():
+            batch.append((key, value))
+            if len(batch) >= BATCH_SIZE:
+                out_db.update(batch)
+                count += len(batch)
+                batch = []
+        out_db.update(batch)
+        count += len(batch)
+        out_db.commit()
+    return count
+
+
+def merge_all(outpath, inpath):
+    """Copy all items from inpath DB to outpath DB."""
+    in_meta, out_meta = read_meta(inpath), read_meta(outpath)
+    if in_meta != out_meta and is_empty(outpath):
+        drop_table(outpath)    # may have been created with other layout
+        write_meta(outpath, in_meta)
+        out_meta = in_meta
+    if in_meta == out_meta:
+        layout = (in_meta or {}).get('layout', STRING_LAYOUT)
+        return copy_all(outpath, inpath, layout)
+    else:
+        return copy_decoded(outpath, inpath)
+
+
+def copy_documents(out_db, in_db, docset, suffixes=DOCUMENT_SUFFIXES):
+    """Copy values for documents in docset from in_db to out_db.
+
+    Return set of copied keys.
+    """
+    copied, batch = set(), []
+    for id_ in docset:
+        for suffix in suffixes:
+            key = id_ + suffix
+            value = in_db.get(key)
+            if value is not None:
+                batch.append((key, value))
+                copied.add(key)
+        if len(batch) >= BATCH_SIZE:
+            out_db.update(batch)
+            batch = []
+    if batch:
+        out_db.update(batch)
+    return copied
+
+
+def merge_dbs(outpath, inpaths, docset=None, suffixes=DOCUMENT_SUFFIXES,
+              delete_missing=False):
+    count, deleted = 0, 0
+    if docset is None:
+        for inpath in inpaths:
+            count += merge_all(outpath, inpath)
+            print('Merged {} ({} total)'.format(inpath, count),
+                  file=sys.stderr)
+        return count, deleted
+
+    seen = set()
+    with open_db(outpath) as out_db:
+        for inpath in inpaths:
+            # No close() as this is read-only and close() can block
+            in_db = open_db(inpath, flag='r')
+            copied = copy_documents(out_db, in_db, docset, suffixes)
+            seen.update(copied)
+            count += len(copied)
+            print('Merged {} ({} total)'.format(inpath, count),
+                  file=sys.stderr)
+        if delete_missing:
+            for id_ in docset:
+                for suffix in suffixes:
+                    key = id_ + suffix
+                    if key not in seen and key in out_db:
+                        del out_db[key]
+                        deleted += 1
+        out_db.commit()
+    return count, deleted
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.delete_missing and args.ids is None:
+        print('error: --delete-missing requires --ids', file=sys.stderr)
+        return 1
+    if args.suffix is None:
+        args.suffix = DOCUMENT_SUFFIXES
+    for path in args.input:
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    docset = read_docset(args.ids) if args.ids is not None else None
+    count, deleted = merge_dbs(args.output, args.input, docset, args.suffix,
+                               args.delete_missing)
+    print('Done, merged {}, deleted {}'.format(count, deleted),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
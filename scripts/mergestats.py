@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# Merge JSON/NDJSON stats files written with --json, e.g. from shards.
+
+import sys
+import os
+
+from statsjson import read_stats, write_stats, merge_stats, StatsFormatError
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Merge stats files.')
+    ap.add_argument('output', metavar='FILE',
+                    help='output stats (JSON, or NDJSON if .ndjson)')
+    ap.add_argument('input', metavar='FILE', nargs='+', help='input stats')
+    return ap
+
+
+def merge_files(paths):
+    merged_kind, merged = None, {}
+    for path in paths:
+        kind, stats = read_stats(path)
+        if merged_kind is not None and kind != merged_kind:
+            raise ValueError('cannot merge {} stats in {} with {} stats'.\
+                             format(kind, path, merged_kind))
+        merged_kind = kind
+        merge_stats(merged, stats)
+    return merged_kind, merged
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    for path in args.input:
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    try:
+        kind, stats = merge_files(args.input)
+    except (ValueError, StatsFormatError) as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    write_stats(args.output, kind, stats)
+    print('Done, merged {} {} stats files'.format(len(args.input), kind),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,14 @@
+# Support for running tasks in worker process pools.
+
+from collections import deque
+
+
+def bounded_imap(pool, func, iterable, max_pending):
+    """Like pool.imap(), but without consuming the input eagerly."""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
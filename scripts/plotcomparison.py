@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-# Plot statistics from compareannotations.py output
+# Plot statistics from compareannotations.py output (text or --json)
 
 import sys
 import os
@@ -15,6 +15,9 @@ import matplotlib.pyplot as plt
 from matplotlib_venn import venn3
 import matplotlib.colors as mc
 
+from statsjson import read_stats
+from compareannotations import agreement_matrix
+
 
 COLOR_BY_TYPE = {
     'Chemical': '#58A6D1',
@@ -88,6 +91,70 @@ def plot_venn3(stats, type_, fn):
     plt.close()
 
 
+def plot_upset(stats, type_, fn, max_patterns=30):
+    """UpSet-style plot of counts by dataset subset pattern."""
+    count_by_asets = { asets: int(count) for asets, count, ratio in stats }
+    labels = sorted(set(l for a in count_by_asets for l in a.split('/')))
+    patterns = sorted(count_by_asets.items(), key=lambda i: -i[1])
+    patterns = patterns[:max_patterns]
+
+    color = COLOR_BY_TYPE.get(type_, '#0000FF')
+    fig, (bars, dots) = plt.subplots(
+        2, 1, sharex=True, figsize=(max(4, 0.4*len(patterns)+2), 5),
+        gridspec_kw={'height_ratios': [3, 1]})
+    x = range(len(patterns))
+    bars.bar(x, [c for a, c in patterns], color=color)
+    for i, (asets, count) in enumerate(patterns):
+        bars.text(i, count, millify(count), ha='center', va='bottom',
+                  fontsize=6)
+    bars.set_title(type_)
+    for i, (asets, count) in enumerate(patterns):
+        members = asets.split('/')
+        ys = [j for j, l in enumerate(labels) if l in members]
+        dots.scatter([i]*len(labels), range(len(labels)), color='#DDDDDD')
+        dots.scatter([i]*len(ys), ys, color=color)
+        if len(ys) > 1:
+            dots.plot([i, i], [min(ys), max(ys)], color=color)
+    dots.set_yticks(range(len(labels)))
+    dots.set_yticklabels(labels)
+    dots.set_xticks([])
+
+    plt.savefig(fn, dpi=600)
+    print('Wrote {}'.format(fn))
+    plt.close()
+
+
+def plot_agreement(stats, type_, fn):
+    """Heatmap of pairwise F1 between datasets."""
+    matrix = agreement_matrix({ a: int(c) for a, c, r in stats })
+    labels = sorted(set(r for r, p in matrix))
+    values = [[matrix[(r, p)][5] for p in labels] for r in labels]
+
+    plt.figure(figsize=(len(labels)+1, len(labels)+1))
+    plt.imshow(values, cmap='Blues', vmin=0, vmax=1)
+    for i, row in enumerate(values):
+        for j, value in enumerate(row):
+            plt.text(j, i, '{:.2f}'.format(value), ha='center', va='center',
+                     fontsize=8)
+    plt.xticks(range(len(labels)), labels, rotation=90)
+    plt.yticks(range(len(labels)), labels)
+    plt.title('{} F1'.format(type_))
+    plt.tight_layout()
+
+    plt.savefig(fn, dpi=600)
+    print('Wrote {}'.format(fn))
+    plt.close()
+
+
+def plot_stats(stats, type_):
+    labels = set(l for a, c, r in stats for l in a.split('/'))
+    if len(labels) == 3:
+        plot_venn3(stats, type_, '{}-venn3.png'.format(type_))
+    else:
+        plot_upset(stats, type_, '{}-upset.png'.format(type_))
+    plot_agreement(stats, type_, '{}-agreement.png'.format(type_))
+
+
 def read_until(f, line):
     found, lines = False, []
     for l in f:
@@ -101,15 +168,10 @@ def read_until(f, line):
     return lines
 
 
-def main(argv):
-    if len(argv) != 2:
-        print('usage: {} STATS'.format(os.path.basename(__file__)),
-              file=sys.stderr)
-        return 1
-
+def read_text_stats(path):
     type_stats = defaultdict(list)
     total_stats = None
-    with open(argv[1]) as f:
+    with open(path) as f:
         read_until(f, '--- by type ---')
         lines = read_until(f, '--- totals ---')
         for l in lines:
@@ -117,10 +179,39 @@ def main(argv):
             type_stats[type_].append((asets, count, ratio))
         lines = read_until(f, '--- doc level ---')
         total_stats = [l.split('\t') for l in lines if len(l.split('\t')) == 3]
+    return type_stats, total_stats
+
+
+def read_json_stats(path):
+    kind, stats = read_stats(path)
+    if kind != 'compareannotations':
+        raise ValueError('expected compareannotations stats, got {}'.format(
+            kind))
+    def with_ratios(counts):
+        total = sum(counts.values())
+        return [(k, v, v/total) for k, v in counts.items()]
+    type_stats = {
+        type_: with_ratios(counts)
+        for type_, counts in stats['annotation_by_type'].items()
+    }
+    total_stats = with_ratios(stats['annotation_totals'])
+    return type_stats, total_stats
+
+
+def main(argv):
+    if len(argv) != 2:
+        print('usage: {} STATS'.format(os.path.basename(__file__)),
+              file=sys.stderr)
+        return 1
+
+    if argv[1].endswith(('.json', '.ndjson')):
+        type_stats, total_stats = read_json_stats(argv[1])
+    else:
+        type_stats, total_stats = read_text_stats(argv[1])
 
     for type_, stats in type_stats.items():
-        plot_venn3(stats, type_, '{}-venn3.png'.format(type_))
-    plot_venn3(total_stats, 'TOTAL', 'TOTAL-venn3.png')
+        plot_stats(stats, type_)
+    plot_stats(total_stats, 'TOTAL')
 
     return 0
 
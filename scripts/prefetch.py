@@ -0,0 +1,86 @@
+# Read-ahead of DB items in a background thread.
+
+# prefetch() wraps an iterable of items, typically (key, value) pairs
+# read and decoded from a DB, so that the next batches of items are
+# read in a background thread while the caller processes the current
+# ones. SQLite reads and decompression release the GIL, so reading
+# overlaps with parsing and computation in the main thread. At most
+# `depth` batches are read ahead, items are yielded in order, and
+# exceptions raised while reading are re-raised in the caller.
+
+import threading
+
+from queue import Queue, Full
+
+
+# Default number of batches to read ahead
+DEFAULT_DEPTH = 4
+
+# Number of items per batch
+BATCH_SIZE = 100
+
+# Seconds between checks for the consumer having stopped
+_POLL_INTERVAL = 0.1
+
+
+def add_prefetch_arguments(ap):
+    ap.add_argument('--prefetch', metavar='N', type=int,
+                    default=DEFAULT_DEPTH,
+                    help='batches of documents to read ahead in background'
+                    ' (0 to read in main thread)')
+
+
+def prefetch(iterable, depth=DEFAULT_DEPTH, batch_size=BATCH_SIZE):
+    """Return iterator over items of iterable read ahead in background."""
+    if depth < 1:
+        return iterable
+    return _prefetch(iterable, depth, batch_size)
+
+
+def _prefetch(iterable, depth, batch_size):
+    queue, stopped = Queue(maxsize=depth), threading.Event()
+
+    def put(kind, value):
+        while not stopped.is_set():
+            try:
+                queue.put((kind, value), timeout=_POLL_INTERVAL)
+                return True
+            except Full:
+                pass
+        return False    # consumer stopped iterating
+
+    def read():
+        try:
+            batch = []
+            for item in iterable:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put('items', batch):
+                        return
+                    batch = []
+            if batch and not put('items', batch):
+                return
+            put('done', None)
+        except BaseException as e:
+            put('error', e)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = queue.get()
+            if kind == 'items':
+                yield from value
+            elif kind == 'error':
+                raise value
+            else:
+                break
+    finally:
+        stopped.set()
+
+
+def fetch_values(items, dbs):
+    """Iterate over (key, values) for (key, value) items, where values
+    has value followed by the values for key in dbs (None if missing)."""
+    for key, value in items:
+        yield key, [value] + [db.get(key) for db in dbs]
@@ -0,0 +1,194 @@
+# Support for optional profiling and per-phase timing of scripts.
+
+# Usage: add_profile_arguments(ap) in argparser(), start_profiling(args)
+# after parsing arguments, and `with phase('name'):` or
+# timed_iter(iterable, 'name') around code to time. When profiling is
+# not enabled, phase() returns a shared no-op context manager and
+# timed_iter() returns its argument unchanged.
+
+# Phase times are exclusive: time spent in a phase entered within
+# another (e.g. decoding within fetching) is charged only to the inner
+# phase, so that phase times add up to at most the total time. Only the
+# main thread is timed; phases entered in other threads (e.g. decoding
+# in prefetch.py's reader thread) are ignored. Time not in any phase is
+# reported as 'other'.
+
+import sys
+import os
+import json
+import atexit
+import threading
+
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from time import perf_counter
+
+
+# Default sampling interval for sampling profiler (seconds)
+SAMPLE_INTERVAL = 0.005
+
+_NULL_PHASE = nullcontext()
+
+# Accumulated seconds and counts by phase, None if not profiling
+_phase_times = None
+_phase_counts = None
+
+# Phases entered in the main thread, innermost last
+_phase_stack = []
+
+_main_thread_id = threading.main_thread().ident
+
+
+class Phase(object):
+    __slots__ = ('name', 'start', 'timed')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timed = threading.get_ident() == _main_thread_id
+        if self.timed:
+            now = perf_counter()
+            if _phase_stack:
+                outer = _phase_stack[-1]
+                _phase_times[outer.name] += now - outer.start
+            self.start = now
+            _phase_stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        if self.timed:
+            now = perf_counter()
+            _phase_times[self.name] += now - self.start
+            _phase_counts[self.name] += 1
+            _phase_stack.pop()
+            if _phase_stack:
+                _phase_stack[-1].start = now    # outer phase resumes
+        return False
+
+
+def phase(name):
+    """Return context manager timing phase with given name."""
+    if _phase_times is None:
+        return _NULL_PHASE
+    return Phase(name)
+
+
+def timed_iter(iterable, name):
+    """Time the fetching of each item from iterable as phase."""
+    if _phase_times is None:
+        return iterable
+    return _timed_iter(iterable, name)
+
+
+def _timed_iter(iterable, name):
+    iterator = iter(iterable)
+    while True:
+        with Phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+        yield item
+
+
+def timed_decode(db, name='unpickle'):
+    """Time value decoding of SqliteDict db as phase."""
+    if _phase_times is None:
+        return db
+    decode = db.decode
+    def timed(value):
+        with Phase(name):
+            return decode(value)
+    db.decode = timed
+    return db
+
+
+class StackSampler(object):
+    """Low-overhead profiler sampling the main thread stack."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self.thread_id = threading.main_thread().ident
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(
+                    os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        # "Collapsed" stack format, as read e.g. by flamegraph.pl
+        with open(path, 'w') as out:
+            for stack, count in self.counts.most_common():
+                print('{} {}'.format(stack, count), file=out)
+
+
+def add_profile_arguments(ap):
+    ap.add_argument('--profile', metavar='FILE', default=None,
+                    help='write profile to FILE and phase times to'
+                    ' FILE.phases.json')
+    ap.add_argument('--profile-sample', default=False, action='store_true',
+                    help='use sampling profiler instead of cProfile')
+    ap.add_argument('--profile-interval', metavar='SEC', type=float,
+                    default=SAMPLE_INTERVAL,
+                    help='sampling profiler interval')
+
+
+def write_phases(path):
+    phases = OrderedDict()
+    for name, seconds in sorted(_phase_times.items(), key=lambda i: -i[1]):
+        phases[name] = { 'seconds': seconds, 'count': _phase_counts[name] }
+    with open(path, 'w') as out:
+        json.dump(phases, out, indent=2)
+    for name, values in phases.items():
+        print('phase {}\t{:.3f}s\t{}'.format(
+            name, values['seconds'], values['count']), file=sys.stderr)
+
+
+def start_profiling(options):
+    """Start profiling if requested in options, write output at exit."""
+    global _phase_times, _phase_counts
+    if options.profile is None:
+        return
+    _phase_times, _phase_counts = Counter(), Counter()
+    del _phase_stack[:]
+    if options.profile_sample:
+        profiler = StackSampler(options.profile_interval)
+        profiler.start()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = perf_counter()
+
+    def finish():
+        if options.profile_sample:
+            profiler.stop()
+            profiler.write(options.profile)
+        else:
+            profiler.disable()
+            profiler.dump_stats(options.profile)
+        total = perf_counter() - start
+        _phase_times['other'] = max(0, total - sum(_phase_times.values()))
+        _phase_counts['other'] = 1
+        _phase_times['total'] = total
+        _phase_counts['total'] = 1
+        write_phases(options.profile + '.phases.json')
+        print('wrote profile to {}'.format(options.profile), file=sys.stderr)
+    atexit.register(finish)
@@ -0,0 +1,170 @@
+# Support for reporting progress and throughput of long-running scripts.
+
+# Usage: add_progress_arguments(ap) in argparser(), then
+# progress = make_progress(args, 'tool', count_func), progress.update()
+# for each processed document and progress.finish() at the end. Reports
+# are written periodically to stderr and/or as a Prometheus node
+# exporter textfile. When no reporting is requested, make_progress()
+# returns a shared no-op reporter.
+
+import sys
+import os
+import resource
+
+from datetime import timedelta
+from time import time, monotonic
+
+
+# Default seconds between reports
+REPORT_INTERVAL = 10.0
+
+# Documents between checks of the clock
+CHECK_EVERY = 100
+
+# Prefix for Prometheus metric names
+METRIC_PREFIX = 'consensus_progress'
+
+METRICS = [
+    ('documents_total', 'counter', 'Documents processed'),
+    ('annotations_total', 'counter', 'Annotations processed'),
+    ('documents_expected', 'gauge', 'Documents expected in total'),
+    ('documents_per_second', 'gauge', 'Recent document throughput'),
+    ('annotations_per_second', 'gauge', 'Recent annotation throughput'),
+    ('eta_seconds', 'gauge', 'Estimated seconds remaining'),
+    ('rss_bytes', 'gauge', 'Resident set size of process'),
+    ('last_update_timestamp_seconds', 'gauge', 'Time of last report'),
+    ('done', 'gauge', '1 if processing has finished, 0 otherwise'),
+]
+
+
+def add_progress_arguments(ap):
+    ap.add_argument('--progress', default=False, action='store_true',
+                    help='report progress periodically on stderr')
+    ap.add_argument('--progress-file', metavar='FILE', default=None,
+                    help='write progress to Prometheus textfile FILE (.prom)')
+    ap.add_argument('--progress-interval', metavar='SEC', type=float,
+                    default=REPORT_INTERVAL, help='seconds between reports')
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # peak RSS, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class NullProgress(object):
+    def update(self, docs=1, annotations=0):
+        pass
+
+    def finish(self):
+        pass
+
+
+class Progress(object):
+    def __init__(self, tool, expected=None, textfile=None, stderr=False,
+                 interval=REPORT_INTERVAL):
+        self.tool = tool
+        self.expected = expected
+        self.textfile = textfile
+        self.stderr = stderr
+        self.interval = interval
+        self.docs = 0
+        self.annotations = 0
+        self.next_check = CHECK_EVERY
+        self.start = self.last_time = monotonic()
+        self.last_docs = self.last_annotations = 0
+        self.done = False
+
+    def update(self, docs=1, annotations=0):
+        self.docs += docs
+        self.annotations += annotations
+        if self.docs >= self.next_check:
+            self.next_check = self.docs + CHECK_EVERY
+            if monotonic() - self.last_time >= self.interval:
+                self.report()
+
+    def finish(self):
+        self.done = True
+        self.report()
+
+    def report(self):
+        now = monotonic()
+        if self.done:
+            # Final report gives averages over the whole run
+            self.last_time, self.last_docs, self.last_annotations = \
+                self.start, 0, 0
+        elapsed = max(now - self.last_time, 1e-9)
+        values = {
+            'documents_total': self.docs,
+            'annotations_total': self.annotations,
+            'documents_expected': self.expected,
+            'documents_per_second': (self.docs-self.last_docs) / elapsed,
+            'annotations_per_second':
+                (self.annotations-self.last_annotations) / elapsed,
+            'eta_seconds': self.eta(now),
+            'rss_bytes': rss_bytes(),
+            'last_update_timestamp_seconds': time(),
+            'done': int(self.done),
+        }
+        self.last_time = now
+        self.last_docs, self.last_annotations = self.docs, self.annotations
+        if self.textfile is not None:
+            self.write_textfile(values)
+        if self.stderr:
+            self.write_stderr(values)
+
+    def eta(self, now):
+        if self.done:
+            return 0
+        if self.expected is None or self.docs == 0:
+            return None
+        rate = self.docs / (now - self.start)
+        return max(0, self.expected - self.docs) / rate
+
+    def write_textfile(self, values):
+        lines = []
+        for name, type_, help_ in METRICS:
+            if values[name] is None:
+                continue
+            metric = '{}_{}'.format(METRIC_PREFIX, name)
+            lines.append('# HELP {} {}'.format(metric, help_))
+            lines.append('# TYPE {} {}'.format(metric, type_))
+            lines.append('{}{{tool="{}"}} {}'.format(
+                metric, self.tool, values[name]))
+        # Write and rename so that the exporter never sees a partial file
+        tmppath = '{}.{}.tmp'.format(self.textfile, os.getpid())
+        with open(tmppath, 'w') as out:
+            out.write('\n'.join(lines) + '\n')
+        os.replace(tmppath, self.textfile)
+
+    def write_stderr(self, values):
+        if self.expected is not None:
+            count = '{}/{} docs ({:.1%})'.format(
+                self.docs, self.expected, self.docs/max(1, self.expected))
+        else:
+            count = '{} docs'.format(self.docs)
+        eta = values['eta_seconds']
+        eta = 'unknown' if eta is None else str(timedelta(seconds=int(eta)))
+        print('{}: {}, {:.0f} docs/s, {:.0f} ann/s, ETA {}, RSS {} MB'.format(
+            self.tool, count, values['documents_per_second'],
+            values['annotations_per_second'], eta,
+            values['rss_bytes'] // 2**20), file=sys.stderr)
+
+
+_NULL_PROGRESS = NullProgress()
+
+
+def make_progress(options, tool, count_expected=None):
+    """Return progress reporter for options.
+
+    count_expected is an optional function returning the expected
+    number of documents, called only if progress is reported.
+    """
+    if not options.progress and options.progress_file is None:
+        return _NULL_PROGRESS
+    expected = count_expected() if count_expected is not None else None
+    return Progress(tool, expected, options.progress_file, options.progress,
+                    options.progress_interval)
@@ -0,0 +1,67 @@
+# Support for reading titles and abstracts from PubMed XML packages.
+
+import gzip
+
+from xml.etree import ElementTree as ET
+from logging import warning
+
+
+# Actions in PubMed XML packages
+UPSERT, DELETE = 'upsert', 'delete'
+
+
+def element_text(element):
+    if element is None:
+        return ''
+    return ''.join(element.itertext()).strip()
+
+
+def citation_text(article):
+    """Return title and abstract of PubmedArticle element as text.
+
+    The title is placed on the first line and the abstract (with any
+    structured abstract sections joined by space) on the second.
+    """
+    citation = article.find('MedlineCitation')
+    title = element_text(citation.find('Article/ArticleTitle'))
+    abstract = ' '.join(
+        t for t in (element_text(e) for e in
+                    citation.iterfind('Article/Abstract/AbstractText'))
+        if t
+    )
+    return '\n'.join(s for s in (title, abstract) if s) + '\n'
+
+
+def open_package(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    else:
+        return open(path, 'rb')
+
+
+def iter_package(path):
+    """Iterate over (action, PMID, text) for citations in PubMed XML package.
+
+    Action is UPSERT for citations and DELETE for deleted citations, for
+    which text is None. Actions are generated in package order, so
+    applying them in sequence gives the final state.
+    """
+    with open_package(path) as f:
+        stack = []
+        for event, element in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element.tag)
+                continue
+            stack.pop()
+            if element.tag == 'PubmedArticle':
+                pmid = element_text(element.find('MedlineCitation/PMID'))
+                if not pmid:
+                    warning('skipping citation without PMID in {}'.format(
+                        path))
+                else:
+                    yield UPSERT, pmid, citation_text(element)
+                element.clear()
+            elif element.tag == 'PMID' and stack[-1:] == ['DeleteCitation']:
+                yield DELETE, element_text(element), None
+            elif element.tag == 'DeleteCitation':
+                element.clear()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Query annotation index built with makeannindex.py.
+
+# Terms are given as [DATASET@]id:ID or [DATASET@]type:TYPE, e.g.
+# pubtator@id:NCBITaxon:9606. Terms without a dataset match documents
+# in any dataset. Outputs IDs of documents matching all terms (or any
+# term with --union), one per line, as read by --ids.
+
+import sys
+import os
+
+from annindex import AnnotationIndex, intersection, union
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Query annotation index.')
+    ap.add_argument('-c', '--count', default=False, action='store_true',
+                    help='only output number of matching documents')
+    ap.add_argument('-u', '--union', default=False, action='store_true',
+                    help='match documents with any term (default all)')
+    ap.add_argument('index', metavar='INDEX', help='index DB')
+    ap.add_argument('terms', metavar='TERM', nargs='+', help='query terms')
+    return ap
+
+
+def parse_term(term):
+    """Return (dataset, term) for [DATASET@]TERM."""
+    if '@' in term.split(':', 1)[0]:
+        dataset, term = term.split('@', 1)
+        return dataset, term
+    return None, term
+
+
+def query(index, terms, options):
+    postings_lists = []
+    for term in terms:
+        dataset, term = parse_term(term)
+        if dataset is not None and dataset not in index.datasets():
+            raise KeyError('no dataset {} in {}'.format(dataset, index.path))
+        postings_lists.append(index.postings(term, dataset))
+    if options.union:
+        return union(postings_lists)
+    else:
+        return intersection(postings_lists)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if not os.path.exists(args.index):
+        print('no such file: {}'.format(args.index), file=sys.stderr)
+        return 1
+    index = AnnotationIndex(args.index)
+    try:
+        doc_ids = query(index, args.terms, args)
+    except KeyError as e:
+        print('error: {}'.format(e.args[0]), file=sys.stderr)
+        return 1
+    try:
+        if args.count:
+            print(len(doc_ids))
+        else:
+            for doc_id in doc_ids:
+                print(doc_id)
+    except BrokenPipeError:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# Convert SQLiteDict DB to compressed (or uncompressed) value encoding
+# and/or integer-keyed layout.
+
+# The table given with --table (default SqliteDict default table) is
+# re-encoded with the given codec and layout, which are recorded in the
+# DB metadata (see dbcodec.py and intkeydb.py); other tables are copied
+# as they are. For zstd, a dictionary is by default trained on a sample
+# of values. The output is written to a temporary file and renamed when
+# complete.
+
+import sys
+import os
+import sqlite3
+
+from itertools import islice
+from logging import error
+
+from dbcodec import TABLENAME, META_TABLE, CODECS, Codec
+from dbcodec import open_db, read_meta, write_meta, make_meta
+from dbcodec import train_dictionary
+from intkeydb import LAYOUTS, STRING_LAYOUT, INTKEY_LAYOUT, DEFAULT_SUFFIXES
+from intkeydb import IntKeyDict
+from progress import add_progress_arguments, make_progress
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# Number of items per bulk insert
+BATCH_SIZE = 10000
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Recompress SQLiteDict DB.')
+    ap.add_argument('-c', '--codec', choices=CODECS + ('none',),
+                    default='zstd', help='value codec')
+    ap.add_argument('-d', '--dict-size', metavar='BYTES', type=int,
+                    default=112640,
+                    help='zstd dictionary size (0 for no dictionary)')
+    ap.add_argument('-k', '--layout', choices=LAYOUTS, default=STRING_LAYOUT,
+                    help='key layout (intkey for numeric document IDs)')
+    ap.add_argument('-l', '--level', metavar='N', type=int, default=None,
+                    help='compression level (default depends on codec)')
+    ap.add_argument('-n', '--samples', metavar='N', type=int, default=10000,
+                    help='number of values to train dictionary on')
+    ap.add_argument('-t', '--table', default=TABLENAME,
+                    help='table to recompress')
+    ap.add_argument('input', metavar='DB', help='input database')
+    ap.add_argument('output', metavar='DB', help='output database')
+    add_progress_arguments(ap)
+    return ap
+
+
+def list_tables(conn):
+    return [
+        name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'")
+        if name != META_TABLE
+    ]
+
+
+def sample_values(db, count):
+    """Return about count values spread evenly over DB."""
+    step = max(1, len(db) // count)
+    keys = list(islice(db.iterkeys(), 0, None, step))[:count]
+    return [db[key] for key in keys]
+
+
+def make_codec(db, options):
+    if options.codec == 'none':
+        return None
+    dictionary = None
+    if options.codec == 'zstd' and options.dict_size > 0:
+        samples = sample_values(db, options.samples)
+        if samples:
+            dictionary = train_dictionary(samples, options.dict_size)
+    return Codec(options.codec, options.level, dictionary)
+
+
+def open_output(path, table, codec, layout):
+    coding = {}
+    if codec is not None:
+        coding = { 'encode': codec.encode, 'decode': codec.decode }
+    if layout == INTKEY_LAYOUT:
+        return IntKeyDict(path, tablename=table, **coding)
+    else:
+        return SqliteDict(path, tablename=table, **coding)
+
+
+def recompress_table(in_db, out_db, progress):
+    count, batch = 0, []
+    for key, value in in_db.items():
+        batch.append((key, value))
+        if len(batch) >= BATCH_SIZE:
+            out_db.update(batch)
+            progress.update(docs=len(batch))
+            count += len(batch)
+            batch = []
+    out_db.update(batch)
+    progress.update(docs=len(batch))
+    count += len(batch)
+    out_db.commit()
+    return count
+
+
+def copy_table(conn, table):
+    """Copy table with indices from attached source DB."""
+    for (sql,) in conn.execute(
+            'SELECT sql FROM source.sqlite_master WHERE tbl_name=? AND '
+            'sql IS NOT NULL ORDER BY type DESC', (table,)):
+        conn.execute(sql)    # CREATE TABLE before CREATE INDEX
+    conn.execute('INSERT INTO "{0}" SELECT * FROM source."{0}"'.format(
+        table))
+
+
+def recompress(inpath, outpath, options):
+    in_conn = sqlite3.connect('file:{}?mode=ro'.format(inpath), uri=True)
+    tables = list_tables(in_conn)
+    in_conn.close()
+    if options.table not in tables:
+        raise KeyError('no table {} in {}'.format(options.table, inpath))
+
+    # No close() as this is read-only and close() can block
+    in_db = open_db(inpath, flag='r', tablename=options.table)
+    codec = make_codec(in_db, options)
+
+    if os.path.exists(outpath):
+        os.remove(outpath)    # partial output from failed run
+    with open_output(outpath, options.table, codec, options.layout) as out_db:
+        progress = make_progress(options, 'recompress', lambda: len(in_db))
+        count = recompress_table(in_db, out_db, progress)
+        progress.finish()
+
+    conn = sqlite3.connect(outpath)
+    conn.execute('ATTACH DATABASE ? AS source', (inpath,))
+    for table in tables:
+        if table != options.table:
+            copy_table(conn, table)
+    conn.commit()
+    conn.execute('DETACH DATABASE source')
+    conn.close()
+
+    for table in tables:
+        if table == options.table:
+            meta = make_meta(codec, options.layout, DEFAULT_SUFFIXES)
+        else:
+            meta = read_meta(inpath, table)
+        if meta is not None:
+            write_meta(outpath, meta, table)
+    return count, codec
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if not os.path.exists(args.input):
+        print('no such file: {}'.format(args.input), file=sys.stderr)
+        return 1
+    tmppath = args.output + '.tmp'
+    try:
+        count, codec = recompress(args.input, tmppath, args)
+    except KeyError as e:
+        print('error: {}'.format(e.args[0]), file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    os.rename(tmppath, args.output)
+    insize, outsize = os.path.getsize(args.input), os.path.getsize(args.output)
+    print('Done, recompressed {} values with {} in {} layout, {} -> {} '
+          'bytes'.format(count, codec if codec is not None else 'no codec',
+                         args.layout, insize, outsize), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
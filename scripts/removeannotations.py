@@ -9,15 +9,16 @@ import os
 
 from collections import Counter, OrderedDict
 from itertools import chain
-from logging import warning, error
+from logging import warning
 
 from standoff import parse_standoff
-
-try:
-    import sqlitedict
-except ImportError:
-    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
-    raise
+from docset import read_docset, docset_items, count_docs, DEFAULT_SEED
+from profiling import add_profile_arguments, start_profiling
+from profiling import phase, timed_iter, timed_decode
+from progress import add_progress_arguments, make_progress
+from idmap import read_id_maps, canonical_ids
+from dbcodec import open_db
+from prefetch import add_prefetch_arguments, prefetch, fetch_values
 
 
 ANN_SUFFIX, TXT_SUFFIX = '.ann', '.txt'
@@ -28,6 +29,8 @@ def argparser():
     ap = argparse.ArgumentParser()
     ap.add_argument('-l', '--limit', metavar='N', type=int, default=None,
                     help='only compare first N documents')
+    ap.add_argument('-n', '--norm', default=False, action='store_true',
+                    help='only match annotations with same normalized ID')
     ap.add_argument('-o', '--overlap', default=False, action='store_true',
                     help='accept annotation overlap as match')
     ap.add_argument('-r', '--random', metavar='RATIO', default=None,
@@ -36,18 +39,41 @@ def argparser():
                     help='suffix of annotation files')
     ap.add_argument('-t', '--include-text', default=False, action='store_true',
                     help='include text to align to in output')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only process documents with IDs in FILE, updating'
+                    ' output DB in place')
+    ap.add_argument('--id-map', metavar='FILE', default=None,
+                    action='append', help='map equivalent normalized IDs'
+                    ' (TSV or NCBI taxonomy merged.dmp)')
+    ap.add_argument('--seed', metavar='SEED', type=int, default=DEFAULT_SEED,
+                    help='seed for --random document sampling')
     ap.add_argument('fromset', metavar='NAME:DB',
                     help='annotation set to remove from')
     ap.add_argument('output', metavar='DB',
                     help='output DB')
     ap.add_argument('sets', metavar='NAME:DB', nargs='+',
                     help='annotation sets to remove')
+    add_prefetch_arguments(ap)
+    add_profile_arguments(ap)
+    add_progress_arguments(ap)
     return ap
 
 
 def remove(annset1, annset2, options):
     remaining, removed = [], []
-    if not options.overlap:
+    if not options.overlap and options.norm:
+        # index by (start, end, canonical ID)
+        index = set()
+        for a in annset2:
+            for norm_id in canonical_ids(a, options.id_map):
+                index.add((a.start, a.end, norm_id))
+        for a in annset1:
+            if any((a.start, a.end, n) in index
+                   for n in canonical_ids(a, options.id_map)):
+                removed.append(a)
+            else:
+                remaining.append(a)
+    elif not options.overlap:
         ann_by_span = { (a.start, a.end): a for a in annset2 }
         for a in annset1:
             m = ann_by_span.get((a.start, a.end))
@@ -59,6 +85,10 @@ def remove(annset1, annset2, options):
         # overlap matching (TODO: avoid O(n^2))
         for a in annset1:
             overlaps = [o for o in annset2 if a.overlaps(o)]
+            if options.norm:
+                norm_ids = canonical_ids(a, options.id_map)
+                overlaps = [o for o in overlaps if
+                            norm_ids & canonical_ids(o, options.id_map)]
             if not overlaps:
                 remaining.append(a)
             else:
@@ -69,18 +99,25 @@ def remove(annset1, annset2, options):
 def remove_datasets(datasets, options):
     name_from, db_from = list(datasets.items())[0]
     doc_count, missing_by_dataset = 0, Counter()
-    with sqlitedict.SqliteDict(options.output, autocommit=False) as out_db:
-        for key, val_from in db_from.items():
+    with open_db(options.output) as out_db:
+        items = docset_items(db_from, options.suffix, options.ids,
+                             options.random, options.seed)
+        def count_expected():
+            count = count_docs(db_from, options.suffix, options.ids,
+                               options.random)
+            return count if options.limit is None else min(count, options.limit)
+        progress = make_progress(options, 'removeannotations', count_expected)
+        others = list(datasets.items())[1:]
+        fetched = prefetch(fetch_values(items, [db for name, db in others]),
+                           options.prefetch)
+        for key, fetched_values in timed_iter(fetched, 'fetch'):
             if options.limit is not None and doc_count >= options.limit:
                 break
             root, suffix = os.path.splitext(key)
-            if suffix != options.suffix:
-                continue
             text_key = root+TXT_SUFFIX
 
-            names, values, missing = [name_from], [val_from], False
-            for name, db in list(datasets.items())[1:]:
-                val = db.get(key)
+            names, values, missing = [name_from], fetched_values[:1], False
+            for (name, db), val in zip(others, fetched_values[1:]):
                 if val is None:
                     missing_by_dataset[name] += 1
                     warning('{} not found for {}'.format(key, name))
@@ -89,35 +126,46 @@ def remove_datasets(datasets, options):
                 names.append(name)
                 values.append(val)
             if missing:
+                if options.ids is not None and key in out_db:
+                    del out_db[key]    # previous output is outdated
                 continue    # incomplete data
 
-            annsets = [
-                parse_standoff(val, '{}/{}'.format(name, key), name)
-                for name, val in zip(names, values)
-            ]
+            with phase('parse'):
+                annsets = [
+                    parse_standoff(val, '{}/{}'.format(name, key), name)
+                    for name, val in zip(names, values)
+                ]
 
-            from_aset = annsets[0]
-            for aset in annsets[1:]:
-                from_aset = remove(from_aset, aset, options)
+            with phase('remove'):
+                from_aset = annsets[0]
+                for aset in annsets[1:]:
+                    from_aset = remove(from_aset, aset, options)
 
-            for a in from_aset:
-                a.remove_id_prefix()
+            with phase('output'):
+                for a in from_aset:
+                    a.remove_id_prefix()
 
-            ann_str = '\n'.join(str(a) for a in from_aset)
-            out_db[key] = ann_str
+                ann_str = '\n'.join(str(a) for a in from_aset)
+                out_db[key] = ann_str
 
-            if options.include_text:
-                out_db[text_key] = from_db.get(text_key)
+                if options.include_text:
+                    out_db[text_key] = db_from.get(text_key)
 
             doc_count += 1
+            progress.update(annotations=len(annsets[0]))
 
             if doc_count % 1000 == 0:
-                print('Inserted {}, committing...'.format(
-                    doc_count, end='', file=sys.stderr, flush=True))
                 out_db.commit()
-                print('done.', file=sys.stderr)
+
+        if options.ids is not None:
+            # Remove output for documents no longer in the source set
+            for id_ in options.ids:
+                key = id_ + options.suffix
+                if key not in db_from and key in out_db:
+                    del out_db[key]
 
         out_db.commit()
+        progress.finish()
 
     missing = 'none' if not missing_by_dataset else dict(missing_by_dataset)
     print('Done, processed {} (missing: {})'.format(doc_count, missing))
@@ -138,17 +186,21 @@ def get_datasets(options):
             print('no such file: {}'.format(path), file=sys.stderr)
             return None
         # No close() as this is read-only and close() can block
-        db = sqlitedict.SqliteDict(path, flag='r', autocommit=False)
-        datasets[name] = db
+        db = open_db(path, flag='r')
+        datasets[name] = timed_decode(db)
     return datasets
 
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
     if args.random is not None and not 0 < args.random < 1:
         print('error: must have 0 < RATIO < 1 for --random',
               file=sys.stderr)
         return 1
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    args.id_map = read_id_maps(args.id_map if args.id_map else [])
     datasets = get_datasets(args)
     if datasets is None:
         return 1
@@ -0,0 +1,165 @@
+# On-disk cache of per-document results keyed by content hash.
+
+# Tools that compute per-document results from annotation values (e.g.
+# comparison stats and instance lines, standoff stats) store them here
+# keyed by a hash of the values, the options that affect the results
+# and the version of the code computing them (see make_key() and
+# code_version()), so that a rerun after a small part of the documents
+# has changed only recomputes the results for those. Results are stored
+# pickled and compressed in an SQLite table together with their size
+# and the time of last use, and close() evicts the least recently used
+# results to keep the total size within the given bound.
+
+import os
+import sys
+import time
+import zlib
+import pickle
+import sqlite3
+import hashlib
+
+
+DEFAULT_SIZE_MB = 1024
+
+TABLENAME = 'results'
+
+DIGEST_SIZE = 16
+
+# Number of stored or used results to buffer between writes
+BATCH_SIZE = 1000
+
+
+def add_cache_arguments(ap):
+    ap.add_argument('--cache', metavar='FILE', default=None,
+                    help='cache per-document results in FILE')
+    ap.add_argument('--cache-size', metavar='MB', type=int,
+                    default=DEFAULT_SIZE_MB,
+                    help='maximum cache size (default {})'.format(
+                        DEFAULT_SIZE_MB))
+
+
+def make_key(*parts):
+    """Return hash of str or bytes parts."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # Length prefix so that e.g. ('ab', 'c') and ('a', 'bc') differ
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.digest()
+
+
+def file_hash(*paths):
+    """Return hash of contents of files."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def code_version(*module_names):
+    """Return hash of the source files of the named (imported) modules."""
+    return file_hash(*(sys.modules[n].__file__ for n in module_names))
+
+
+class ResultCache(object):
+    """Results stored in SQLite DB at path, at most max_bytes in total."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.now = time.time()
+        self._added = []
+        self._used = []
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS {} (key BLOB PRIMARY KEY,'
+            ' value BLOB, size INTEGER, used REAL)'.format(TABLENAME))
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS {0}_used ON {0} (used)'.format(
+                TABLENAME))
+        self.conn.commit()
+
+    def get(self, key):
+        """Return result for key, None if not cached."""
+        row = self.conn.execute(
+            'SELECT value FROM {} WHERE key = ?'.format(TABLENAME),
+            (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.append((self.now, key))
+        if len(self._used) >= BATCH_SIZE:
+            self.flush()
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, key, result):
+        value = zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        self._added.append((key, value, len(key)+len(value), self.now))
+        if len(self._added) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO {} (key, value, size, used)'
+            ' VALUES (?, ?, ?, ?)'.format(TABLENAME), self._added)
+        self.conn.executemany(
+            'UPDATE {} SET used = ? WHERE key = ?'.format(TABLENAME),
+            self._used)
+        self.conn.commit()
+        self._added, self._used = [], []
+
+    def size(self):
+        row = self.conn.execute(
+            'SELECT SUM(size) FROM {}'.format(TABLENAME)).fetchone()
+        return row[0] or 0
+
+    def evict(self):
+        """Remove least recently used results until within max_bytes."""
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        removed, keys = 0, []
+        cursor = self.conn.execute(
+            'SELECT key, size FROM {} ORDER BY used, rowid'.format(TABLENAME))
+        for key, size in cursor:
+            if removed >= excess:
+                break
+            keys.append((key,))
+            removed += size
+        cursor.close()
+        self.conn.executemany(
+            'DELETE FROM {} WHERE key = ?'.format(TABLENAME), keys)
+        self.conn.commit()
+        self.evicted += len(keys)
+
+    def close(self):
+        self.flush()
+        self.evict()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return '{}: {} hits, {} misses, {} evicted'.format(
+            os.path.basename(self.path), self.hits, self.misses, self.evicted)
+
+
+def open_cache(options):
+    """Return ResultCache for add_cache_arguments() options, None if no
+    cache."""
+    if options.cache is None:
+        return None
+    return ResultCache(options.cache, options.cache_size * 1024 * 1024)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Run annalign.py in parallel over key-range shards and merge the results.
+
+# Documents are split into contiguous ranges of IDs. Each range is
+# aligned by a separate annalign.py process into its own shard DB, and
+# the shard DBs are merged into the output once all have completed.
+# Completed shards are marked and skipped when the script is rerun.
+
+import sys
+import os
+import shutil
+import subprocess
+
+from multiprocessing import Pool
+from logging import error
+
+from docset import read_docset, write_docset
+from mergesqlite import copy_documents, merge_dbs
+from dbcodec import open_db
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# Marker for completed shard plan in work directory
+PLAN_DONE = 'plan.done'
+
+
+def argparser():
+    from argparse import ArgumentParser, REMAINDER
+    ap = ArgumentParser(description='Run annalign.py on shards in parallel.')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=4,
+                    help='number of parallel alignment processes')
+    ap.add_argument('-k', '--keep', default=False, action='store_true',
+                    help='keep shard DBs after merging')
+    ap.add_argument('-n', '--shards', metavar='N', type=int, default=100,
+                    help='number of key-range shards')
+    ap.add_argument('-w', '--workdir', metavar='DIR', default=None,
+                    help='directory for shard DBs (default OUTPUT.shards)')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only align documents with IDs in FILE')
+    ap.add_argument('annalign', metavar='ANNALIGN', help='path to annalign.py')
+    ap.add_argument('source', metavar='DB', help='DB with annotations to align')
+    ap.add_argument('target', metavar='DB', help='DB with texts to align to')
+    ap.add_argument('output', metavar='DB', help='output DB')
+    ap.add_argument('args', metavar='ARG', nargs=REMAINDER,
+                    help='arguments to annalign.py (after --)')
+    return ap
+
+
+def shard_path(workdir, index, suffix):
+    return os.path.join(workdir, 'shard-{:04d}{}'.format(index, suffix))
+
+
+def list_ids(dbpath, docset=None):
+    # No close() as this is read-only and close() can block
+    db = open_db(dbpath, flag='r')
+    ids = set(os.path.splitext(k)[0] for k in db.iterkeys())
+    if docset is not None:
+        ids &= set(docset)
+    return sorted(ids)
+
+
+def plan_shards(workdir, source, shard_count, docset=None):
+    """Split document IDs in source into ranges, return number of shards.
+
+    The plan is stored in the work directory and reused on rerun so that
+    shard boundaries stay the same.
+    """
+    done_path = os.path.join(workdir, PLAN_DONE)
+    if os.path.exists(done_path):
+        with open(done_path) as f:
+            return int(f.read())
+    ids = list_ids(source, docset)
+    size = max(1, -(-len(ids) // shard_count))    # ceil
+    count = 0
+    for index, start in enumerate(range(0, len(ids), size)):
+        write_docset(shard_path(workdir, index, '.ids'), ids[start:start+size])
+        count += 1
+    with open(done_path, 'w') as f:
+        f.write(str(count))
+    print('Split {} documents into {} shards'.format(len(ids), count),
+          file=sys.stderr)
+    return count
+
+
+def extract_subset(outpath, inpath, docset):
+    in_db = open_db(inpath, flag='r')
+    with SqliteDict(outpath, flag='n', autocommit=False) as out_db:
+        copy_documents(out_db, in_db, docset)
+        out_db.commit()
+
+
+def align_shard(job):
+    index, workdir, options = job
+    docset = read_docset(shard_path(workdir, index, '.ids'))
+    source = shard_path(workdir, index, '.source.sqlite')
+    target = shard_path(workdir, index, '.target.sqlite')
+    output = shard_path(workdir, index, '.sqlite')
+    if os.path.exists(output):
+        os.remove(output)    # partial output from failed run
+    extract_subset(source, options.source, docset)
+    extract_subset(target, options.target, docset)
+    command = ([sys.executable, options.annalign] + options.args +
+               ['-D', source, source, target, '-o', output])
+    with open(shard_path(workdir, index, '.log'), 'w') as log:
+        result = subprocess.run(command, stdout=log, stderr=log)
+    os.remove(source)
+    os.remove(target)
+    if result.returncode == 0:
+        open(output + '.done', 'w').close()
+    return index, result.returncode
+
+
+def shard_align(options):
+    workdir = options.workdir
+    os.makedirs(workdir, exist_ok=True)
+    shard_count = plan_shards(workdir, options.source, options.shards,
+                              options.ids)
+
+    todo = [
+        i for i in range(shard_count)
+        if not os.path.exists(shard_path(workdir, i, '.sqlite.done'))
+    ]
+    print('{}/{} shards to do'.format(len(todo), shard_count),
+          file=sys.stderr)
+
+    failed = 0
+    with Pool(options.jobs) as pool:
+        jobs = [(i, workdir, options) for i in todo]
+        for index, returncode in pool.imap_unordered(align_shard, jobs):
+            if returncode != 0:
+                failed += 1
+                error('shard {} failed, see {}'.format(
+                    index, shard_path(workdir, index, '.log')))
+            else:
+                print('Aligned shard {}'.format(index), file=sys.stderr)
+    if failed:
+        return failed
+
+    # Merge into temporary file so that an existing output is complete
+    tmppath = options.output + '.tmp'
+    SqliteDict(tmppath, flag='n').close()    # output even without shards
+    shards = [shard_path(workdir, i, '.sqlite') for i in range(shard_count)]
+    shards = [s for s in shards if os.path.exists(s)]    # may have no output
+    merge_dbs(tmppath, shards)
+    os.rename(tmppath, options.output)
+    if not options.keep:
+        shutil.rmtree(workdir)
+    return 0
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.args and args.args[0] == '--':
+        args.args = args.args[1:]
+    for path in (args.annalign, args.source, args.target):
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    if args.workdir is None:
+        args.workdir = args.output + '.shards'
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    failed = shard_align(args)
+    if failed:
+        print('{} shards failed, rerun to retry'.format(failed),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
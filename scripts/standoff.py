@@ -122,6 +122,8 @@ def parse_standoff(ann, source='<INPUT>', annset=None):
             except Exception as e:
                 error('line {} in {}: {}'.format(ln, source, l))
                 raise
+        elif l[0] == '#':
+            continue    # notes, e.g. consensus provenance
         else:
             warning('skipping line {} in {}: {}'.format(ln, source, l))
             continue
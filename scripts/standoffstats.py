@@ -7,6 +7,16 @@ from collections import defaultdict, OrderedDict, Counter
 from logging import info, warning
 
 from standoff import Textbound, Normalization
+from idmap import TAXONOMY_PREFIX
+from docset import read_docset, docset_items, count_docs
+from profiling import add_profile_arguments, start_profiling
+from profiling import phase, timed_iter, timed_decode
+from progress import add_progress_arguments, make_progress
+from statsjson import write_stats, merge_stats
+from dbcodec import open_db
+from prefetch import add_prefetch_arguments, prefetch
+from resultcache import add_cache_arguments, open_cache, make_key
+from resultcache import file_hash, code_version
 
 try:
     import sqlitedict
@@ -15,8 +25,8 @@ except ImportError:
     raise
 
 
-# Normalization DB/ontology prefixes
-TAXONOMY_PREFIX = 'NCBITaxon:'
+# Key for totals in per-document stats DB
+DOC_STATS_TOTAL = '<TOTAL>'
 
 # NCBI Taxonomy dump files
 TAXONOMY_NODES = 'nodes.dmp'
@@ -67,6 +77,9 @@ STATS_ORDER = [
 def argparser():
     import argparse
     ap = argparse.ArgumentParser()
+    ap.add_argument('-d', '--doc-stats', metavar='DB', default=None,
+                    help='store per-document stats in DB (with --ids, update'
+                    ' totals from stored stats)')
     ap.add_argument('-l', '--limit', metavar='INT', type=int,
                     help='maximum number of documents to process')
     ap.add_argument('-s', '--suffix', default='.ann',
@@ -75,7 +88,16 @@ def argparser():
                     help='show top N most frequent')
     ap.add_argument('-T', '--taxdata', metavar='DIR', default=None,
                     help='NCBI taxonomy data directory')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only process documents with IDs in FILE')
+    ap.add_argument('--json', metavar='FILE', default=None,
+                    help='write full stats for all DBs to FILE (JSON, or'
+                    ' NDJSON if FILE ends with .ndjson)')
     ap.add_argument('data', nargs='+', metavar='DB')
+    add_cache_arguments(ap)
+    add_prefetch_arguments(ap)
+    add_profile_arguments(ap)
+    add_progress_arguments(ap)
     return ap
 
 
@@ -120,6 +142,7 @@ def take_stats(txt, ann, fn, stats, options):
     for ln, line in enumerate(ann.splitlines(), start=1):
         if not line or line.isspace() or line[0] not in 'TN':
             info('skipping line {} in {}: {}'.format(ln, fn, line))
+            continue
         if line[0] == 'T':
             id_, type_span, text = line.split('\t')
             type_, span = type_span.split(' ', 1)
@@ -177,20 +200,120 @@ def take_stats(txt, ann, fn, stats, options):
         stats[CONSISTENCY]['inconsistent'] += 1
 
 
+def count_textbounds(ann):
+    return ann.count('\nT') + ann.startswith('T')
+
+
+def make_db_progress(db, options):
+    def count_expected():
+        count = count_docs(db, options.suffix, options.ids)
+        return count if options.limit is None else min(count, options.limit)
+    return make_progress(options, 'standoffstats', count_expected)
+
+
 def process_db(path, stats, options):
     # No context manager: close() can block and this is read-only
-    db = sqlitedict.SqliteDict(path, flag='r', autocommit=False)
+    db = timed_decode(open_db(path, flag='r'))
     count = 0
-    for key, val in db.items():
-        root, ext = os.path.splitext(key)
-        if ext != options.suffix:
-            continue
+    progress = make_db_progress(db, options)
+    items = docset_items(db, options.suffix, options.ids)
+    for key, val in timed_iter(prefetch(items, options.prefetch), 'fetch'):
         # txt_key = '{}.txt'.format(root)
         # txt = db[txt_key]     # everything hangs if I do this
-        take_stats('', val, key, stats, options)
+        if options.result_cache is None:
+            with phase('stats'):
+                take_stats('', val, key, stats, options)
+        else:
+            add_stats(stats, cached_stats(key, val, options))
         count += 1
+        progress.update(annotations=count_textbounds(val))
         if options.limit is not None and count >= options.limit:
             break
+    progress.finish()
+
+    print('Done, processed {}.'.format(count), file=sys.stderr)
+    return count
+
+
+def cached_stats(key, val, options):
+    """Return stats for document, from cache if available."""
+    cache = options.result_cache
+    cache_key = make_key(options.cache_version, val)
+    with phase('cache'):
+        doc_stats = cache.get(cache_key)
+    if doc_stats is None:
+        doc_stats = defaultdict(Counter)
+        with phase('stats'):
+            take_stats('', val, key, doc_stats, options)
+        doc_stats = { k: dict(v) for k, v in doc_stats.items() }
+        with phase('cache'):
+            cache.put(cache_key, doc_stats)
+    return doc_stats
+
+
+def cache_version(options):
+    """Return hash of the code and taxonomy data that per-document stats
+    depend on."""
+    if options.taxdata is None:
+        taxdata = b''
+    else:
+        taxdata = file_hash(*(
+            os.path.join(options.taxdata, n)
+            for n in (TAXONOMY_DIVISION, TAXONOMY_NODES, TAXONOMY_MERGED)
+        ))
+    return make_key(code_version(__name__, 'standoff', 'idmap'), taxdata)
+
+
+def add_stats(stats, doc_stats, sign=1):
+    for category, counts in doc_stats.items():
+        if sign > 0:
+            stats[category].update(counts)
+        else:
+            stats[category].subtract(counts)
+            stats[category] = +stats[category]    # drop non-positive
+            if not stats[category]:
+                del stats[category]
+
+
+def update_doc_stats(path, stats, options):
+    # Store stats for each document separately and keep totals so that
+    # with --ids only the contributions of the given documents need to
+    # be recomputed.
+    db = open_db(path, flag='r')
+    count = 0
+    progress = make_db_progress(db, options)
+    with sqlitedict.SqliteDict(options.doc_stats, autocommit=False) as sdb:
+        if options.ids is None:
+            sdb.clear()
+            items = docset_items(db, options.suffix)
+        else:
+            add_stats(stats, sdb.get(DOC_STATS_TOTAL, {}))
+            keys = (id_ + options.suffix for id_ in options.ids)
+            items = ((key, db.get(key)) for key in keys)
+        for key, val in items:
+            old = sdb.get(key) if options.ids is not None else None
+            if old is not None:
+                add_stats(stats, old, sign=-1)
+            if val is None:
+                if old is not None:
+                    del sdb[key]
+                continue
+            if options.result_cache is None:
+                doc_stats = defaultdict(Counter)
+                with phase('stats'):
+                    take_stats('', val, key, doc_stats, options)
+                doc_stats = { k: dict(v) for k, v in doc_stats.items() }
+            else:
+                doc_stats = cached_stats(key, val, options)
+            add_stats(stats, doc_stats)
+            sdb[key] = doc_stats
+            count += 1
+            progress.update(annotations=count_textbounds(val))
+            if options.limit is not None and count >= options.limit:
+                break
+        sdb[DOC_STATS_TOTAL] = { k: dict(v) for k, v in stats.items() }
+        sdb.commit()
+    progress.finish()
 
     print('Done, processed {}.'.format(count), file=sys.stderr)
     return count
@@ -198,7 +321,9 @@ def process_db(path, stats, options):
 
 def process(path, options):
     stats = defaultdict(Counter)
-    if is_sqlite_db(path):
+    if is_sqlite_db(path) and options.doc_stats is not None:
+        count = update_doc_stats(path, stats, options)
+    elif is_sqlite_db(path):
         count = process_db(path, stats, options)
     else:
         raise NotImplementedError('filesystem input ({})'.format(path))
@@ -210,7 +335,7 @@ def report_stats(stats, options, out=sys.stdout):
     rank = dict((c.split(' ')[0], i) for i, c in enumerate(STATS_ORDER))
     categories = sorted(categories, key=lambda k: (rank[k.split(' ')[0]], k))
     for category in categories:
-        if '{}' in category and category not in counts:
+        if '{}' in category and category not in stats:
             continue
         counts = stats[category]
         print('--- {} ---'.format(category), file=out)
@@ -272,11 +397,32 @@ class TaxonomyData(object):
 
 def main(argv):
     args = argparser().parse_args(argv[1:])
+    start_profiling(args)
+    if args.cache is not None:
+        args.cache_version = cache_version(args)
     if args.taxdata is not None:
         args.taxdata = TaxonomyData.from_directory(args.taxdata)
-    for d in args.data:
-        stats = process(d, args)
-        report_stats(stats, args)
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    if args.doc_stats is not None and len(args.data) > 1:
+        print('error: --doc-stats requires a single DB', file=sys.stderr)
+        return 1
+    total = {}
+    args.result_cache = open_cache(args)
+    try:
+        for d in args.data:
+            stats = process(d, args)
+            with phase('output'):
+                report_stats(stats, args)
+                if args.json is not None:
+                    merge_stats(total, stats)
+    finally:
+        if args.result_cache is not None:
+            args.result_cache.close()
+            print(args.result_cache, file=sys.stderr)
+    if args.json is not None:
+        with phase('output'):
+            write_stats(args.json, 'standoffstats', total)
     return 0
 
 
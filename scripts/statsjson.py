@@ -0,0 +1,73 @@
+# Support for machine-readable stats output as JSON or NDJSON.
+
+# Stats are nested dicts with numeric leaves, tagged with the kind of
+# stats (tool) that produced them. A .json file holds a single compact
+# document {"kind": KIND, "version": N, "stats": {...}}. A .ndjson file
+# holds the same header (without stats) on the first line followed by
+# one [key, ..., value] line per leaf, which keeps memory use and line
+# length bounded for large text counters.
+
+import json
+
+
+FORMAT_VERSION = 1
+
+NDJSON_SUFFIX = '.ndjson'
+
+
+class StatsFormatError(Exception):
+    pass
+
+
+def _leaves(stats, path=()):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _leaves(value, path + (key,))
+        else:
+            yield path + (key,), value
+
+
+def _set_leaf(stats, path, value):
+    for key in path[:-1]:
+        stats = stats.setdefault(key, {})
+    stats[path[-1]] = value
+
+
+def write_stats(path, kind, stats):
+    header = { 'kind': kind, 'version': FORMAT_VERSION }
+    with open(path, 'w') as out:
+        if path.endswith(NDJSON_SUFFIX):
+            print(json.dumps(header), file=out)
+            for keys, value in _leaves(stats):
+                print(json.dumps(list(keys) + [value], ensure_ascii=False),
+                      file=out)
+        else:
+            header['stats'] = stats
+            json.dump(header, out, separators=(',', ':'), ensure_ascii=False)
+
+
+def read_stats(path):
+    """Read stats written by write_stats(), return (kind, stats)."""
+    with open(path) as f:
+        if path.endswith(NDJSON_SUFFIX):
+            header, stats = json.loads(f.readline()), {}
+            for ln, l in enumerate(f, start=2):
+                fields = json.loads(l)
+                _set_leaf(stats, fields[:-1], fields[-1])
+        else:
+            header = json.load(f)
+            stats = header.pop('stats', {})
+    if header.get('version') != FORMAT_VERSION:
+        raise StatsFormatError('unsupported version {} in {}'.format(
+            header.get('version'), path))
+    return header['kind'], stats
+
+
+def merge_stats(target, source):
+    """Add numeric leaves of nested dict source into target."""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_stats(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+    return target
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+# Tag texts in SQLiteDict DB with transformers token classification
+# (NER) model and store predicted entities as standoff.
+
+# Texts are tokenized into windows of at most --max-length tokens, with
+# consecutive windows of long texts overlapping by --stride tokens.
+# Windows are sorted by length and grouped into batches of at most
+# --batch-tokens padded tokens. Predictions are mapped back to character
+# offsets using the tokenizer offset mapping, taking the prediction for
+# each token from the window where it is furthest from the window edges,
+# and entities are decoded over the whole text, so that entities
+# crossing window boundaries are kept whole. Chunks of
+# documents are processed on CPU by a pool of worker processes that
+# each load the model once. With --cache, tokenizations are reused
+# across runs for unchanged texts (see tokencache.py).
+
+import sys
+import os
+
+from multiprocessing import Pool
+from logging import error
+
+from docset import read_docset, docset_items, count_docs
+from progress import add_progress_arguments, make_progress
+from tokencache import TokenCache, tokenize_windows
+from dbcodec import open_db
+from parallel import bounded_imap
+
+try:
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+except ImportError:
+    error('failed to import transformers, try `pip3 install torch transformers`')
+    raise
+
+
+# Model, tokenizer and cache loaded by each worker process
+_model, _tokenizer, _cache, _options = None, None, None, None
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Tag texts with NER model.')
+    ap.add_argument('-b', '--batch-tokens', metavar='N', type=int,
+                    default=8192, help='maximum padded tokens per batch')
+    ap.add_argument('-c', '--chunk-size', metavar='N', type=int, default=1000,
+                    help='documents per worker task')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=4,
+                    help='number of worker processes')
+    ap.add_argument('-l', '--limit', metavar='N', type=int, default=None,
+                    help='only tag first N documents')
+    ap.add_argument('-m', '--max-length', metavar='N', type=int, default=512,
+                    help='maximum tokens per window')
+    ap.add_argument('-s', '--suffix', default='.txt', help='text key suffix')
+    ap.add_argument('-r', '--stride', metavar='N', type=int, default=128,
+                    help='tokens shared by consecutive windows')
+    ap.add_argument('-S', '--ann-suffix', default='.ann',
+                    help='annotation key suffix')
+    ap.add_argument('-t', '--threads', metavar='N', type=int, default=1,
+                    help='torch threads per worker process')
+    ap.add_argument('--cache', metavar='DIR', default=None,
+                    help='cache tokenizations in DIR')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only tag documents with IDs in FILE')
+    ap.add_argument('model', metavar='MODEL', help='model directory')
+    ap.add_argument('input', metavar='DB', help='DB with texts')
+    ap.add_argument('output', metavar='DB', help='output DB')
+    add_progress_arguments(ap)
+    return ap
+
+
+def init_worker(options):
+    global _model, _tokenizer, _cache, _options
+    torch.set_num_threads(options.threads)
+    _tokenizer = AutoTokenizer.from_pretrained(options.model)
+    _model = AutoModelForTokenClassification.from_pretrained(options.model)
+    _model.eval()
+    if options.cache is not None:
+        _cache = TokenCache(options.cache, _tokenizer, options.max_length,
+                            options.stride)
+    _options = options
+
+
+def tokenize(texts, cached):
+    """Return list of (doc index, input IDs, starts, ends, word IDs)
+    windows and new cache entries."""
+    if _cache is not None:
+        doc_windows, entries = _cache.tokenize(texts, cached)
+    else:
+        doc_windows = tokenize_windows(_tokenizer, texts, _options.max_length,
+                                       stride=_options.stride)
+        entries = {}
+    windows = []
+    for doc_index, doc in enumerate(doc_windows):
+        windows.extend((doc_index,) + window for window in doc)
+    return windows, entries
+
+
+def make_batches(windows, batch_tokens):
+    """Group windows of similar length into batches of bounded size."""
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i][1]))
+    batches, batch, longest = [], [], 0
+    for i in order:
+        length = len(windows[i][1])
+        if batch and max(longest, length) * (len(batch)+1) > batch_tokens:
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(i)
+        longest = max(longest, length)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def pad_batch(windows, batch, pad_token_id):
+    """Return model inputs for batch of windows with int32 input IDs."""
+    longest = max(len(windows[i][1]) for i in batch)
+    input_ids = torch.full((len(batch), longest), pad_token_id,
+                           dtype=torch.long)
+    attention_mask = torch.zeros((len(batch), longest), dtype=torch.long)
+    for row, i in enumerate(batch):
+        ids = windows[i][1]
+        input_ids[row, :len(ids)] = torch.frombuffer(ids, dtype=torch.int32)
+        attention_mask[row, :len(ids)] = 1
+    return { 'input_ids': input_ids, 'attention_mask': attention_mask }
+
+
+def predict(windows, batch):
+    inputs = pad_batch(windows, batch, _tokenizer.pad_token_id)
+    with torch.no_grad():
+        logits = _model(**inputs).logits
+    return logits.argmax(dim=-1).tolist()
+
+
+def label_type(label):
+    """Return (tag, type) for BIO label, e.g. ('B', 'Protein')."""
+    if label == 'O' or '-' not in label:
+        return 'O', None
+    tag, type_ = label.split('-', 1)
+    return tag, type_
+
+
+def add_predictions(tokens, window, predictions):
+    """Add predictions for window to tokens, a dict mapping the (start,
+    end) offsets of each token to (distance from window edge, word ID,
+    prediction), keeping the prediction furthest from the edge."""
+    doc_index, input_ids, starts, ends, word_ids = window
+    positions = [p for p, w in enumerate(word_ids) if w >= 0]
+    if not positions:
+        return
+    first, last = positions[0], positions[-1]
+    for p in positions:
+        margin = min(p - first, last - p)
+        key = (starts[p], ends[p])
+        if key not in tokens or margin > tokens[key][0]:
+            tokens[key] = (margin, word_ids[p], predictions[p])
+
+
+def decode_entities(text, tokens):
+    """Return (start, end, type) spans from add_predictions() tokens.
+
+    Only the prediction for the first token of each word is used, and
+    entities are not continued across line breaks.
+    """
+    id2label = _model.config.id2label
+    entities, current, prev_word = [], None, None
+    for (start, end), (margin, word_id, pred) in sorted(tokens.items()):
+        if word_id < 0 or start == end:
+            continue    # special or empty token
+        if word_id == prev_word:
+            if current is not None:
+                current[1] = end    # continuation of word
+            continue
+        prev_word = word_id
+        tag, type_ = label_type(id2label[pred])
+        continues = (current is not None and tag == 'I' and
+                     type_ == current[2] and
+                     '\n' not in text[current[1]:start])
+        if continues:
+            current[1] = end
+            continue
+        if current is not None:
+            entities.append(tuple(current))
+            current = None
+        if tag != 'O':
+            current = [start, end, type_]
+    if current is not None:
+        entities.append(tuple(current))
+    return entities
+
+
+def to_standoff(text, entities):
+    lines = []
+    for t, (start, end, type_) in enumerate(sorted(set(entities)), start=1):
+        lines.append('T{}\t{} {} {}\t{}'.format(t, type_, start, end,
+                                               text[start:end]))
+    return '\n'.join(lines)
+
+
+def tag_chunk(task):
+    """Tag list of (key, text) given cached tokenizations, return list
+    of (key, standoff) and new cache entries."""
+    docs, cached = task
+    texts = [text for key, text in docs]
+    windows, entries = tokenize(texts, cached)
+    tokens = [{} for doc in docs]
+    for batch in make_batches(windows, _options.batch_tokens):
+        for i, predictions in zip(batch, predict(windows, batch)):
+            add_predictions(tokens[windows[i][0]], windows[i], predictions)
+    results = []
+    for (key, text), doc_tokens in zip(docs, tokens):
+        root = os.path.splitext(key)[0]
+        entities = decode_entities(text, doc_tokens)
+        results.append((root + _options.ann_suffix,
+                        to_standoff(text, entities)))
+    return results, entries
+
+
+def iter_chunks(items, options):
+    chunk, count = [], 0
+    for key, text in items:
+        if options.limit is not None and count >= options.limit:
+            break
+        chunk.append((key, text))
+        count += 1
+        if len(chunk) >= options.chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def cache_tasks(chunks, cache):
+    """Pair chunks of (key, text) with cached entries for the texts."""
+    for chunk in chunks:
+        if cache is None:
+            yield chunk, {}
+        else:
+            yield chunk, cache.lookup(text for key, text in chunk)
+
+
+def open_cache(options):
+    if options.cache is None:
+        return None
+    tokenizer = AutoTokenizer.from_pretrained(options.model)
+    return TokenCache(options.cache, tokenizer, options.max_length,
+                      options.stride)
+
+
+def tag_db(options):
+    # No close() as this is read-only and close() can block
+    in_db = open_db(options.input, flag='r')
+    items = docset_items(in_db, options.suffix, options.ids)
+    def count_expected():
+        count = count_docs(in_db, options.suffix, options.ids)
+        return count if options.limit is None else min(count, options.limit)
+    progress = make_progress(options, 'tagwithmodel', count_expected)
+    cache = open_cache(options)
+    count = 0
+    with open_db(options.output) as out_db:
+        with Pool(options.jobs, init_worker, (options,)) as pool:
+            tasks = cache_tasks(iter_chunks(items, options), cache)
+            for results, entries in bounded_imap(pool, tag_chunk, tasks,
+                                                 2 * options.jobs):
+                if cache is not None:
+                    cache.update(entries)
+                out_db.update(results)
+                out_db.commit()
+                count += len(results)
+                progress.update(docs=len(results), annotations=sum(
+                    ann.count('\n')+1 for key, ann in results if ann))
+    if cache is not None:
+        cache.close()
+    progress.finish()
+    return count
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    for path in (args.model, args.input):
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    if not 0 <= args.stride <= args.max_length // 2:
+        print('--stride must be between 0 and half of --max-length',
+              file=sys.stderr)
+        return 1
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    count = tag_db(args)
+    print('Done, tagged {} documents'.format(count), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,229 @@
+# Cache of tokenized texts keyed by tokenizer identity and text content.
+
+# Texts are tokenized into windows of at most max_length tokens (with
+# overflow into further windows overlapping by stride tokens) and each
+# window is represented as (input IDs, start offsets, end offsets, word
+# IDs) int32 arrays, with word ID -1 for special tokens. Cached windows
+# are stored in append-only segment files under DIR/<tokenizer ID>/
+# (also identifying max_length and stride), each holding the
+# windows of many documents as flat arrays, and are memory-mapped on
+# load so that no copies are made until batches are padded. An
+# SQLiteDict index maps the hash of each text to (segment, first window,
+# window count). Since the index is only written by the main process
+# after segments are complete, an interrupted run leaves at most unused
+# segments behind.
+
+import os
+import json
+import mmap
+import hashlib
+
+from array import array
+from collections import OrderedDict
+from uuid import uuid4
+from logging import error
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+INDEX_NAME = 'index.sqlite'
+
+SEGMENT_SUFFIX = '.seg'
+
+# Tokenizer state set per call that does not affect cached tokenization
+TRANSIENT_KEYS = ('truncation', 'padding')
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def tokenizer_id(tokenizer, max_length, stride=0):
+    """Return identifier for tokenizer configuration, window size and
+    window overlap."""
+    digest = hashlib.sha1()
+    digest.update(type(tokenizer).__name__.encode('utf-8'))
+    if getattr(tokenizer, 'is_fast', False):
+        config = json.loads(tokenizer.backend_tokenizer.to_str())
+        for key in TRANSIENT_KEYS:
+            config.pop(key, None)
+        digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    else:
+        digest.update(repr(sorted(tokenizer.get_vocab().items())).encode('utf-8'))
+        kwargs = sorted((k, str(v)) for k, v in tokenizer.init_kwargs.items())
+        digest.update(repr(kwargs).encode('utf-8'))
+    digest.update(str(max_length).encode('utf-8'))
+    if stride:
+        # Not included without overlap so that existing IDs are kept
+        digest.update('stride {}'.format(stride).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def tokenize_windows(tokenizer, texts, max_length, overflow=True,
+                     stride=0):
+    """Return list of windows for each text, consecutive windows sharing
+    stride tokens."""
+    encoded = tokenizer(
+        texts,
+        truncation=True,
+        max_length=max_length,
+        stride=stride if overflow else 0,
+        return_overflowing_tokens=overflow,
+        return_offsets_mapping=True,
+    )
+    if overflow:
+        doc_indices = encoded['overflow_to_sample_mapping']
+    else:
+        doc_indices = range(len(texts))
+    windows = [[] for text in texts]
+    for i, doc_index in enumerate(doc_indices):
+        offsets = encoded['offset_mapping'][i]
+        word_ids = encoded.word_ids(i)
+        windows[doc_index].append((
+            array('i', encoded['input_ids'][i]),
+            array('i', (s for s, e in offsets)),
+            array('i', (e for s, e in offsets)),
+            array('i', (-1 if w is None else w for w in word_ids)),
+        ))
+    return windows
+
+
+def encode_segment(windows):
+    """Return bytes for segment with windows of list of documents.
+
+    Layout: int64 token and window counts, int64 token offsets of
+    windows (count+1), then int32 input IDs, starts, ends and word IDs.
+    """
+    flat = [w for doc_windows in windows for w in doc_windows]
+    bounds = array('q', [0])
+    arrays = [array('i') for i in range(4)]
+    for window in flat:
+        for a, values in zip(arrays, window):
+            a.extend(values)
+        bounds.append(len(arrays[0]))
+    header = array('q', [len(arrays[0]), len(flat)])
+    return b''.join([header.tobytes(), bounds.tobytes()] +
+                    [a.tobytes() for a in arrays])
+
+
+class Segment(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # Copy-on-write mapping gives writable buffers for torch
+            self.mmap = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+        view = memoryview(self.mmap)
+        tokens, windows = view[:16].cast('q')
+        pos = 16
+        self.bounds = view[pos:pos+8*(windows+1)].cast('q')
+        pos += 8*(windows+1)
+        self.arrays = []
+        for i in range(4):
+            self.arrays.append(view[pos:pos+4*tokens].cast('i'))
+            pos += 4*tokens
+
+    def windows(self, first, count):
+        windows = []
+        for w in range(first, first+count):
+            start, end = self.bounds[w], self.bounds[w+1]
+            windows.append(tuple(a[start:end] for a in self.arrays))
+        return windows
+
+
+class TokenCache(object):
+    """Tokenization cache in directory for given tokenizer.
+
+    The main process looks up cached entries with lookup() and records
+    new ones with update(), worker processes get windows with
+    tokenize().
+    """
+
+    def __init__(self, directory, tokenizer, max_length, stride=0,
+                 max_open=64):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.stride = stride
+        self.directory = os.path.join(directory, tokenizer_id(
+            tokenizer, max_length, stride))
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_open = max_open
+        self.segments = OrderedDict()
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            path = os.path.join(self.directory, INDEX_NAME)
+            self._index = SqliteDict(path, autocommit=False)
+        return self._index
+
+    def lookup(self, texts):
+        """Return cached entries for texts by text hash."""
+        entries = {}
+        for text in texts:
+            h = text_hash(text)
+            if h not in entries:
+                entry = self.index.get(h)
+                if entry is not None:
+                    entries[h] = entry
+        return entries
+
+    def update(self, entries):
+        if entries:
+            self.index.update(entries)
+            self.index.commit()
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def segment(self, name):
+        if name in self.segments:
+            self.segments.move_to_end(name)
+        else:
+            path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+            self.segments[name] = Segment(path)
+            if len(self.segments) > self.max_open:
+                self.segments.popitem(last=False)
+        return self.segments[name]
+
+    def write_segment(self, windows):
+        name = uuid4().hex
+        path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        with open(path + '.tmp', 'wb') as out:
+            out.write(encode_segment(windows))
+        os.replace(path + '.tmp', path)
+        return name
+
+    def tokenize(self, texts, cached):
+        """Return (list of windows for each text, new cache entries).
+
+        Texts with entries in cached are loaded from the cache, others
+        are tokenized and written to a new segment.
+        """
+        hashes = [text_hash(text) for text in texts]
+        missing = OrderedDict()
+        for i, h in enumerate(hashes):
+            if h not in cached:
+                missing.setdefault(h, i)
+        entries = {}
+        if missing:
+            indices = list(missing.values())
+            windows = tokenize_windows(self.tokenizer,
+                                       [texts[i] for i in indices],
+                                       self.max_length, stride=self.stride)
+            name = self.write_segment(windows)
+            first = 0
+            for h, doc_windows in zip(missing, windows):
+                entries[h] = (name, first, len(doc_windows))
+                first += len(doc_windows)
+        windows = []
+        for h in hashes:
+            name, first, count = cached[h] if h in cached else entries[h]
+            windows.append(self.segment(name).windows(first, count))
+        return windows, entries
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# Score texts in SQLiteDict DB with transformers sequence classification
+# (triage) model and select documents for further processing.
+
+# Writes a score table (DOC-ID<TAB>SCORE, where SCORE is the predicted
+# probability of the --positive label) and the IDs of documents scoring
+# at least --threshold, one per line, as read by --ids. Texts are
+# truncated to --max-length tokens and scored in length-sorted batches
+# by a pool of worker processes that each load the model once. With
+# --cache, tokenizations are shared with tagwithmodel.py runs using the
+# same tokenizer and --max-length (see tokencache.py).
+
+import sys
+import os
+
+from multiprocessing import Pool
+from logging import error
+
+from docset import read_docset, docset_items, count_docs, write_docset
+from progress import add_progress_arguments, make_progress
+from tagwithmodel import iter_chunks, make_batches, pad_batch
+from tagwithmodel import cache_tasks, open_cache
+from parallel import bounded_imap
+from tokencache import TokenCache, tokenize_windows
+from dbcodec import open_db
+
+try:
+    import torch
+    from transformers import AutoConfig, AutoTokenizer
+    from transformers import AutoModelForSequenceClassification
+except ImportError:
+    error('failed to import transformers, try `pip3 install torch transformers`')
+    raise
+
+
+# Model, tokenizer and cache loaded by each worker process
+_model, _tokenizer, _cache, _options = None, None, None, None
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Score and select texts with triage model.')
+    ap.add_argument('-b', '--batch-tokens', metavar='N', type=int,
+                    default=16384, help='maximum padded tokens per batch')
+    ap.add_argument('-c', '--chunk-size', metavar='N', type=int, default=5000,
+                    help='documents per worker task')
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=4,
+                    help='number of worker processes')
+    ap.add_argument('-l', '--limit', metavar='N', type=int, default=None,
+                    help='only score first N documents')
+    ap.add_argument('-m', '--max-length', metavar='N', type=int, default=512,
+                    help='maximum tokens per text')
+    ap.add_argument('-p', '--positive', metavar='LABEL', default=None,
+                    help='label to score (default last label)')
+    ap.add_argument('-s', '--suffix', default='.txt', help='text key suffix')
+    ap.add_argument('-t', '--threads', metavar='N', type=int, default=1,
+                    help='torch threads per worker process')
+    ap.add_argument('-T', '--threshold', metavar='SCORE', type=float,
+                    default=0.5, help='minimum score for selection')
+    ap.add_argument('--cache', metavar='DIR', default=None,
+                    help='cache tokenizations in DIR')
+    ap.add_argument('--ids', metavar='FILE', default=None,
+                    help='only score documents with IDs in FILE')
+    ap.add_argument('model', metavar='MODEL', help='model directory')
+    ap.add_argument('input', metavar='DB', help='DB with texts')
+    ap.add_argument('scores', metavar='TSV', help='output score table')
+    ap.add_argument('selected', metavar='IDS', help='output selected IDs')
+    add_progress_arguments(ap)
+    return ap
+
+
+def init_worker(options):
+    global _model, _tokenizer, _cache, _options
+    torch.set_num_threads(options.threads)
+    _tokenizer = AutoTokenizer.from_pretrained(options.model)
+    _model = AutoModelForSequenceClassification.from_pretrained(options.model)
+    _model.eval()
+    if options.cache is not None:
+        _cache = TokenCache(options.cache, _tokenizer, options.max_length)
+    _options = options
+
+
+def positive_index(config, label):
+    if label is None:
+        return config.num_labels - 1
+    if label not in config.label2id:
+        raise ValueError('no label {} in {}'.format(label, config.label2id))
+    return config.label2id[label]
+
+
+def score_chunk(task):
+    """Score list of (key, text) given cached tokenizations, return list
+    of (doc ID, score) and new cache entries."""
+    docs, cached = task
+    texts = [text for key, text in docs]
+    if _cache is not None:
+        doc_windows, entries = _cache.tokenize(texts, cached)
+    else:
+        doc_windows = tokenize_windows(_tokenizer, texts, _options.max_length,
+                                       overflow=False)
+        entries = {}
+    # Texts are scored on their first (truncated) window
+    items = [(i, windows[0][0]) for i, windows in enumerate(doc_windows)]
+    positive = positive_index(_model.config, _options.positive)
+    scores = [None] * len(docs)
+    for batch in make_batches(items, _options.batch_tokens):
+        inputs = pad_batch(items, batch, _tokenizer.pad_token_id)
+        with torch.no_grad():
+            probs = _model(**inputs).logits.softmax(dim=-1)
+        for i, p in zip(batch, probs[:, positive].tolist()):
+            scores[i] = p
+    return [
+        (os.path.splitext(key)[0], score)
+        for (key, text), score in zip(docs, scores)
+    ], entries
+
+
+def triage_db(options):
+    # No close() as this is read-only and close() can block
+    db = open_db(options.input, flag='r')
+    items = docset_items(db, options.suffix, options.ids)
+    def count_expected():
+        count = count_docs(db, options.suffix, options.ids)
+        return count if options.limit is None else min(count, options.limit)
+    progress = make_progress(options, 'triagedocs', count_expected)
+    cache = open_cache(options)
+    count, selected = 0, []
+    with open(options.scores, 'w') as out:
+        with Pool(options.jobs, init_worker, (options,)) as pool:
+            tasks = cache_tasks(iter_chunks(items, options), cache)
+            for results, entries in bounded_imap(pool, score_chunk, tasks,
+                                                 2 * options.jobs):
+                if cache is not None:
+                    cache.update(entries)
+                for doc_id, score in results:
+                    print('{}\t{:.6f}'.format(doc_id, score), file=out)
+                    if score >= options.threshold:
+                        selected.append(doc_id)
+                count += len(results)
+                progress.update(docs=len(results))
+    if cache is not None:
+        cache.close()
+    write_docset(options.selected, selected)
+    progress.finish()
+    return count, len(selected)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    for path in (args.model, args.input):
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    try:
+        positive_index(AutoConfig.from_pretrained(args.model), args.positive)
+    except ValueError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    if args.ids is not None:
+        args.ids = read_docset(args.ids)
+    count, selected = triage_db(args)
+    print('Done, scored {} documents, selected {}'.format(count, selected),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,151 @@
+# Mapping of annotation types to common types and filtering to targets.
+
+# The type map (config/type_map.tsv, SOURCE<TAB>TARGET per line) maps
+# the types of the annotation sources (e.g. EVEX 'ggp', PubTator
+# 'Species', tagger type IDs) to common types, and the target types are
+# the types in the first column of config/consensus_types.tsv (tagger
+# type IDs, also used for tagging) after mapping. Annotation DBs written
+# by materializeannotations.py contain only target type annotations
+# with mapped types and record the mapping in their metadata (see
+# dbcodec.py), so that readers can skip mapping and filtering.
+
+import os
+import sys
+
+from dbcodec import TABLENAME, read_meta
+
+
+CONFIGDIR = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'config'))
+
+DEFAULT_TYPE_MAP = os.path.join(CONFIGDIR, 'type_map.tsv')
+
+DEFAULT_TARGET_TYPES = os.path.join(CONFIGDIR, 'consensus_types.tsv')
+
+# Key of type mapping in DB metadata
+META_KEY = 'types'
+
+
+def add_type_arguments(ap, targets=True):
+    ap.add_argument('--type-map', metavar='FILE', default=DEFAULT_TYPE_MAP,
+                    help='annotation type map (default config/type_map.tsv)')
+    if targets:
+        ap.add_argument('--types', metavar='FILE',
+                        default=DEFAULT_TARGET_TYPES,
+                        help='target types (default '
+                        'config/consensus_types.tsv)')
+
+
+def read_tsv_columns(path, min_columns):
+    with open(path) as f:
+        for ln, l in enumerate(f, start=1):
+            l = l.rstrip('\n')
+            if not l or l.isspace():
+                continue
+            fields = l.split('\t')
+            if len(fields) < min_columns:
+                raise ValueError('line {} in {}: expected {} columns: {}'.\
+                                 format(ln, path, min_columns, l))
+            yield fields
+
+
+class TypeMapping(object):
+    """Annotation type map and set of target (mapped) types, None for
+    no filtering."""
+
+    def __init__(self, type_map, targets=None):
+        self.type_map = dict(type_map)
+        self.targets = set(targets) if targets is not None else None
+
+    def map_type(self, type_):
+        return self.type_map.get(type_, type_)
+
+    def is_target(self, type_):
+        return self.targets is None or self.map_type(type_) in self.targets
+
+    def apply(self, textbounds):
+        """Map types of textbounds, return those of target types."""
+        for t in textbounds:
+            t.type = self.map_type(t.type)
+        return [t for t in textbounds if self.is_target(t.type)]
+
+    def to_meta(self):
+        return {
+            'map': dict(sorted(self.type_map.items())),
+            'targets': (sorted(self.targets) if self.targets is not None
+                        else None),
+        }
+
+    @classmethod
+    def from_meta(cls, meta):
+        return cls(meta['map'], meta['targets'])
+
+    def __eq__(self, other):
+        if not isinstance(other, TypeMapping):
+            return NotImplemented
+        return (self.type_map, self.targets) == (other.type_map,
+                                                 other.targets)
+
+    @classmethod
+    def from_files(cls, map_path, types_path=None):
+        type_map = {
+            fields[0]: fields[1] for fields in read_tsv_columns(map_path, 2)
+        }
+        print('read {} type mappings from {}'.format(len(type_map), map_path),
+              file=sys.stderr)
+        if types_path is None:
+            return cls(type_map)
+        targets = set(
+            type_map.get(fields[0], fields[0])
+            for fields in read_tsv_columns(types_path, 1)
+        )
+        print('read {} target types from {}: {}'.format(
+            len(targets), types_path, ' '.join(sorted(targets))),
+              file=sys.stderr)
+        return cls(type_map, targets)
+
+
+def make_type_mapping(options):
+    """Return TypeMapping for add_type_arguments() options."""
+    return TypeMapping.from_files(options.type_map,
+                                  getattr(options, 'types', None))
+
+
+def read_type_mapping(path, tablename=TABLENAME):
+    """Return TypeMapping the DB was materialized with, None if none."""
+    meta = read_meta(path, tablename)
+    if meta is None or META_KEY not in meta:
+        return None
+    return TypeMapping.from_meta(meta[META_KEY])
+
+
+def filter_standoff(ann, mapping):
+    """Return standoff with only textbounds of target types, with mapped
+    types, and the normalizations and notes attached to them.
+
+    Returns an empty string if no textbounds are kept.
+    """
+    lines = ann.splitlines()
+    kept, out = set(), []
+    for l in lines:
+        if l.startswith('T'):
+            id_, type_span, text = l.split('\t')
+            type_, span = type_span.split(' ', 1)
+            if mapping.is_target(type_):
+                kept.add(id_)
+    if not kept:
+        return ''
+    for l in lines:
+        if l.startswith('T'):
+            id_, type_span, text = l.split('\t')
+            type_, span = type_span.split(' ', 1)
+            if id_ in kept:
+                out.append('{}\t{} {}\t{}'.format(id_, mapping.map_type(type_),
+                                                  span, text))
+        elif l.startswith('N') or l.startswith('#'):
+            # Reference or AnnotatorNotes, second field "TYPE ID ..."
+            fields = l.split('\t')
+            refs = fields[1].split(' ') if len(fields) > 1 else []
+            if len(refs) > 1 and refs[1] in kept:
+                out.append(l)
+    return '\n'.join(out)
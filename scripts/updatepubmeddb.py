@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Apply PubMed update packages to existing DB of PubMed texts.
+
+import sys
+import os
+
+from datetime import datetime
+from logging import error
+
+from pubmedxml import iter_package, UPSERT, DELETE
+from docset import write_docset
+from dbcodec import open_db
+
+try:
+    from sqlitedict import SqliteDict
+except ImportError:
+    error('failed to import sqlitedict, try `pip3 install sqlitedict`')
+    raise
+
+
+# Table recording applied update packages
+PACKAGE_TABLE = 'applied_packages'
+
+
+def argparser():
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Apply PubMed updates to SQLiteDict DB.')
+    ap.add_argument('-c', '--changed', metavar='FILE', default=None,
+                    help='add IDs of changed documents to FILE')
+    ap.add_argument('-f', '--force', default=False, action='store_true',
+                    help='reapply packages that have already been applied')
+    ap.add_argument('-s', '--suffix', default='.txt', help='text key suffix')
+    ap.add_argument('db', metavar='DB', help='database to update')
+    ap.add_argument('packages', metavar='XML', nargs='+',
+                    help='PubMed update packages (.xml.gz)')
+    return ap
+
+
+def package_name(path):
+    return os.path.basename(path)
+
+
+def apply_package(path, db, changed, options):
+    upserted, deleted = 0, 0
+    for action, pmid, text in iter_package(path):
+        key = pmid + options.suffix
+        if action == UPSERT:
+            db[key] = text
+            upserted += 1
+        else:
+            assert action == DELETE
+            if key in db:
+                del db[key]
+            deleted += 1
+        changed.add(pmid)
+    db.commit()
+    return upserted, deleted
+
+
+def apply_packages(dbpath, packages, options):
+    changed = set()
+    applied = SqliteDict(dbpath, tablename=PACKAGE_TABLE, autocommit=False)
+    with open_db(dbpath) as db:
+        # Packages must be applied in order; names sort by sequence number.
+        for path in sorted(packages, key=package_name):
+            name = package_name(path)
+            if name in applied and not options.force:
+                print('{} already applied, skipping'.format(name),
+                      file=sys.stderr)
+                continue
+            upserted, deleted = apply_package(path, db, changed, options)
+            # Recorded after documents are committed; reapplying a package
+            # after an interrupted run is idempotent.
+            applied[name] = {
+                'applied': datetime.now().isoformat(),
+                'upserted': upserted,
+                'deleted': deleted,
+            }
+            applied.commit()
+            print('Applied {}: {} upserted, {} deleted'.format(
+                name, upserted, deleted), file=sys.stderr)
+    applied.close()
+    return changed
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if not os.path.exists(args.db):
+        print('no such file: {}'.format(args.db), file=sys.stderr)
+        return 1
+    for path in args.packages:
+        if not os.path.exists(path):
+            print('no such file: {}'.format(path), file=sys.stderr)
+            return 1
+    changed = apply_packages(args.db, args.packages, args)
+    if args.changed is not None:
+        # Merge with IDs changed in earlier runs that have not yet been
+        # processed by downstream stages.
+        write_docset(args.changed, changed, merge=True)
+    print('Done, {} documents changed'.format(len(changed)), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))